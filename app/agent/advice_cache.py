@@ -0,0 +1,92 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from app.cache import ResultCache, make_key
+
+
+# --- Configuration (env vars) ---
+ADVICE_CACHE_ENABLED = os.getenv("HMEQ_ADVICE_CACHE", "1") == "1"
+# Precision used to normalize requests; requests equal after rounding share one LLM answer
+ADVICE_PROBA_DECIMALS = int(os.getenv("HMEQ_ADVICE_PROBA_DECIMALS", "2"))
+ADVICE_WEIGHT_DECIMALS = int(os.getenv("HMEQ_ADVICE_WEIGHT_DECIMALS", "2"))
+ADVICE_CACHE_MAX_BYTES = int(os.getenv("HMEQ_ADVICE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+ADVICE_CACHE_TTL_SECONDS = float(os.getenv("HMEQ_ADVICE_CACHE_TTL_SECONDS", "86400"))
+
+
+def normalize_advice_input(
+    default_probability: float,
+    lime_explanations: Sequence[Tuple[str, float]],
+    proba_decimals: int = ADVICE_PROBA_DECIMALS,
+    weight_decimals: int = ADVICE_WEIGHT_DECIMALS,
+) -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Round the probability and the weights, and sort the conditions by decreasing absolute weight
+    (ties by condition), so effectively identical requests produce the same prompt and cache key.
+    """
+    explanations = [
+        (str(condition).strip(), round(float(weight), weight_decimals) + 0.0)  # + 0.0 drops -0.0
+        for condition, weight in lime_explanations
+    ]
+    explanations.sort(key=lambda item: (-abs(item[1]), item[0]))
+    return round(float(default_probability), proba_decimals) + 0.0, explanations
+
+
+class AdviceCache:
+    """
+    Response cache for the advice agent with single-flight coalescing: concurrent calls with the same
+    key share one upstream call, and its result is cached (LRU + TTL) for later calls.
+    Only touched from the event loop thread, so no lock is needed.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = ADVICE_CACHE_MAX_BYTES,
+        ttl_seconds: float = ADVICE_CACHE_TTL_SECONDS,
+        enabled: bool = ADVICE_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.cache = ResultCache("advice", max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        # Metrics
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(model_name: str, default_probability: float, lime_explanations: list) -> str:
+        return make_key("advice", model_name, default_probability, lime_explanations)
+
+    async def get_or_run(self, key: str, run: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached result for `key`, join the in-flight call for it, or start `run()`."""
+        if not self.enabled:
+            self.upstream_calls += 1
+            return await run()
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.upstream_calls += 1
+            task = asyncio.get_running_loop().create_task(run())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._on_done(key, done))
+        # Shielded, so a caller that goes away does not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.cache.set(key, task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters plus upstream and coalesced call counts since startup."""
+        return {
+            **self.cache.stats(),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
@@ -1,20 +1,18 @@
 from ast import List
 from pydantic_ai import Agent, capture_run_messages
-from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.exceptions import UnexpectedModelBehavior
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+import pydantic_core
 from pydantic import BaseModel, Field, model_validator, ValidationError
 
-from langgraph.graph import StateGraph, START, END
-
 from app.agent.prompts import LIME_PROMPT
+from app.agent.advice_cache import AdviceCache, normalize_advice_input
+from app.metrics import stage
 
-from dotenv import load_dotenv
 import os
-from typing import TypedDict, Tuple, List
+from typing import Callable, Dict, Optional, TypedDict, Tuple, List
 import asyncio
 
-load_dotenv()
-
 
 # 0.5 --- Define Prompt (other module)
 # 1 --- Define structured output (not fully necessary here)
@@ -24,13 +22,27 @@ class LimeAgentOutput(BaseModel):
 
 
 # 2 --- Initialize the agent
+AGENT_MODEL_NAME = "gpt-4.1-mini"
+# The OpenAI client is created by `init_lime_agent` (or on the first run), not at import:
+# importing openai and reading .env cost most of this module's import time
 lime_agent = Agent(
-    model=OpenAIModel(model_name="gpt-4.1-mini"),
+    model=f"openai:{AGENT_MODEL_NAME}",
     output_type=LimeAgentOutput,
     system_prompt=LIME_PROMPT,
+    defer_model_check=True,
 )
 
 
+def init_lime_agent():
+    """Load .env and create the agent's OpenAI client. Called once at startup, by `create_graph`."""
+    from dotenv import load_dotenv
+    from pydantic_ai.models.openai import OpenAIModel
+
+    load_dotenv()
+    if not isinstance(lime_agent.model, OpenAIModel):
+        lime_agent.model = OpenAIModel(model_name=AGENT_MODEL_NAME)
+
+
 # 3 --- Managed with LangGraph
 class LimeGraphMessage(TypedDict):
     default_probability: float
@@ -39,16 +51,98 @@ class LimeGraphMessage(TypedDict):
     agent_response_advice: str
 
 
+# Responses for (normalized) inputs seen before, shared by concurrent identical requests
+ADVICE_CACHE = AdviceCache()
+# Seconds to group streamed tokens by before re-validating the partial output (None = every token)
+STREAM_DEBOUNCE = float(os.getenv("HMEQ_ADVICE_STREAM_DEBOUNCE", "0.05")) or None
+
+# Output field -> key of the streamed deltas (same names as the /agent/advice response)
+STREAMED_FIELDS = {
+    "lime_interpretation": "agent_interpretation",
+    "financial_advice": "financial_advice",
+}
+
+
+def _partial_output_fields(message: ModelResponse) -> dict:
+    """
+    Fields of the structured output generated so far, parsed leniently from the (incomplete) output
+    tool call arguments, so the first field streams before the second one starts.
+    """
+    for part in message.parts:
+        if isinstance(part, ToolCallPart) and part.args:
+            if isinstance(part.args, dict):
+                return part.args
+            try:
+                fields = pydantic_core.from_json(part.args, allow_partial="trailing-strings")
+            except ValueError:
+                return {}
+            return fields if isinstance(fields, dict) else {}
+    return {}
+
+
+def _delta_emitter(writer: Callable[[dict], None]) -> Callable[[dict], None]:
+    """
+    Callback for partial output fields that writes only the text added to each field since the last call,
+    as {"field": str, "delta": str} chunks on the graph's "custom" stream.
+    """
+    emitted: Dict[str, str] = {field: "" for field in STREAMED_FIELDS}
+
+    def emit(partial_fields: dict):
+        for field, stream_key in STREAMED_FIELDS.items():
+            text = partial_fields.get(field)
+            if not isinstance(text, str):
+                continue
+            if len(text) > len(emitted[field]) and text.startswith(emitted[field]):
+                writer({"field": stream_key, "delta": text[len(emitted[field]) :]})
+                emitted[field] = text
+
+    return emit
+
+
 # 4 --- Define the graph
 async def agent_node(message: LimeGraphMessage) -> dict:
+    from langgraph.config import get_stream_writer
+
+    default_probability, lime_explanations = normalize_advice_input(
+        message["default_probability"], message["lime_explanations"]
+    )
+    key = ADVICE_CACHE.key(AGENT_MODEL_NAME, default_probability, lime_explanations)
+    # No-op unless the graph runs with stream_mode="custom" (see /agent/advice/stream)
+    emit = _delta_emitter(get_stream_writer())
+    result = await ADVICE_CACHE.get_or_run(
+        key, lambda: run_lime_agent(default_probability, lime_explanations, emit)
+    )
+    # Cache hits and coalesced requests did not stream: send whatever is missing in one chunk
+    emit(
+        {
+            "lime_interpretation": result["agent_response_lime"],
+            "financial_advice": result["agent_response_advice"],
+        }
+    )
+    return result
+
+
+async def run_lime_agent(
+    default_probability: float,
+    lime_explanations: List[Tuple[str, float]],
+    on_partial_output: Optional[Callable[[dict], None]] = None,
+) -> dict:
+    """
+    Call the LLM for one (normalized) request, streaming the structured output.
+    `on_partial_output` is called with the LimeAgentOutput fields generated so far as tokens arrive.
+    """
     full_query = f"""
-    Loan default probability: {message["default_probability"]}
-    Lime explanations: {message["lime_explanations"]}
+    Loan default probability: {default_probability}
+    Lime explanations: {lime_explanations}
     """
     with capture_run_messages() as messages:
         try:
-            response = await lime_agent.run(full_query)
-            agent_output: LimeAgentOutput = response.output
+            with stage("llm"):
+                async with lime_agent.run_stream(full_query) as response:
+                    async for message, _ in response.stream_structured(debounce_by=STREAM_DEBOUNCE):
+                        if on_partial_output is not None:
+                            on_partial_output(_partial_output_fields(message))
+                    agent_output: LimeAgentOutput = await response.get_output()
 
             return {
                 "agent_response_lime": agent_output.lime_interpretation,
@@ -65,8 +159,12 @@ async def agent_node(message: LimeGraphMessage) -> dict:
 def create_graph():
     """
     Create the state graph for the agent.
+    langgraph is imported here rather than at module level, as it is the slowest import of the app.
     """
+    from langgraph.graph import StateGraph, START, END
+
     print("Creating graph")
+    init_lime_agent()
     graph = StateGraph(LimeGraphMessage)
 
     # Add nodes to the graph
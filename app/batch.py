@@ -0,0 +1,89 @@
+import io
+import json
+from typing import Iterator, List, Sequence
+
+import pandas as pd
+from pydantic import TypeAdapter, ValidationError
+
+from app.schemas import LoanApplicationRequest
+
+
+BATCH_CHUNK_SIZE = 2048  # rows per preprocessor.transform + predict_proba call
+BATCH_MAX_ROWS = 1_000_000
+EXPLAIN_CHUNK_SIZE = 32  # instances per LIME task (perturbation samples scored in one predict_proba call)
+EXPLAIN_MAX_INSTANCES = 10_000  # instances per /explain_batch request
+
+_applications_adapter = TypeAdapter(List[LoanApplicationRequest])
+
+
+def _records_to_df(records: list, feature_names: Sequence[str]) -> pd.DataFrame:
+    """Validate the records against LoanApplicationRequest and build the DataFrame the pipelines expect."""
+    applications = _applications_adapter.validate_python(records)
+    return pd.DataFrame(
+        data=[application.model_dump() for application in applications],
+        columns=feature_names,
+    )
+
+
+def parse_batch_body(
+    body: bytes, content_type: str, feature_names: Sequence[str]
+) -> pd.DataFrame:
+    """
+    Parse a batch of loan applications into a DataFrame with the original feature columns.
+
+    Args:
+        body: bytes
+            The raw request body.
+        content_type: str
+            "application/json" (array of applications), "application/x-ndjson" (one application per line)
+            or "text/csv" (header row with the feature names).
+        feature_names: Sequence[str]
+            The original feature names, in the order the pipelines expect.
+    Returns:
+        A DataFrame with one row per application.
+    Raises:
+        ValueError: if the body cannot be parsed or an application is invalid.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    try:
+        if media_type in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+            records = [json.loads(line) for line in body.splitlines() if line.strip()]
+        elif media_type in ("text/csv", "application/csv"):
+            csv_df = pd.read_csv(io.BytesIO(body))
+            missing = [name for name in feature_names if name not in csv_df.columns]
+            if missing:
+                raise ValueError(f"CSV is missing columns: {missing}")
+            records = csv_df[list(feature_names)].to_dict(orient="records")
+        else:  # default to a JSON array
+            records = json.loads(body)
+            if not isinstance(records, list):
+                raise ValueError("Expected a JSON array of loan applications.")
+    except (json.JSONDecodeError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise ValueError(f"Could not parse {media_type or 'request'} body: {e}")
+
+    if not records:
+        raise ValueError("The batch is empty.")
+    if len(records) > BATCH_MAX_ROWS:
+        raise ValueError(f"The batch has {len(records)} rows, the maximum is {BATCH_MAX_ROWS}.")
+
+    try:
+        return _records_to_df(records, feature_names)
+    except ValidationError as e:
+        first_error = e.errors()[0]
+        raise ValueError(
+            f"Invalid application at {list(first_error['loc'])}: {first_error['msg']}"
+        )
+
+
+def iter_chunks(df: pd.DataFrame, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Yield consecutive row chunks of `df`."""
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start : start + chunk_size]
+
+
+def format_predictions_ndjson(start: int, probas) -> str:
+    """Format the default probabilities of one chunk as NDJSON lines ({"index", "probability_of_default"})."""
+    return "".join(
+        json.dumps({"index": start + i, "probability_of_default": float(p)}) + "\n"
+        for i, p in enumerate(probas)
+    )
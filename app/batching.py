@@ -0,0 +1,128 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from app.executors import BoundedExecutor
+from app.fast_preprocess import to_pipeline_input
+
+
+# --- Configuration (env vars) ---
+# Opt-in: coalesce concurrent /predict calls for the same pipeline into one predict_proba call
+MICROBATCH_ENABLED = os.getenv("HMEQ_MICROBATCH", "0") == "1"
+MICROBATCH_WINDOW_MS = float(os.getenv("HMEQ_MICROBATCH_WINDOW_MS", "2"))
+MICROBATCH_MAX_ROWS = int(os.getenv("HMEQ_MICROBATCH_MAX_ROWS", "256"))
+
+
+class MicroBatcher:
+    """
+    Dynamic batcher for single-row predictions of one pipeline.
+    The first request of a batch opens a window of `window_ms`; every request arriving within it
+    (up to `max_rows`) is scored in the same predict_proba call, and each caller gets its own row back.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        executor: BoundedExecutor,
+        columns: Sequence[str],
+        window_ms: float = MICROBATCH_WINDOW_MS,
+        max_rows: int = MICROBATCH_MAX_ROWS,
+    ):
+        self.pipeline = pipeline
+        self.executor = executor
+        self.columns = list(columns)
+        self.window = window_ms / 1000.0
+        self.max_rows = max_rows
+        self._pending: List[tuple] = []  # (row, future, enqueue time)
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Batches in flight: the event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        # Metrics
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_size = 0
+        self.batch_size_counts: Dict[int, int] = {}
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+
+    async def predict_proba(self, row: Dict[str, Any]) -> np.ndarray:
+        """
+        Queue one application (a dict of the original features) and wait for its probabilities.
+
+        Returns:
+            np.ndarray of shape (n_classes,)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_rows:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[tuple]):
+        started = time.perf_counter()
+        self._record(len(batch), [started - enqueued for _, _, enqueued in batch])
+        input_data = to_pipeline_input(
+            self.pipeline, [row for row, _, _ in batch], self.columns
+        )
+        try:
+            probas = await self.executor.run(self.pipeline.predict_proba, input_data)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (_, future, _) in enumerate(batch):
+            if not future.done():  # the caller may have gone away
+                future.set_result(probas[i])
+
+    def _record(self, batch_size: int, queue_delays: List[float]):
+        self.batches += 1
+        self.rows += batch_size
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.batch_size_counts[batch_size] = self.batch_size_counts.get(batch_size, 0) + 1
+        self.total_queue_delay += sum(queue_delays)
+        self.max_queue_delay = max(self.max_queue_delay, max(queue_delays))
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch size and queueing delay metrics since startup."""
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "mean_queue_delay_ms": 1000 * self.total_queue_delay / self.rows if self.rows else 0.0,
+            "max_queue_delay_ms": 1000 * self.max_queue_delay,
+        }
+
+
+def get_batcher(
+    batchers: Dict[str, MicroBatcher],
+    name: str,
+    pipeline,
+    executor: BoundedExecutor,
+    columns: Sequence[str],
+) -> Optional[MicroBatcher]:
+    """The MicroBatcher of a pipeline (created on first use), or None if micro-batching is disabled."""
+    if not MICROBATCH_ENABLED:
+        return None
+    if name not in batchers:
+        batchers[name] = MicroBatcher(pipeline, executor, columns)
+    return batchers[name]
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import pickle
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+# --- Configuration (env vars) ---
+CACHE_ENABLED = os.getenv("HMEQ_CACHE", "1") == "1"
+CACHE_MAX_BYTES = int(os.getenv("HMEQ_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("HMEQ_CACHE_TTL_SECONDS", "3600"))
+# Directory for on-disk persistence across restarts (disabled if empty)
+CACHE_DIR = os.getenv("HMEQ_CACHE_DIR", "")
+
+_MISSING = object()
+
+
+def artifact_hash(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a pipeline artifact, so cached results are invalidated when the model changes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_key(*parts: Any) -> str:
+    """
+    Content-addressed cache key: SHA-256 of the canonical JSON of `parts`
+    (dicts with sorted keys, no whitespace), so equal payloads map to the same key.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache with a TTL and a limit on the total (pickled) size of the values.
+    Only touched from the event loop thread, so no lock is needed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int = CACHE_MAX_BYTES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        persist_path: Optional[str] = None,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, expires at)
+        self.size_bytes = 0
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        value, _, expires_at = entry
+        if expires_at < time.time():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, time.time() + self.ttl)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size since startup."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def load(self):
+        """Load the entries persisted by `save`, dropping the expired ones."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "rb") as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f"WARNING:  Could not load the {self.name} cache from {self.persist_path}: {e}")
+            return
+        now = time.time()
+        for key, (value, size, expires_at) in entries.items():
+            if expires_at >= now and self.size_bytes + size <= self.max_bytes:
+                self._entries[key] = (value, size, expires_at)
+                self.size_bytes += size
+
+    def save(self):
+        """Persist the entries to `persist_path` (written to a temporary file, then renamed)."""
+        if not self.persist_path:
+            return
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.persist_path)
+
+
+def create_caches(*names: str) -> Dict[str, ResultCache]:
+    """One ResultCache per name (restored from HMEQ_CACHE_DIR if set), or none if caching is disabled."""
+    if not CACHE_ENABLED:
+        return {}
+    if CACHE_DIR:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+    caches = {}
+    for name in names:
+        persist_path = os.path.join(CACHE_DIR, f"cache_{name}.pkl") if CACHE_DIR else None
+        caches[name] = ResultCache(name, persist_path=persist_path)
+        caches[name].load()
+    return caches
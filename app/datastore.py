@@ -0,0 +1,96 @@
+import functools
+import json
+import os
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from app.cache import artifact_hash
+
+
+PATH_ASSETS = "/home/oreo/hmeq/app/assets"
+PATH_DATA_PROCESSED = "/home/oreo/hmeq/app/assets/data/processed"
+# Reference datasets served from the binary store (see `convert_processed_datasets`)
+PROCESSED_DATASETS = ["X_train", "X_test"]
+
+
+def _feature_processed_names() -> List[str]:
+    with open(os.path.join(PATH_ASSETS, "feature_preprocessed_names.json"), "r") as f:
+        return json.load(f)
+
+
+def convert_processed_dataset(name: str, path: str = PATH_DATA_PROCESSED) -> str:
+    """
+    Convert `{name}.csv` to `{name}.npy` (float64, C order) plus a `{name}.columns.json` sidecar
+    with the column names, after checking them against feature_preprocessed_names.json, and the
+    SHA-256, size and modification time of the CSV it was converted from (see `load_processed`).
+
+    Returns:
+        The path of the .npy file.
+    """
+    csv_path = os.path.join(path, f"{name}.csv")
+    df = pd.read_csv(csv_path)
+    expected_columns = _feature_processed_names()
+    if list(df.columns) != expected_columns:
+        raise ValueError(
+            f"Columns of {name}.csv do not match feature_preprocessed_names.json: "
+            f"{list(df.columns)} != {expected_columns}"
+        )
+    npy_path = os.path.join(path, f"{name}.npy")
+    np.save(npy_path, np.ascontiguousarray(df.to_numpy(dtype=np.float64)))
+    csv_stat = os.stat(csv_path)
+    with open(os.path.join(path, f"{name}.columns.json"), "w") as f:
+        json.dump(
+            {
+                "columns": list(df.columns),
+                "csv_sha256": artifact_hash(csv_path),
+                "csv_size": csv_stat.st_size,
+                "csv_mtime_ns": csv_stat.st_mtime_ns,
+            },
+            f,
+        )
+    return npy_path
+
+
+def _csv_unchanged(csv_path: str, sidecar: dict) -> bool:
+    """Whether the CSV is the one recorded in the sidecar: same size and mtime, or else same SHA-256."""
+    csv_stat = os.stat(csv_path)
+    if (sidecar.get("csv_size"), sidecar.get("csv_mtime_ns")) == (csv_stat.st_size, csv_stat.st_mtime_ns):
+        return True
+    return sidecar.get("csv_sha256") == artifact_hash(csv_path)
+
+
+@functools.lru_cache(maxsize=None)
+def load_processed(name: str, path: str = PATH_DATA_PROCESSED) -> pd.DataFrame:
+    """
+    Load a preprocessed reference dataset once per process, shared by every module that asks for it.
+    Uses the memory-mapped `.npy` store when present (read-only, no parsing) and converted from the
+    current CSV, the CSV otherwise: a stale binary copy must not feed training or the explainers.
+    The CSV is only re-hashed when its size or modification time differs from the ones recorded at conversion.
+    """
+    npy_path = os.path.join(path, f"{name}.npy")
+    csv_path = os.path.join(path, f"{name}.csv")
+    if not os.path.exists(npy_path):
+        return pd.read_csv(csv_path)
+    with open(os.path.join(path, f"{name}.columns.json"), "r") as f:
+        sidecar = json.load(f)
+    # Sidecars written before the hash was recorded are a plain list of columns
+    if not isinstance(sidecar, dict):
+        sidecar = {"columns": sidecar}
+    if os.path.exists(csv_path) and not _csv_unchanged(csv_path, sidecar):
+        print(
+            f"WARNING:  {npy_path} was not converted from the current {name}.csv, reading the CSV "
+            f"(run `python -m app.datastore` to update the binary store)"
+        )
+        return pd.read_csv(csv_path)
+    return pd.DataFrame(np.load(npy_path, mmap_mode="r"), columns=sidecar["columns"], copy=False)
+
+
+if __name__ == "__main__":
+    """
+    Convert the preprocessed CSVs to the binary store.
+    """
+    for dataset_name in PROCESSED_DATASETS:
+        print(f"{dataset_name}: {convert_processed_dataset(dataset_name)}")
+    print("Processed datasets converted")
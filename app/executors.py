@@ -0,0 +1,211 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.profiler import PROFILE_ENABLED, track_thread
+
+
+# --- Configuration (env vars) ---
+# Thread pool for sklearn predict/transform paths (numpy/Cython release the GIL for most of the work)
+PREDICT_THREADS = int(os.getenv("HMEQ_PREDICT_THREADS", min(8, os.cpu_count() or 1)))
+PREDICT_MAX_PENDING = int(os.getenv("HMEQ_PREDICT_MAX_PENDING", "256"))
+# "process" runs LIME in worker processes with the pipelines preloaded, "thread" runs it in a thread pool
+LIME_EXECUTOR = os.getenv("HMEQ_LIME_EXECUTOR", "process")
+LIME_WORKERS = int(os.getenv("HMEQ_LIME_WORKERS", min(4, os.cpu_count() or 1)))
+LIME_MAX_PENDING = int(os.getenv("HMEQ_LIME_MAX_PENDING", str(4 * LIME_WORKERS)))
+
+
+class ExecutorSaturated(Exception):
+    """Raised when an executor already has its maximum number of pending jobs (mapped to HTTP 429)."""
+
+    def __init__(self, name: str, max_pending: int):
+        super().__init__(
+            f"The {name} executor is saturated ({max_pending} pending jobs). Please retry shortly."
+        )
+        self.name = name
+        self.max_pending = max_pending
+
+
+class BoundedExecutor:
+    """
+    Wraps a concurrent.futures executor with a bound on in-flight jobs.
+    Jobs beyond `max_pending` are rejected immediately instead of queueing (back-pressure).
+    A job counts as pending until the pool is done with it: a caller that stops waiting (e.g. the client
+    disconnected) only frees its slot once the job finishes or is cancelled before it started.
+    The counter is only touched from the event loop thread, so no lock is needed.
+    """
+
+    def __init__(self, name: str, executor: Executor, max_pending: int):
+        self.name = name
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        if self.pending >= self.max_pending:
+            raise ExecutorSaturated(self.name, self.max_pending)
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        if isinstance(self.executor, ThreadPoolExecutor):
+            # Like asyncio.to_thread: run in a copy of the caller's context, so the request's
+            # stage timings (app/metrics.py) follow the job into the thread
+            if PROFILE_ENABLED:
+                call = functools.partial(track_thread, call)
+            call = functools.partial(contextvars.copy_context().run, call)
+        job = self.executor.submit(call)
+        self.pending += 1
+        # Called from the pool's thread when the job itself is done, not when the awaiting coroutine is cancelled
+        job.add_done_callback(lambda _: self._release(loop))
+        return await asyncio.wrap_future(job, loop=loop)
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._decrement)
+        except RuntimeError:  # the loop is closed (shutdown), nothing is waiting on the counter anymore
+            pass
+
+    def _decrement(self):
+        self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- LIME worker state ---
+# In "process" mode these are populated per worker by `_init_lime_worker`,
+# in "thread" mode they point at the pipelines/explainers already loaded by the app.
+_WORKER_PIPELINES: Dict[str, Any] = {}
+_WORKER_EXPLAINERS: Dict[str, Any] = {}
+
+
+def _worker_model(name: str, pipeline, registry):
+    """Worker post_load hook: the same model swaps as the app (flattened trees, KNN neighbour index)."""
+    from app.neighbors import index_neighbors_on_load
+    from app.tree_engine import flatten_on_load
+
+    return index_neighbors_on_load(name, flatten_on_load(name, pipeline, registry))
+
+
+def _init_lime_worker(pipeline_paths: Dict[str, str], artifact_hashes: Optional[Dict[str, str]] = None):
+    """
+    Process pool initializer: load the pipelines and build the LIME explainers once per worker.
+    `artifact_hashes` are the ones the parent already computed, so the worker does not hash the artifacts again.
+    """
+    from app.limestone import build_explainer_registry
+    from app.registry import ModelRegistry
+
+    global _WORKER_PIPELINES, _WORKER_EXPLAINERS
+    # Memory-mapped, so the workers share the pages of the large arrays
+    _WORKER_PIPELINES = ModelRegistry(
+        pipeline_paths, post_load=_worker_model, hashes=artifact_hashes
+    ).load_all(parallel=False)
+    _WORKER_EXPLAINERS = build_explainer_registry()
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def lime_explain_task(
+    pipeline_name: str, instance: np.ndarray, random_state: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Run LIME and translate the explanation for one instance, using the worker's pipelines.
+    The explainer's structured terms are translated directly (no condition strings are parsed), into
+    plain condition record dicts (see pipeline_utils.translate_lime_conditions) that pickle cheaply back to the app.
+    """
+    from app.limestone import lime_explain_instance, DEFAULT_EXPLAINER
+    from app.metrics import stage
+    from app.pipeline_utils import translate_lime_conditions
+
+    pipeline = _WORKER_PIPELINES[pipeline_name]
+    lime_explanation_raw = lime_explain_instance(
+        pipeline=pipeline,
+        instance=instance,
+        explainer=_WORKER_EXPLAINERS[DEFAULT_EXPLAINER],
+        random_state=random_state,
+    )
+    with stage("translation"):
+        return translate_lime_conditions(lime_explanation_raw.conditions, pipeline)
+
+
+def lime_explain_batch_task(
+    pipeline_name: str, instances: np.ndarray, random_state: Optional[int] = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Run LIME and translate the explanations for a chunk of instances, scoring the perturbation
+    samples of the whole chunk in one predict_proba call.
+    """
+    from app.limestone import lime_explain_instances, DEFAULT_EXPLAINER
+    from app.metrics import stage
+    from app.pipeline_utils import translate_lime_conditions
+
+    pipeline = _WORKER_PIPELINES[pipeline_name]
+    explanations = lime_explain_instances(
+        pipeline=pipeline,
+        instances=instances,
+        explainer=_WORKER_EXPLAINERS[DEFAULT_EXPLAINER],
+        random_state=random_state,
+    )
+    with stage("translation"):
+        return [
+            translate_lime_conditions(explanation.conditions, pipeline)
+            for explanation in explanations
+        ]
+
+
+def create_executors(
+    pipelines: Dict[str, Any],
+    explainers: Dict[str, Any],
+    pipeline_paths: Dict[str, str],
+    artifact_hashes: Optional[Dict[str, str]] = None,
+) -> Tuple[BoundedExecutor, BoundedExecutor]:
+    """
+    Create the predict (thread) and LIME (process or thread) executors.
+
+    Args:
+        pipelines: Dict[str, Pipeline]
+            The pipelines loaded in the app process (used directly in "thread" mode).
+        explainers: Dict[str, LimeTabularExplainer]
+            The explainers built in the app process (used directly in "thread" mode).
+        pipeline_paths: Dict[str, str]
+            Paths of the pipeline artifacts, loaded by each worker in "process" mode.
+        artifact_hashes: Dict[str, str], optional
+            Their SHA-256 as computed by the app, passed on to the workers.
+    Returns:
+        (predict_executor, lime_executor)
+    """
+    predict_executor = BoundedExecutor(
+        "predict",
+        ThreadPoolExecutor(max_workers=PREDICT_THREADS, thread_name_prefix="predict"),
+        PREDICT_MAX_PENDING,
+    )
+
+    if LIME_EXECUTOR == "process":
+        pool = ProcessPoolExecutor(
+            max_workers=LIME_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_lime_worker,
+            initargs=(pipeline_paths, artifact_hashes),
+        )
+        # Start the workers now so the pipelines are loaded before the first request
+        for future in [pool.submit(_worker_ready) for _ in range(LIME_WORKERS)]:
+            future.result()
+    elif LIME_EXECUTOR == "thread":
+        global _WORKER_PIPELINES, _WORKER_EXPLAINERS
+        _WORKER_PIPELINES = pipelines
+        _WORKER_EXPLAINERS = explainers
+        pool = ThreadPoolExecutor(max_workers=LIME_WORKERS, thread_name_prefix="lime")
+    else:
+        raise ValueError(
+            f"HMEQ_LIME_EXECUTOR must be 'process' or 'thread', got {LIME_EXECUTOR!r}"
+        )
+    lime_executor = BoundedExecutor("lime", pool, LIME_MAX_PENDING)
+
+    return predict_executor, lime_executor
@@ -0,0 +1,212 @@
+import argparse
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from app.cache import artifact_hash
+from app.datastore import load_processed
+from app.executors import _init_lime_worker, lime_explain_batch_task
+from app.limestone import LIME_ENGINE, LIME_NUM_FEATURES, LIME_NUM_SAMPLES
+from app.pipeline_utils import EXPLANATION_FORMAT
+from app.registry import ModelRegistry, PIPELINE_PATHS
+from app.tree_engine import TREE_ENGINE_PIPELINES
+
+
+# --- Configuration (env vars) ---
+EXPLANATION_INDEX_DIR = os.getenv(
+    "HMEQ_EXPLANATION_INDEX_DIR", "/home/oreo/hmeq/app/assets/explanations"
+)
+EXPLANATION_INDEX_CHUNK_SIZE = 32  # instances per LIME task, as in /explain_batch
+
+# File layout: magic | uint64 header length | JSON header | int64 offsets[n_rows + 1] | records
+# Each record is the UTF-8 JSON of {"lime_conditions": [...], "probability_of_default": float}
+_MAGIC = b"HMEQXIDX"
+_HEADER_LENGTH = struct.Struct("<Q")
+
+
+def index_path(pipeline_name: str, directory: str = EXPLANATION_INDEX_DIR) -> str:
+    return os.path.join(directory, f"explanations_{pipeline_name}.idx")
+
+
+def write_explanation_index(path: str, header: Dict[str, Any], records: Sequence[dict]):
+    """Write the records with their offsets table, so any record can be read without scanning the file."""
+    payloads = [json.dumps(record, separators=(",", ":")).encode("utf-8") for record in records]
+    offsets = np.zeros(len(payloads) + 1, dtype="<i8")
+    np.cumsum([len(payload) for payload in payloads], out=offsets[1:])
+    header_bytes = json.dumps({**header, "n_rows": len(payloads)}).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header_bytes)))
+        f.write(header_bytes)
+        f.write(offsets.tobytes())
+        for payload in payloads:
+            f.write(payload)
+    os.replace(tmp_path, path)
+
+
+class ExplanationIndex:
+    """
+    Read-only, memory-mapped view of an explanation index file with O(1) lookup by instance index.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[: len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not an explanation index")
+        start = len(_MAGIC)
+        (header_length,) = _HEADER_LENGTH.unpack_from(self._mmap, start)
+        start += _HEADER_LENGTH.size
+        self.header: Dict[str, Any] = json.loads(self._mmap[start : start + header_length])
+        start += header_length
+        self.n_rows: int = self.header["n_rows"]
+        self._offsets = np.frombuffer(self._mmap, dtype="<i8", count=self.n_rows + 1, offset=start)
+        self._data_start = start + self._offsets.nbytes
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def lookup(self, instance_index: int) -> dict:
+        """The stored record of one test set instance ({"lime_conditions", "probability_of_default"})."""
+        begin = self._data_start + int(self._offsets[instance_index])
+        end = self._data_start + int(self._offsets[instance_index + 1])
+        return json.loads(self._mmap[begin:end])
+
+    def matches(self, **expected: Any) -> bool:
+        """Whether the index was built with these settings (artifact hash, LIME settings, dataset size...)."""
+        return all(self.header.get(key) == value for key, value in expected.items())
+
+
+def _dataset_hash(X: pd.DataFrame) -> str:
+    """SHA-256 of a processed dataset's column names and float64 values."""
+    digest = hashlib.sha256(json.dumps(list(X.columns)).encode("utf-8"))
+    digest.update(np.ascontiguousarray(X.to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def _index_settings(pipeline_name: str, pipeline_path: str, X_test: pd.DataFrame) -> Dict[str, Any]:
+    """Everything an indexed explanation depends on; an index is only served if all of it still matches."""
+    return {
+        "pipeline_name": pipeline_name,
+        "artifact_hash": artifact_hash(pipeline_path),
+        "lime_engine": LIME_ENGINE,
+        "num_samples": LIME_NUM_SAMPLES,
+        "num_features": LIME_NUM_FEATURES,
+        "explanation_format": EXPLANATION_FORMAT,
+        "tree_engine": pipeline_name in TREE_ENGINE_PIPELINES,
+        "n_rows": len(X_test),
+        # The rows themselves: X_test can change without changing length
+        "x_test_hash": _dataset_hash(X_test),
+    }
+
+
+def open_explanation_indexes(
+    pipeline_paths: Dict[str, str], directory: str = EXPLANATION_INDEX_DIR
+) -> Dict[str, ExplanationIndex]:
+    """
+    Open the index of each pipeline that has one built for the current artifact and LIME settings.
+    Stale or missing indexes are skipped, so those pipelines fall back to live LIME.
+    """
+    X_test = load_processed("X_test")
+    indexes = {}
+    for name, pipeline_path in pipeline_paths.items():
+        path = index_path(name, directory)
+        if not os.path.exists(path):
+            continue
+        try:
+            index = ExplanationIndex(path)
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            print(f"WARNING:  Could not open explanation index {path}: {e}")
+            continue
+        if not index.matches(**_index_settings(name, pipeline_path, X_test)):
+            print(f"WARNING:  Explanation index for {name} is stale, explaining live.")
+            continue
+        indexes[name] = index
+    return indexes
+
+
+def build_explanation_index(
+    pipeline_name: str,
+    pipeline_paths: Dict[str, str] = PIPELINE_PATHS,
+    directory: str = EXPLANATION_INDEX_DIR,
+    workers: Optional[int] = None,
+    random_state: int = 0,
+    chunk_size: int = EXPLANATION_INDEX_CHUNK_SIZE,
+) -> str:
+    """
+    Explain and score every X_test instance with one pipeline, in LIME worker processes,
+    and write the explanation index. Chunk `k` is seeded with `random_state + k * chunk_size`,
+    like /explain_batch.
+
+    Returns:
+        The path of the index file.
+    """
+    X_test_processed = load_processed("X_test")
+    instances = np.asarray(X_test_processed.values, dtype=np.float64)
+    registry = ModelRegistry({pipeline_name: pipeline_paths[pipeline_name]})
+    pipeline = registry[pipeline_name]
+    probas = pipeline.named_steps["model"].predict_proba(instances)[:, 1]
+
+    offsets = range(0, len(instances), chunk_size)
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_lime_worker,
+        initargs=({pipeline_name: pipeline_paths[pipeline_name]}, registry.artifact_hashes()),
+    ) as pool:
+        futures = [
+            pool.submit(
+                lime_explain_batch_task,
+                pipeline_name,
+                instances[offset : offset + chunk_size],
+                random_state + offset,
+            )
+            for offset in offsets
+        ]
+        explanations: List[list] = [
+            explanation for future in futures for explanation in future.result()
+        ]
+
+    records = [
+        {"lime_conditions": explanation, "probability_of_default": float(proba)}
+        for explanation, proba in zip(explanations, probas)
+    ]
+    os.makedirs(directory, exist_ok=True)
+    path = index_path(pipeline_name, directory)
+    header = _index_settings(pipeline_name, pipeline_paths[pipeline_name], X_test_processed)
+    write_explanation_index(
+        path, {**header, "random_state": random_state, "chunk_size": chunk_size}, records
+    )
+    return path
+
+
+if __name__ == "__main__":
+    """
+    Precompute the explanation indexes, e.g. `python -m app.explanation_index --pipelines rf gb`.
+    """
+    parser = argparse.ArgumentParser(description="Precompute LIME explanations for X_test.")
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINE_PATHS))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--random-state", type=int, default=0)
+    parser.add_argument("--output-dir", default=EXPLANATION_INDEX_DIR)
+    args = parser.parse_args()
+
+    for name in args.pipelines:
+        started = time.perf_counter()
+        index_file = build_explanation_index(
+            name, directory=args.output_dir, workers=args.workers, random_state=args.random_state
+        )
+        print(f"{name}: {index_file} ({time.perf_counter() - started:.1f}s)")
+    print("Explanation indexes built")
@@ -0,0 +1,395 @@
+import functools
+import os
+from typing import Any, Dict, List, Sequence, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.experimental import enable_iterative_imputer
+from sklearn.impute import IterativeImputer, SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder, StandardScaler
+
+from app.metrics import stage
+
+
+# Compiled (pure NumPy) preprocessing on the serving path, validated against sklearn at startup
+COMPILED_PREPROCESSOR_ENABLED = os.getenv("HMEQ_COMPILED_PREPROCESSOR", "1") == "1"
+# Maximum allowed deviation from sklearn's output (0.0 = bit-for-bit)
+COMPILED_PREPROCESSOR_ATOL = float(os.getenv("HMEQ_COMPILED_PREPROCESSOR_ATOL", "0.0"))
+
+PATH_DATA_CLEANED = "/home/oreo/hmeq/app/assets/data/cleaned"
+
+
+# --- 1. Compiled steps (fitted parameters only, no sklearn at transform time) ---
+class _FillNumeric:
+    """SimpleImputer on numeric columns: replace NaN with the fitted statistics."""
+
+    def __init__(self, statistics: np.ndarray):
+        self.statistics = statistics
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        return np.where(np.isnan(X), self.statistics, X)
+
+
+class _FillCategorical:
+    """SimpleImputer on categorical columns: replace missing (None/NaN) with the fitted statistics."""
+
+    def __init__(self, statistics: np.ndarray):
+        self.statistics = statistics
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        return np.where(pd.isna(X), self.statistics, X)
+
+
+class _IterativeImpute:
+    """
+    IterativeImputer.transform (sample_posterior=False): mean initial fill, then the fitted
+    round-robin sequence of linear (BayesianRidge) predictions for the missing entries only.
+    """
+
+    def __init__(self, initial_statistics, sequence, min_value, max_value):
+        self.initial_statistics = initial_statistics
+        # (feat_idx, neighbor_feat_idx, coef, intercept) per imputation step
+        self.sequence = sequence
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        # Same memory layout as sklearn (order="F"), so the dot products round identically
+        X = np.asfortranarray(X, dtype=np.float64)
+        mask_missing = np.isnan(X)
+        if not mask_missing.any():
+            return X
+        X_filled = np.where(mask_missing, self.initial_statistics, X)
+        X_filled = np.asfortranarray(X_filled)
+        if np.all(mask_missing):
+            return X_filled
+        for feat_idx, neighbor_feat_idx, coef, intercept in self.sequence:
+            missing_rows = mask_missing[:, feat_idx]
+            if not missing_rows.any():
+                continue
+            X_test = X_filled[:, neighbor_feat_idx][missing_rows, :]
+            imputed = X_test @ coef + intercept
+            imputed = np.clip(imputed, self.min_value[feat_idx], self.max_value[feat_idx])
+            X_filled[missing_rows, feat_idx] = imputed
+        return X_filled
+
+
+class _Ufunc:
+    """FunctionTransformer wrapping a NumPy ufunc (e.g. np.log1p)."""
+
+    def __init__(self, ufunc_name: str):
+        self.ufunc_name = ufunc_name
+        self.ufunc = getattr(np, ufunc_name)
+
+    def __getstate__(self):
+        return {"ufunc_name": self.ufunc_name}
+
+    def __setstate__(self, state):
+        self.__init__(state["ufunc_name"])
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        return self.ufunc(X)
+
+
+class _Scale:
+    """StandardScaler.transform: (X - mean) / scale."""
+
+    def __init__(self, mean, scale):
+        self.mean = mean
+        self.scale = scale
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        if self.mean is not None:
+            X = X - self.mean
+        if self.scale is not None:
+            X = X / self.scale
+        return X
+
+
+class _OneHot:
+    """OneHotEncoder.transform (dense, handle_unknown='ignore'): one lookup table of kept categories per column."""
+
+    def __init__(self, kept_categories: List[np.ndarray]):
+        self.kept_categories = kept_categories
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        return np.hstack(
+            [
+                (X[:, [j]] == categories[None, :]).astype(np.float64)
+                for j, categories in enumerate(self.kept_categories)
+            ]
+        )
+
+
+def _compile_step(step) -> Any:
+    if isinstance(step, SimpleImputer):
+        if step.add_indicator:
+            raise NotImplementedError("SimpleImputer(add_indicator=True) is not supported")
+        if step.statistics_.dtype == object:
+            return _FillCategorical(step.statistics_)
+        if np.isnan(step.statistics_).any():
+            raise NotImplementedError("SimpleImputer with all-missing features is not supported")
+        return _FillNumeric(step.statistics_.astype(np.float64))
+
+    if isinstance(step, IterativeImputer):
+        if step.sample_posterior or step.add_indicator:
+            raise NotImplementedError("IterativeImputer(sample_posterior/add_indicator) is not supported")
+        if np.any(getattr(step, "_is_empty_feature", False)):
+            raise NotImplementedError("IterativeImputer with all-missing features is not supported")
+        sequence = []
+        for triplet in step.imputation_sequence_:
+            estimator = triplet.estimator
+            if estimator.coef_.ndim != 1:
+                raise NotImplementedError("Only single-output linear imputation estimators are supported")
+            sequence.append(
+                (
+                    int(triplet.feat_idx),
+                    np.asarray(triplet.neighbor_feat_idx),
+                    estimator.coef_,
+                    estimator.intercept_,
+                )
+            )
+        return _IterativeImpute(
+            initial_statistics=step.initial_imputer_.statistics_,
+            sequence=sequence if step.n_iter_ > 0 else [],
+            min_value=step._min_value,
+            max_value=step._max_value,
+        )
+
+    if isinstance(step, FunctionTransformer):
+        if not isinstance(step.func, np.ufunc):
+            raise NotImplementedError(f"FunctionTransformer({step.func}) is not supported")
+        return _Ufunc(step.func.__name__)
+
+    if isinstance(step, StandardScaler):
+        return _Scale(step.mean_, step.scale_)
+
+    if isinstance(step, OneHotEncoder):
+        if step.handle_unknown != "ignore" or step.sparse_output:
+            raise NotImplementedError("Only dense OneHotEncoder(handle_unknown='ignore') is supported")
+        drop_idx = step.drop_idx_ if step.drop_idx_ is not None else [None] * len(step.categories_)
+        kept_categories = [
+            np.delete(categories, drop) if drop is not None else categories
+            for categories, drop in zip(step.categories_, drop_idx)
+        ]
+        return _OneHot(kept_categories)
+
+    raise NotImplementedError(f"Step {type(step).__name__} is not supported")
+
+
+# --- 2. Compiled ColumnTransformer ---
+class CompiledPreprocessor:
+    """
+    Pure-NumPy version of the fitted preprocessing ColumnTransformer
+    (imputers, log1p, StandardScaler, OneHotEncoder), built from the fitted parameters of a pipeline.
+    """
+
+    def __init__(self, blocks: List[tuple], feature_names_out: List[str]):
+        # (columns, is_categorical, compiled steps) per transformer, in output order
+        self.blocks = blocks
+        self.feature_names_out = feature_names_out
+
+    @classmethod
+    def from_pipeline(cls, pipeline: Pipeline) -> "CompiledPreprocessor":
+        col_transformer = pipeline.named_steps["preprocessor"].named_steps["preprocessor"]
+        if not isinstance(col_transformer, ColumnTransformer):
+            raise NotImplementedError("Expected a ColumnTransformer inside the preprocessor")
+
+        blocks = []
+        for name, transformer, columns in col_transformer.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+            if transformer == "passthrough" or not isinstance(transformer, Pipeline):
+                raise NotImplementedError(f"Transformer {name} is not supported")
+            steps = [_compile_step(step) for _, step in transformer.steps]
+            is_categorical = any(isinstance(step, _OneHot) for step in steps)
+            blocks.append((list(columns), is_categorical, steps))
+
+        return cls(blocks, list(col_transformer.get_feature_names_out()))
+
+    def transform(self, X: Union[pd.DataFrame, Sequence[Dict[str, Any]]]) -> np.ndarray:
+        """
+        Transform raw applications into the model's feature matrix.
+
+        Args:
+            X: pd.DataFrame or list of dicts
+                Raw applications with the original feature names.
+        Returns:
+            np.ndarray of shape (n_samples, n_features_out)
+        """
+        outputs = []
+        for columns, is_categorical, steps in self.blocks:
+            if isinstance(X, pd.DataFrame):
+                block = X[columns].to_numpy(dtype=object if is_categorical else np.float64)
+            else:
+                block = np.array(
+                    [[row.get(column) for column in columns] for row in X],
+                    dtype=object if is_categorical else np.float64,
+                )
+            for step in steps:
+                block = step.apply(block)
+            outputs.append(block)
+        return np.hstack(outputs)
+
+    def validate(self, pipeline: Pipeline, X: pd.DataFrame) -> float:
+        """
+        Compare against the sklearn preprocessor of `pipeline` on `X`.
+
+        Returns:
+            The maximum absolute difference (0.0 when bit-for-bit identical).
+        """
+        expected = pipeline.named_steps["preprocessor"].transform(X)
+        if isinstance(expected, pd.DataFrame):
+            if list(expected.columns) != self.feature_names_out:
+                raise ValueError("Compiled feature names do not match the sklearn preprocessor")
+            expected = expected.to_numpy()
+        actual = self.transform(X)
+        if actual.shape != expected.shape:
+            raise ValueError(f"Shape mismatch: {actual.shape} != {expected.shape}")
+        if np.array_equal(actual, expected, equal_nan=True):
+            return 0.0
+        return float(np.nanmax(np.abs(actual - expected)))
+
+
+# --- 3. Serving wrapper ---
+class CompiledPipeline:
+    """
+    Drop-in for a fitted sklearn pipeline on the serving path: compiled preprocessing + the fitted model.
+    `named_steps` still exposes the original steps (needed for LIME and translation).
+    """
+
+    def __init__(self, pipeline: Pipeline, preprocessor: CompiledPreprocessor):
+        self.pipeline = pipeline
+        self.preprocessor = preprocessor
+        self.model = pipeline.named_steps["model"]
+
+    @property
+    def named_steps(self):
+        return self.pipeline.named_steps
+
+    def transform(self, X) -> np.ndarray:
+        return self.preprocessor.transform(X)
+
+    def predict_proba(self, X) -> np.ndarray:
+        return self.model.predict_proba(self.preprocessor.transform(X))
+
+
+def to_pipeline_input(
+    pipeline, rows: List[Dict[str, Any]], columns: Sequence[str]
+) -> Union[pd.DataFrame, List[Dict[str, Any]]]:
+    """The compiled preprocessor reads the request dicts directly; sklearn needs a DataFrame."""
+    if isinstance(pipeline, CompiledPipeline):
+        return rows
+    return pd.DataFrame(data=rows, columns=columns)
+
+
+def transform_features(pipeline, X) -> Union[pd.DataFrame, np.ndarray]:
+    """
+    Preprocess raw applications with the compiled preprocessor if available, else with sklearn.
+    Timed as the "preprocess" stage of the current request (see app/metrics.py).
+    """
+    with stage("preprocess"):
+        if isinstance(pipeline, CompiledPipeline):
+            return pipeline.transform(X)
+        return pipeline.named_steps["preprocessor"].transform(X)
+
+
+def model_predict_proba(pipeline, X_processed) -> np.ndarray:
+    """
+    predict_proba of the pipeline's model on already preprocessed features (see `transform_features`),
+    timed as the "inference" stage of the current request.
+    """
+    with stage("inference"):
+        return pipeline.named_steps["model"].predict_proba(X_processed)
+
+
+def staged_predict_proba(pipeline, X) -> np.ndarray:
+    """
+    Same as `pipeline.predict_proba(X)`, with preprocessing and the model timed as separate
+    "preprocess" and "inference" stages of the current request (see app/metrics.py).
+    """
+    return model_predict_proba(pipeline, transform_features(pipeline, X))
+
+
+def load_validation_data(n_missing_copies: int = 1) -> pd.DataFrame:
+    """
+    Raw rows to validate the compiled preprocessor on: the cleaned test set, plus a copy with
+    extra numeric values knocked out so every imputation step is exercised.
+    """
+    X = pd.read_csv(os.path.join(PATH_DATA_CLEANED, "X_test.csv"))
+    rng = np.random.RandomState(13)
+    numeric_columns = X.select_dtypes(include="number").columns
+    copies = [X]
+    for _ in range(n_missing_copies):
+        X_missing = X.copy()
+        mask = rng.rand(len(X), len(numeric_columns)) < 0.3
+        X_missing[numeric_columns] = X_missing[numeric_columns].mask(mask)
+        copies.append(X_missing)
+    return pd.concat(copies, ignore_index=True)
+
+
+def compile_pipelines(
+    pipelines: Dict[str, Pipeline], validation_df: pd.DataFrame, atol: float = COMPILED_PREPROCESSOR_ATOL
+) -> Dict[str, Any]:
+    """
+    Wrap each pipeline in a CompiledPipeline if its preprocessor compiles and matches sklearn
+    on `validation_df` within `atol`; otherwise keep the sklearn pipeline.
+    """
+    serving_pipelines = {}
+    for name, pipeline in pipelines.items():
+        try:
+            preprocessor = CompiledPreprocessor.from_pipeline(pipeline)
+            max_diff = preprocessor.validate(pipeline, validation_df)
+        except (NotImplementedError, ValueError, KeyError, AttributeError) as e:
+            print(f"WARNING:  Could not compile preprocessor for {name}, using sklearn: {e}")
+            serving_pipelines[name] = pipeline
+            continue
+        if max_diff > atol:
+            print(
+                f"WARNING:  Compiled preprocessor for {name} deviates from sklearn "
+                f"(max abs diff {max_diff:.3g} > {atol}), using sklearn."
+            )
+            serving_pipelines[name] = pipeline
+            continue
+        print(f"INFO:     Compiled preprocessor for {name} validated (max abs diff {max_diff:.3g}).")
+        serving_pipelines[name] = CompiledPipeline(pipeline, preprocessor)
+    return serving_pipelines
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_validation_data() -> pd.DataFrame:
+    return load_validation_data()
+
+
+def compile_on_load(name: str, pipeline: Pipeline) -> Any:
+    """
+    ModelRegistry post_load hook: `compile_pipelines` for a single pipeline, validated on
+    `load_validation_data()` (read once). Keeps the sklearn pipeline if there is no validation data.
+    """
+    try:
+        validation_df = _cached_validation_data()
+    except FileNotFoundError as e:
+        print(f"WARNING:  No validation data for the compiled preprocessor, using sklearn: {e}")
+        return pipeline
+    return compile_pipelines({name: pipeline}, validation_df)[name]
+
+
+if __name__ == "__main__":
+    """
+    Validate the compiled preprocessors against sklearn. Nothing is written: serving compiles them from
+    the loaded pipelines (see `compile_on_load`), which takes milliseconds.
+    """
+    PATH_PIPELINES = "/home/oreo/hmeq/app/assets/pipes"
+    validation_df = load_validation_data()
+    for name in ["rf", "knn", "gb", "dt"]:
+        pipeline = joblib.load(os.path.join(PATH_PIPELINES, f"full_pipeline_{name}.joblib"))
+        preprocessor = CompiledPreprocessor.from_pipeline(pipeline)
+        max_diff = preprocessor.validate(pipeline, validation_df)
+        within = "within" if max_diff <= COMPILED_PREPROCESSOR_ATOL else "NOT within"
+        print(
+            f"{name}: max abs diff vs sklearn = {max_diff:.3g} on {len(validation_df)} rows "
+            f"({within} HMEQ_COMPILED_PREPROCESSOR_ATOL={COMPILED_PREPROCESSOR_ATOL})"
+        )
@@ -2,24 +2,465 @@ import lime
 import lime.lime_tabular
 
 import os
+import copy
+import functools
 import joblib
 import json
 import pandas as pd
 import numpy as np
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+from scipy.special import ndtr, ndtri
 from sklearn.pipeline import Pipeline
 
+from app.datastore import load_processed
+from app.metrics import stage
 
-PATH_DATA_PROCESSED = "/home/oreo/hmeq/app/assets/data/processed"
-X_train_processed = pd.read_csv(os.path.join(PATH_DATA_PROCESSED, "X_train.csv"))
 
 PATH_ASSETS = "/home/oreo/hmeq/app/assets"
-feature_processed_names = json.load(
-    open(os.path.join(PATH_ASSETS, "feature_preprocessed_names.json"), "r")
-)
+
+# One-hot encoded columns of the preprocessed data (cat__REASON_*, cat__JOB_*)
+LIME_CATEGORICAL_FEATURES = [10, 11, 12, 13, 14, 15, 16]
+DEFAULT_EXPLAINER = "default"
+# "fast" = in-house vectorized engine (FastLimeExplainer), "lime" = the stock lime package
+LIME_ENGINE = os.getenv("HMEQ_LIME_ENGINE", "fast")
+# Perturbation samples and features per explanation
+LIME_NUM_SAMPLES = 400
+LIME_NUM_FEATURES = 10
+
+
+def _own_random_state(random_state=None) -> np.random.RandomState:
+    """
+    The RNG of one explanation: `random_state` itself if it is a RandomState, else a new one seeded with it.
+    Unlike sklearn's check_random_state, None gives a freshly seeded RandomState, never NumPy's global one,
+    so unseeded concurrent requests do not share an RNG.
+    """
+    if isinstance(random_state, np.random.RandomState):
+        return random_state
+    return np.random.RandomState(random_state)
+
+
+# --- Structured explanation terms ---
+class LimeCondition(NamedTuple):
+    """
+    One explanation term on a preprocessed feature, as produced by the explainer (before any formatting):
+    `x <= upper`, `x > lower` or `lower < x <= upper` for a quartile bin of a continuous feature
+    (operator "<=", ">" or "between"), or `x = value` for a one-hot column (operator "=").
+    """
+
+    feature: int
+    name: str
+    operator: str
+    lower: Optional[float]
+    upper: Optional[float]
+    value: Optional[float]
+    weight: float
+
+
+def _bin_condition(
+    feature: int, name: str, bin_index: int, lowers: Sequence[float], uppers: Sequence[float], weight: float
+) -> LimeCondition:
+    """The condition of quartile bin `bin_index` (the first bin has no lower bound, the last no upper bound)."""
+    if bin_index == 0:
+        return LimeCondition(feature, name, "<=", None, float(uppers[0]), None, weight)
+    if bin_index == len(uppers) - 1:
+        return LimeCondition(feature, name, ">", float(lowers[bin_index]), None, None, weight)
+    return LimeCondition(
+        feature, name, "between", float(lowers[bin_index]), float(uppers[bin_index]), None, weight
+    )
+
+
+# --- In-house LIME engine ---
+def _weighted_ridge(
+    X: np.ndarray, y: np.ndarray, weights: np.ndarray, alpha: float
+) -> Tuple[np.ndarray, float]:
+    """
+    Closed-form weighted ridge regression with intercept (same objective as sklearn's
+    Ridge(alpha, fit_intercept=True).fit(X, y, sample_weight=weights)).
+    """
+    X_mean = weights @ X / weights.sum()
+    y_mean = weights @ y / weights.sum()
+    sqrt_weights = np.sqrt(weights)
+    X_weighted = (X - X_mean) * sqrt_weights[:, None]
+    y_weighted = (y - y_mean) * sqrt_weights
+    gram = X_weighted.T @ X_weighted
+    gram[np.diag_indices_from(gram)] += alpha
+    coef = np.linalg.solve(gram, X_weighted.T @ y_weighted)
+    return coef, y_mean - X_mean @ coef
+
+
+class FastLimeExplanation:
+    """
+    Result of FastLimeExplainer.explain_instance, with the same `as_list()` format as lime's Explanation.
+    `conditions` holds the same terms as LimeCondition records.
+    """
+
+    def __init__(
+        self,
+        exp: List[Tuple[str, float]],
+        intercept,
+        score,
+        local_pred,
+        predict_proba,
+        conditions: Optional[List[LimeCondition]] = None,
+    ):
+        self.exp = exp
+        self.conditions = conditions
+        self.intercept = intercept
+        self.score = score
+        self.local_pred = local_pred
+        self.predict_proba = predict_proba
+
+    def as_list(self, label: int = 1) -> List[Tuple[str, float]]:
+        return list(self.exp)
+
+
+class FastLimeExplainer:
+    """
+    Vectorized LIME for tabular classification with quartile discretization. Mirrors
+    lime.lime_tabular.LimeTabularExplainer(discretize_continuous=True, discretizer="quartile")
+    with "highest_weights" feature selection, but without the per-feature Python loops:
+    the perturbation matrix is sampled in one call, quartile bins and bin statistics are
+    precomputed, kernel weights are vectorized and the local model is a closed-form weighted ridge.
+    Holds no mutable state, so one instance can be shared by concurrent requests.
+    """
+
+    def __init__(
+        self,
+        training_data: np.ndarray,
+        feature_names: Sequence[str],
+        categorical_features: Sequence[int] = LIME_CATEGORICAL_FEATURES,
+        kernel_width: Optional[float] = None,
+    ):
+        training_data = np.asarray(training_data, dtype=np.float64)
+        n_features = training_data.shape[1]
+        self.feature_names = list(feature_names)
+        self.categorical_features = list(categorical_features)
+        self.continuous_features = [
+            f for f in range(n_features) if f not in self.categorical_features
+        ]
+        self.kernel_width = (
+            float(kernel_width) if kernel_width is not None else np.sqrt(n_features) * 0.75
+        )
+
+        # 1. Quartile bins and per-bin statistics (for sampling values inside a bin)
+        self.bins = {}
+        self.bin_names = {}
+        max_bins = 1
+        for f in self.continuous_features:
+            qts = np.unique(np.percentile(training_data[:, f], [25, 50, 75]))
+            self.bins[f] = qts
+            name = self.feature_names[f]
+            self.bin_names[f] = (
+                ["%s <= %.2f" % (name, qts[0])]
+                + ["%.2f < %s <= %.2f" % (qts[i], name, qts[i + 1]) for i in range(len(qts) - 1)]
+                + ["%s > %.2f" % (name, qts[-1])]
+            )
+            max_bins = max(max_bins, len(qts) + 1)
+
+        n_continuous = len(self.continuous_features)
+        self._bin_means = np.zeros((n_continuous, max_bins))
+        self._bin_stds = np.ones((n_continuous, max_bins))
+        self._bin_mins = np.zeros((n_continuous, max_bins))
+        self._bin_maxs = np.zeros((n_continuous, max_bins))
+        for j, f in enumerate(self.continuous_features):
+            column = training_data[:, f]
+            qts = self.bins[f]
+            binned = np.searchsorted(qts, column)
+            for b in range(len(qts) + 1):
+                selection = column[binned == b]
+                self._bin_means[j, b] = selection.mean() if len(selection) else 0.0
+                self._bin_stds[j, b] = (selection.std() if len(selection) else 0.0) + 1e-11
+            self._bin_mins[j, : len(qts) + 1] = np.concatenate([[column.min()], qts])
+            self._bin_maxs[j, : len(qts) + 1] = np.concatenate([qts, [column.max()]])
+
+        # 2. Sampling distribution of every (discretized) column, as padded value / CDF tables
+        discretized = self.discretize(training_data)
+        distributions = [
+            np.unique(discretized[:, f], return_counts=True) for f in range(n_features)
+        ]
+        max_values = max(len(values) for values, _ in distributions)
+        self._values = np.zeros((n_features, max_values))
+        self._cdf = np.ones((n_features, max_values))
+        for f, (values, counts) in enumerate(distributions):
+            self._values[f, : len(values)] = values
+            self._values[f, len(values) :] = values[-1]
+            self._cdf[f, : len(values)] = np.cumsum(counts) / counts.sum()
+        self._cdf[:, -1] = 1.0
+
+    def discretize(self, data: np.ndarray) -> np.ndarray:
+        """Replace continuous features by their quartile bin index (1d or 2d input)."""
+        ret = np.array(data, dtype=np.float64, copy=True)
+        for f, qts in self.bins.items():
+            ret[..., f] = np.searchsorted(qts, ret[..., f])
+        return ret
+
+    def _sample(self, data_row: np.ndarray, num_samples: int, rng: np.random.RandomState):
+        """
+        Sample the neighbourhood: `binary` (1 where a sample's bin/category equals the instance's)
+        and `inverse` (the samples in model space). Row 0 is the instance itself.
+        """
+        n_features = data_row.shape[0]
+        instance_discretized = self.discretize(data_row)
+
+        # Discretized values for every column, by inverse CDF in one shot
+        u = rng.random_sample((num_samples, n_features))
+        value_idx = (u[:, :, None] > self._cdf[None, :, :]).sum(axis=2)
+        sampled = self._values[np.arange(n_features)[None, :], value_idx]
+
+        binary = (sampled == instance_discretized[None, :]).astype(np.float64)
+        binary[0] = 1.0
+
+        # Continuous features: truncated normal inside the sampled bin (inverse CDF)
+        inverse = sampled.copy()
+        if self.continuous_features:
+            cont_idx = np.arange(len(self.continuous_features))[None, :]
+            bin_idx = sampled[:, self.continuous_features].astype(int)
+            means = self._bin_means[cont_idx, bin_idx]
+            stds = self._bin_stds[cont_idx, bin_idx]
+            mins = self._bin_mins[cont_idx, bin_idx]
+            maxs = self._bin_maxs[cont_idx, bin_idx]
+            p_low = ndtr((mins - means) / stds)
+            p_high = ndtr((maxs - means) / stds)
+            q = p_low + rng.random_sample(means.shape) * (p_high - p_low)
+            inverse[:, self.continuous_features] = np.clip(
+                means + stds * ndtri(q), mins, maxs
+            )
+        inverse[0] = data_row
+        return binary, inverse
+
+    def _condition(self, data_row: np.ndarray, f: int, weight: float) -> LimeCondition:
+        name = self.feature_names[f]
+        if f in self.bins:
+            qts = self.bins[f]
+            bin_index = int(np.searchsorted(qts, data_row[f]))
+            # Bin b covers (lowers[b], uppers[b]]
+            return _bin_condition(f, name, bin_index, [None, *qts], [*qts, None], weight)
+        return LimeCondition(f, name, "=", None, None, float(int(data_row[f])), weight)
+
+    def _condition_names(self, data_row: np.ndarray) -> List[str]:
+        names = []
+        for f, name in enumerate(self.feature_names):
+            if f in self.bins:
+                names.append(self.bin_names[f][int(np.searchsorted(self.bins[f], data_row[f]))])
+            else:
+                names.append("%s=%s" % (name, int(data_row[f])))
+        return names
+
+    def explain_instance(
+        self,
+        data_row: np.ndarray,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        num_features: int = 10,
+        num_samples: int = 5000,
+        label: int = 1,
+        random_state=None,
+    ) -> FastLimeExplanation:
+        """
+        Explain one instance.
+
+        Args:
+            data_row: np.ndarray
+                The (preprocessed) instance to explain.
+            predict_fn: Callable
+                Returns class probabilities for a 2d array of samples.
+            num_features: int
+                Maximum number of features in the explanation.
+            num_samples: int
+                Size of the neighbourhood.
+            label: int
+                The class to explain.
+            random_state: int or np.random.RandomState, optional
+                Seed for the neighbourhood sampling.
+        Returns:
+            FastLimeExplanation, whose `as_list()` gives (condition, weight) tuples
+            sorted by decreasing absolute weight.
+        """
+        rng = _own_random_state(random_state)
+        data_row = np.asarray(data_row, dtype=np.float64)
+        with stage("lime_sample"):
+            binary, inverse = self._sample(data_row, num_samples, rng)
+        with stage("lime_predict"):
+            yss = predict_fn(inverse)
+        with stage("lime_fit"):
+            return self._fit(data_row, binary, yss, num_features, label)
+
+    def explain_instances(
+        self,
+        data_rows: np.ndarray,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        num_features: int = 10,
+        num_samples: int = 5000,
+        label: int = 1,
+        random_state=None,
+    ) -> List[FastLimeExplanation]:
+        """
+        Explain many instances, with the neighbourhoods of all of them scored in a single predict_fn call.
+        Same arguments as `explain_instance`, with `data_rows` a 2d array of instances.
+        """
+        rng = _own_random_state(random_state)
+        data_rows = np.asarray(data_rows, dtype=np.float64)
+        with stage("lime_sample"):
+            samples = [self._sample(row, num_samples, rng) for row in data_rows]
+            stacked = np.vstack([inverse for _, inverse in samples])
+        with stage("lime_predict"):
+            yss = predict_fn(stacked)
+        with stage("lime_fit"):
+            return [
+                self._fit(
+                    row,
+                    binary,
+                    yss[k * num_samples : (k + 1) * num_samples],
+                    num_features,
+                    label,
+                )
+                for k, (row, (binary, _)) in enumerate(zip(data_rows, samples))
+            ]
+
+    def _fit(
+        self,
+        data_row: np.ndarray,
+        binary: np.ndarray,
+        yss: np.ndarray,
+        num_features: int,
+        label: int,
+    ) -> FastLimeExplanation:
+        """Kernel weights, feature selection and the local weighted ridge for one neighbourhood."""
+        labels_column = yss[:, label]
+
+        # Kernel weights: euclidean distance of each binary sample to the instance (all ones)
+        distances = np.sqrt((1.0 - binary).sum(axis=1))
+        weights = np.sqrt(np.exp(-(distances**2) / self.kernel_width**2))
+
+        # Feature selection: highest |coef| of a lightly regularized ridge on all features
+        if num_features >= binary.shape[1]:
+            used_features = np.arange(binary.shape[1])
+        else:
+            coef_all, _ = _weighted_ridge(binary, labels_column, weights, alpha=0.01)
+            used_features = np.argsort(-np.abs(coef_all), kind="stable")[:num_features]
+
+        X_used = binary[:, used_features]
+        coef, intercept = _weighted_ridge(X_used, labels_column, weights, alpha=1.0)
+        predictions = X_used @ coef + intercept
+        y_mean = weights @ labels_column / weights.sum()
+        total = weights @ (labels_column - y_mean) ** 2
+        score = 1.0 - (weights @ (labels_column - predictions) ** 2) / total if total > 0 else 0.0
+
+        names = self._condition_names(data_row)
+        order = np.argsort(-np.abs(coef), kind="stable")
+        return FastLimeExplanation(
+            exp=[(names[used_features[i]], float(coef[i])) for i in order],
+            intercept=float(intercept),
+            score=float(score),
+            local_pred=float(predictions[0]),
+            predict_proba=yss[0],
+            conditions=[self._condition(data_row, int(used_features[i]), float(coef[i])) for i in order],
+        )
+
+
+def build_lime_explainer(
+    training_data: np.ndarray,
+    feature_names: Sequence[str],
+    categorical_features: Sequence[int] = LIME_CATEGORICAL_FEATURES,
+    engine: str = LIME_ENGINE,
+) -> Union[FastLimeExplainer, lime.lime_tabular.LimeTabularExplainer]:
+    """
+    Build a LIME explainer over a (preprocessed) training set.
+    This computes the discretizer quartiles and training statistics, so it should be done once and reused.
+
+    Args:
+        training_data: np.ndarray
+            The preprocessed training data.
+        feature_names: Sequence[str]
+            The names of the preprocessed features.
+        categorical_features: Sequence[int]
+            The indices of the categorical (one-hot) features.
+        engine: str
+            "fast" for the in-house FastLimeExplainer, "lime" for lime's LimeTabularExplainer.
+    Returns:
+        explainer: FastLimeExplainer or lime.lime_tabular.LimeTabularExplainer
+    """
+    if engine == "fast":
+        return FastLimeExplainer(
+            training_data=training_data,
+            feature_names=feature_names,
+            categorical_features=categorical_features,
+        )
+    if engine != "lime":
+        raise ValueError(f"HMEQ_LIME_ENGINE must be 'fast' or 'lime', got {engine!r}")
+    return lime.lime_tabular.LimeTabularExplainer(
+        training_data=training_data,
+        feature_names=list(feature_names),
+        class_names=["Paid", "Default"],
+        mode="classification",
+        categorical_features=list(categorical_features),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _feature_processed_names() -> Tuple[str, ...]:
+    with open(os.path.join(PATH_ASSETS, "feature_preprocessed_names.json"), "r") as f:
+        return tuple(json.load(f))
+
+
+def build_default_explainer() -> Union[FastLimeExplainer, lime.lime_tabular.LimeTabularExplainer]:
+    """Explainer on the preprocessed training set, which is only read on first use (not at import)."""
+    return build_lime_explainer(
+        training_data=load_processed("X_train").values,
+        feature_names=list(_feature_processed_names()),
+    )
+
+
+def build_explainer_registry() -> Dict[str, Union[FastLimeExplainer, lime.lime_tabular.LimeTabularExplainer]]:
+    """
+    Build one explainer per training set / feature config. Called once at startup (see `lifespan` in app/main.py).
+    All pipelines currently share the same preprocessed training set, so there is a single "default" entry.
+    """
+    return {
+        DEFAULT_EXPLAINER: build_default_explainer(),
+    }
+
+
+def _explainer_for_request(
+    explainer: lime.lime_tabular.LimeTabularExplainer, random_state=None
+) -> lime.lime_tabular.LimeTabularExplainer:
+    """
+    Shallow copy of a shared explainer with its own RNG, so concurrent requests do not
+    share (and race on) the same RandomState. The training statistics are shared read-only.
+    """
+    rng = _own_random_state(random_state)
+    request_explainer = copy.copy(explainer)
+    request_explainer.random_state = rng
+    request_explainer.base = copy.copy(explainer.base)
+    request_explainer.base.random_state = rng
+    if explainer.discretizer is not None:
+        request_explainer.discretizer = copy.copy(explainer.discretizer)
+        request_explainer.discretizer.random_state = rng
+    return request_explainer
+
+
+def _lime_conditions(
+    explainer: lime.lime_tabular.LimeTabularExplainer, explanation, data_row: np.ndarray, label: int = 1
+) -> List[LimeCondition]:
+    """LimeCondition records of a lime Explanation, from the explainer's quartile discretizer."""
+    discretizer = explainer.discretizer
+    binned = discretizer.discretize(np.asarray(data_row, dtype=np.float64))
+    conditions = []
+    for f, weight in explanation.local_exp[label]:
+        name = explainer.feature_names[f]
+        if f in discretizer.names:
+            conditions.append(
+                _bin_condition(f, name, int(binned[f]), discretizer.mins[f], discretizer.maxs[f], float(weight))
+            )
+        else:
+            conditions.append(LimeCondition(f, name, "=", None, None, float(data_row[f]), float(weight)))
+    return conditions
 
 
 def lime_explain_instance(
-    pipeline: Pipeline, instance: np.ndarray
+    pipeline: Pipeline,
+    instance: np.ndarray,
+    explainer: Optional[Union[FastLimeExplainer, lime.lime_tabular.LimeTabularExplainer]] = None,
+    random_state: Optional[int] = None,
 ) -> lime.lime_tabular.LimeTabularExplainer:
     """
     Explain a single instance using LIME
@@ -27,28 +468,80 @@ def lime_explain_instance(
     Args:
         instance: np.ndarray
             The instance to explain. It should be an array of values, with the same features as the training data.
+        explainer: FastLimeExplainer or lime.lime_tabular.LimeTabularExplainer, optional
+            A prebuilt explainer (see `build_explainer_registry`). Built on the fly if not given.
+        random_state: int, optional
+            Seed for this request's perturbation sampling. If None, a fresh RNG is used.
     Returns:
-        lime_explanation: lime.lime_tabular.LimeTabularExplainer
-            The LIME explanation for the instance.
+        lime_explanation: lime Explanation or FastLimeExplanation
+            The LIME explanation for the instance (both support `.as_list()`).
     """
 
     def _predict_fn_lime(data_for_prediction):
         return pipeline.named_steps["model"].predict_proba(data_for_prediction)
 
-    explainer_lime = lime.lime_tabular.LimeTabularExplainer(
-        training_data=X_train_processed.values,
-        feature_names=feature_processed_names,
-        class_names=["Paid", "Default"],
-        mode="classification",
-        categorical_features=[10, 11, 12, 13, 14, 15, 16],
-    )
+    if explainer is None:
+        explainer = build_default_explainer()
 
-    # Get the explanation
-    lime_explanation_instance = explainer_lime.explain_instance(
-        data_row=instance,
-        predict_fn=_predict_fn_lime,
-        num_features=10,
-        labels=(1,),
-        num_samples=400,
-    )
+    if isinstance(explainer, FastLimeExplainer):
+        return explainer.explain_instance(
+            data_row=instance,
+            predict_fn=_predict_fn_lime,
+            num_features=LIME_NUM_FEATURES,
+            num_samples=LIME_NUM_SAMPLES,
+            random_state=random_state,
+        )
+
+    explainer_lime = _explainer_for_request(explainer, random_state=random_state)
+
+    # Get the explanation (lime samples, predicts and fits in one call, so it is timed as a single stage)
+    with stage("lime"):
+        lime_explanation_instance = explainer_lime.explain_instance(
+            data_row=instance,
+            predict_fn=_predict_fn_lime,
+            num_features=LIME_NUM_FEATURES,
+            labels=(1,),
+            num_samples=LIME_NUM_SAMPLES,
+        )
+    # Same attribute as FastLimeExplanation, so both engines feed the structured translation
+    lime_explanation_instance.conditions = _lime_conditions(explainer_lime, lime_explanation_instance, instance)
     return lime_explanation_instance
+
+
+def lime_explain_instances(
+    pipeline: Pipeline,
+    instances: np.ndarray,
+    explainer: Optional[Union[FastLimeExplainer, lime.lime_tabular.LimeTabularExplainer]] = None,
+    random_state: Optional[int] = None,
+) -> list:
+    """
+    Explain many instances using LIME. With the FastLimeExplainer the perturbation samples of all
+    instances are stacked into one `predict_proba` call; with lime's explainer they are explained one by one.
+
+    Args:
+        instances: np.ndarray
+            2d array of instances, with the same features as the training data.
+        explainer: FastLimeExplainer or lime.lime_tabular.LimeTabularExplainer, optional
+            A prebuilt explainer (see `build_explainer_registry`). Built on the fly if not given.
+        random_state: int, optional
+            Seed for the perturbation sampling of the whole batch.
+    Returns:
+        A list of explanations (supporting `.as_list()`), one per instance.
+    """
+    if explainer is None:
+        explainer = build_default_explainer()
+
+    if isinstance(explainer, FastLimeExplainer):
+        return explainer.explain_instances(
+            data_rows=instances,
+            predict_fn=pipeline.named_steps["model"].predict_proba,
+            num_features=LIME_NUM_FEATURES,
+            num_samples=LIME_NUM_SAMPLES,
+            random_state=random_state,
+        )
+
+    rng = _own_random_state(random_state)
+    return [
+        lime_explain_instance(pipeline, instance, explainer=explainer, random_state=rng)
+        for instance in instances
+    ]
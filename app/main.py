@@ -1,28 +1,101 @@
-from typing import Any, Dict
-from fastapi import FastAPI
+from typing import Any, Dict, List, Optional
+import asyncio
+from fastapi import FastAPI, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import numpy as np
 import pandas as pd
 import uvicorn
 
-from app.schemas import LoanApplicationRequest, AgentAdviceRequest
-from app.pipeline_utils import log_tf_feature_names, translate_lime_explanation
-from app.limestone import lime_explain_instance
-from app.agent.lime_agent import create_graph, LimeGraphMessage
+from app.schemas import LoanApplicationRequest, AgentAdviceRequest, ExplainBatchRequest
+from app.pipeline_utils import EXPLANATION_FORMAT, condition_tuples
+from app.limestone import (
+    LIME_ENGINE,
+    LIME_NUM_FEATURES,
+    LIME_NUM_SAMPLES,
+    build_explainer_registry,
+)
+from app.executors import (
+    LIME_WORKERS,
+    create_executors,
+    lime_explain_task,
+    lime_explain_batch_task,
+    ExecutorSaturated,
+)
+from app.batching import MICROBATCH_ENABLED, get_batcher
+from app.ensemble import ensemble_probability, predict_all_proba, preprocessor_key
+from app.cache import create_caches, make_key
+from app.registry import PIPELINE_PATHS, create_registry
+from app.explanation_index import open_explanation_indexes
+from app.datastore import load_processed
+from app.fast_preprocess import (
+    COMPILED_PREPROCESSOR_ENABLED,
+    compile_on_load,
+    model_predict_proba,
+    staged_predict_proba,
+    to_pipeline_input,
+    transform_features,
+)
+from app.tree_engine import flatten_on_load
+from app.neighbors import index_neighbors_on_load
+from app.batch import (
+    BATCH_CHUNK_SIZE,
+    EXPLAIN_CHUNK_SIZE,
+    EXPLAIN_MAX_INSTANCES,
+    parse_batch_body,
+    iter_chunks,
+    format_predictions_ndjson,
+)
+from app.agent.lime_agent import create_graph, LimeGraphMessage, ADVICE_CACHE
+from app.metrics import (
+    METRICS_ENABLED,
+    TimingMiddleware,
+    add_stages,
+    mark,
+    render_metrics,
+    run_timed,
+    stage,
+)
+from app.profiler import (
+    PROFILE_ENABLED,
+    ProfilingMiddleware,
+    add_worker_stacks,
+    list_profiles,
+    run_sampled,
+    sample_delay,
+)
 
 import os
 import json
 import joblib
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
 
 
-def log_tf_feature_names(transformer, feature_names):
-    return [f"{feature}_log" for feature in feature_names]
-
-
 # 1 --- BASIC SETUP
 lime_graph_app = None  # Initialize lime_graph_app globally
-PIPELINES = None
+PIPELINES = None  # ModelRegistry: pipeline name -> pipeline, loaded per HMEQ_MODEL_LOADING
+EXPLAINERS = None
+PREDICT_EXECUTOR = None  # thread pool for preprocessing / predict_proba
+LIME_EXECUTOR = None  # process (or thread) pool for LIME
+BATCHERS = {}  # pipeline name -> MicroBatcher, created on first use if HMEQ_MICROBATCH=1
+CACHES = {}  # "predict" / "explain" -> ResultCache, empty if HMEQ_CACHE=0
+EXPLANATION_INDEXES = {}  # pipeline name -> precomputed X_test explanations (app/explanation_index.py)
+X_test_processed = None  # preprocessed X_test, for the explain endpoints that take an instance index
+
+
+def _serving_pipeline(name: str, pipeline, registry):
+    """
+    ModelRegistry post_load hook: compiled preprocessing (HMEQ_COMPILED_PREPROCESSOR), then the faster
+    model, i.e. flattened trees (HMEQ_TREE_ENGINE) or the KNN neighbour index (HMEQ_KNN_BACKEND).
+    Also computes the pipeline's preprocessor key (see app/ensemble.py).
+    """
+    if COMPILED_PREPROCESSOR_ENABLED:
+        pipeline = compile_on_load(name, pipeline)
+    pipeline = index_neighbors_on_load(name, flatten_on_load(name, pipeline, registry))
+    # Hashed here, off the event loop, so /predict_all can group the pipelines by preprocessor for free
+    preprocessor_key(pipeline)
+    return pipeline
 
 
 @asynccontextmanager
@@ -31,22 +104,47 @@ async def lifespan(app: FastAPI):
     # Initialize the LIME Agent Graph
     global lime_graph_app
     global PIPELINES
+    global EXPLAINERS
+    global PREDICT_EXECUTOR
+    global LIME_EXECUTOR
+    global CACHES
+    global EXPLANATION_INDEXES
+    global X_test_processed
     print("INFO:     Compiling LIME Agent Graph...")  # Optional: for logging
     lime_graph_app = create_graph()
     print("INFO:     LIME Agent Graph compiled.")  # Optional: for logging
     # Load pipelines
-    PATH_PIPELINES = "/home/oreo/hmeq/app/assets/pipes"
-    PIPELINES = {
-        "rf": joblib.load(os.path.join(PATH_PIPELINES, "full_pipeline_rf.joblib")),
-        "knn": joblib.load(os.path.join(PATH_PIPELINES, "full_pipeline_knn.joblib")),
-        "gb": joblib.load(os.path.join(PATH_PIPELINES, "full_pipeline_gb.joblib")),
-        "dt": joblib.load(os.path.join(PATH_PIPELINES, "full_pipeline_dt.joblib")),
-        # "svm": joblib.load(os.path.join(PATH_PIPELINES, "full_pipeline_svm.joblib")),
-    }
+    pipeline_paths = PIPELINE_PATHS
+    # Loaded in parallel (or lazily, on first use) with the NumPy arrays memory-mapped.
+    # Pure-NumPy preprocessing and the faster models are swapped in on load, only where they match sklearn
+    PIPELINES = create_registry(pipeline_paths, post_load=_serving_pipeline)
+    # Build LIME explainers once (discretizer quartiles + training stats), reused by every explain request
+    print("INFO:     Building LIME explainers...")
+    EXPLAINERS = build_explainer_registry()
+    print("INFO:     LIME explainers built.")
+    # Read here rather than at import, so importing the app (workers, tooling) stays cheap
+    X_test_processed = load_processed("X_test")
+    # Executors, so CPU-bound work does not block the event loop
+    print("INFO:     Starting executors...")
+    PREDICT_EXECUTOR, LIME_EXECUTOR = create_executors(
+        PIPELINES, EXPLAINERS, pipeline_paths, PIPELINES.artifact_hashes()
+    )
+    print("INFO:     Executors started.")
+    if MICROBATCH_ENABLED:
+        print("INFO:     Micro-batching enabled for /predict.")
+    CACHES = create_caches("predict", "explain")
+    EXPLANATION_INDEXES = open_explanation_indexes(pipeline_paths)
+    if EXPLANATION_INDEXES:
+        print(f"INFO:     Serving X_test explanations from the index for {sorted(EXPLANATION_INDEXES)}.")
 
     yield  # divider
 
     # Run when app shuts down, for releasing resources
+    print("INFO:     Shutting down executors...")
+    PREDICT_EXECUTOR.shutdown()
+    LIME_EXECUTOR.shutdown()
+    for cache in CACHES.values():
+        cache.save()
     print("INFO:     Closing LIME Agent Graph...")  # Optional: for logging
 
 
@@ -69,6 +167,21 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+if METRICS_ENABLED:
+    # Per-request stage timings -> /metrics histograms (and Server-Timing if HMEQ_SERVER_TIMING=1)
+    app.add_middleware(TimingMiddleware)
+if PROFILE_ENABLED:
+    # Stack samples of requests slower than HMEQ_PROFILE_SLOW_MS, written as collapsed-stack files
+    app.add_middleware(ProfilingMiddleware)
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    # Back-pressure: reject instead of queueing unboundedly
+    return JSONResponse(
+        status_code=429, content={"error": str(exc)}, headers={"Retry-After": "1"}
+    )
+
+
 # Get feature names
 PATH_ASSETS = "/home/oreo/hmeq/app/assets"
 feature_names = json.load(
@@ -76,12 +189,27 @@ feature_names = json.load(
 )
 
 
-# Load X_test_processed for LIME explanations
-PATH_DATA_PROCESSED = "/home/oreo/hmeq/app/assets/data/processed"
-X_test_processed = pd.read_csv(os.path.join(PATH_DATA_PROCESSED, "X_test.csv"))
+# 2 --- API
+async def get_pipeline(pipeline_name: str):
+    """
+    The pipeline from the registry. With HMEQ_MODEL_LOADING=lazy the first call loads it
+    in the predict executor, so the event loop is not blocked while unpickling.
+    """
+    if PIPELINES.is_loaded(pipeline_name):
+        return PIPELINES[pipeline_name]
+    return await PREDICT_EXECUTOR.run(PIPELINES.__getitem__, pipeline_name)
 
 
-# 2 --- API
+async def run_lime_task(task, *args):
+    """
+    Run a LIME task (app/executors.py) on the LIME executor. The stage timings and, for slow requests,
+    the stack samples taken in the worker come back with the result and are added to this request.
+    In thread mode the request's own sampler already covers the LIME threads (see `track_thread`),
+    so they are not sampled a second time.
+    """
+    delay = sample_delay() if isinstance(LIME_EXECUTOR.executor, ProcessPoolExecutor) else None
+    result = await LIME_EXECUTOR.run(run_timed, run_sampled, delay, task, *args)
+    return add_worker_stacks(add_stages(result))
 
 
 @app.get("/")
@@ -102,24 +230,209 @@ async def predict(request: LoanApplicationRequest, pipeline_name: str):
     Returns:
         A dictionary containing the probability of default.
     """
+    mark("parse")
     # Convert input to DataFrame (as pipeline expects)
     if pipeline_name not in PIPELINES:
         return {"error": f"Pipeline {pipeline_name} not found."}
 
-    pipeline = PIPELINES[pipeline_name]
+    pipeline = await get_pipeline(pipeline_name)
     data_unpacked: Dict[str, Any] = request.model_dump(exclude_unset=True)
-    input_df = pd.DataFrame(data=[data_unpacked], columns=feature_names)
+
+    cache = CACHES.get("predict")
+    cache_key = make_key(pipeline_name, PIPELINES.artifact_hash(pipeline_name), request.model_dump())
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return {"probability_of_default": cached}
+
+    batcher = get_batcher(BATCHERS, pipeline_name, pipeline, PREDICT_EXECUTOR, feature_names)
+    if batcher is not None:
+        # Coalesced with concurrent requests into one predict_proba call (timed including the batching window)
+        with stage("inference"):
+            probas = await batcher.predict_proba(data_unpacked)
+    else:
+        with stage("dataframe"):
+            input_data = to_pipeline_input(pipeline, [data_unpacked], feature_names)
+        probas = (await PREDICT_EXECUTOR.run(staged_predict_proba, pipeline, input_data))[0]
 
     # Predict probability (get probability of class 1 == Default)
-    proba = pipeline.predict_proba(input_df)[0, 1]
-    print(f"INFO:     Probability of default: {pipeline.predict_proba(input_df)}")
+    proba = probas[1]
+    print(f"INFO:     Probability of default: {probas}")
+    if cache is not None:
+        cache.set(cache_key, proba)
     return {"probability_of_default": proba}
 
 
+@app.post("/predict_all")
+async def predict_all(
+    request: LoanApplicationRequest,
+    pipelines: Optional[List[str]] = Query(None),
+    ensemble: bool = False,
+):
+    """
+    Predict the probability of default for a loan application with several pipelines in one round trip.
+    The application is preprocessed once (the pipelines share the same fitted preprocessor) and the
+    models' predict_proba calls run concurrently in the predict executor.
+
+    Args:
+        request: LoanApplicationRequest
+            The loan application data to predict on.
+        pipelines: List[str], optional
+            The pipelines to use (repeat the query parameter, e.g. ?pipelines=rf&pipelines=gb). All of them by default.
+        ensemble: bool
+            Also return the ensemble score, the mean of the pipelines' probabilities.
+    Returns:
+        A dictionary with the probability of default per pipeline, and the ensemble probability if requested.
+    """
+    mark("parse")
+    pipeline_names = list(dict.fromkeys(pipelines)) if pipelines else list(PIPELINES)
+    unknown = [name for name in pipeline_names if name not in PIPELINES]
+    if unknown:
+        return {"error": f"Pipeline(s) {', '.join(unknown)} not found."}
+
+    data_unpacked: Dict[str, Any] = request.model_dump(exclude_unset=True)
+    # Same entries as /predict, so either endpoint reuses the other's results
+    cache = CACHES.get("predict")
+    cache_keys = {
+        name: make_key(name, PIPELINES.artifact_hash(name), request.model_dump()) for name in pipeline_names
+    }
+    probabilities: Dict[str, float] = {}
+    if cache is not None:
+        for name in pipeline_names:
+            cached = cache.get(cache_keys[name])
+            if cached is not None:
+                probabilities[name] = cached
+
+    missing = [name for name in pipeline_names if name not in probabilities]
+    if missing:
+        serving_pipelines = {name: await get_pipeline(name) for name in missing}
+        probas = await predict_all_proba(serving_pipelines, [data_unpacked], feature_names, PREDICT_EXECUTOR)
+        for name in missing:
+            probabilities[name] = probas[name][0][1]
+            if cache is not None:
+                cache.set(cache_keys[name], probabilities[name])
+
+    probabilities = {name: probabilities[name] for name in pipeline_names}
+    print(f"INFO:     Probabilities of default: {probabilities}")
+    response = {"probabilities_of_default": probabilities}
+    if ensemble:
+        response["ensemble_probability_of_default"] = ensemble_probability(probabilities)
+    return response
+
+
+@app.get("/stats/batching")
+async def batching_stats():
+    """
+    Micro-batching metrics (batch sizes, queueing delay) per pipeline. Empty if micro-batching is disabled.
+    """
+    return {name: batcher.stats() for name, batcher in BATCHERS.items()}
+
+
+@app.get("/stats/models")
+async def model_stats():
+    """
+    Load state and load time of each pipeline.
+    """
+    return PIPELINES.stats()
+
+
+@app.get("/stats/cache")
+async def cache_stats():
+    """
+    Hit/miss counters and size of the prediction, explanation and agent advice caches.
+    """
+    stats = {name: cache.stats() for name, cache in CACHES.items()}
+    stats["advice"] = ADVICE_CACHE.stats()
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Request latency and per-stage timing histograms (by route and pipeline) in the Prometheus text format.
+    Empty if HMEQ_METRICS=0.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats/profiles")
+async def profile_stats():
+    """
+    Stack profiles of slow requests on disk (HMEQ_PROFILE_DIR), newest first. Empty unless HMEQ_PROFILE_SLOW_MS is set.
+    """
+    return {"enabled": PROFILE_ENABLED, "profiles": list_profiles() if PROFILE_ENABLED else []}
+
+
+@app.post("/predict_batch/{pipeline_name}")
+async def predict_batch(
+    pipeline_name: str, request: Request, chunk_size: int = BATCH_CHUNK_SIZE
+):
+    """
+    Predict the probability of default for many loan applications in one request.
+    Each chunk of rows goes through one vectorized preprocessing + predict_proba call,
+    and results are streamed back as NDJSON lines: {"index": int, "probability_of_default": float}.
+
+    Args:
+        pipeline_name: str
+            The name of the pipeline to use for prediction (e.g., "rf", "knn", "gb", "dt").
+        request: Request
+            The body is a JSON array of LoanApplicationRequest (application/json),
+            one application per line (application/x-ndjson), or a CSV with a header row (text/csv).
+        chunk_size: int
+            Number of rows per predict_proba call.
+    Returns:
+        A streaming NDJSON response, or an error message if the pipeline or payload is invalid.
+    """
+    if pipeline_name not in PIPELINES:
+        return {"error": f"Pipeline {pipeline_name} not found."}
+    if chunk_size < 1:
+        return {"error": "chunk_size must be a positive integer."}
+
+    pipeline = await get_pipeline(pipeline_name)
+    try:
+        with stage("parse"):
+            body = await request.body()
+            input_df = await PREDICT_EXECUTOR.run(
+                parse_batch_body,
+                body,
+                request.headers.get("content-type", ""),
+                feature_names,
+            )
+    except ValueError as e:
+        return {"error": f"Invalid batch payload: {str(e)}"}
+
+    chunks = iter_chunks(input_df, chunk_size)
+    # Score the first chunk before streaming, so a saturated executor still maps to a 429
+    first_chunk = next(chunks)
+    try:
+        first_probas = await PREDICT_EXECUTOR.run(staged_predict_proba, pipeline, first_chunk)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        return {"error": f"Error scoring rows from 0: {str(e)}"}
+    print(f"INFO:     Scoring batch of {len(input_df)} applications with {pipeline_name}")
+
+    async def stream_predictions():
+        yield format_predictions_ndjson(0, first_probas[:, 1])
+        start = len(first_chunk)
+        for chunk in chunks:
+            try:
+                probas = await PREDICT_EXECUTOR.run(staged_predict_proba, pipeline, chunk)
+            except Exception as e:
+                yield json.dumps({"error": f"Error scoring rows from {start}: {str(e)}"}) + "\n"
+                return
+            yield format_predictions_ndjson(start, probas[:, 1])
+            start += len(chunk)
+
+    return StreamingResponse(stream_predictions(), media_type="application/x-ndjson")
+
+
 # 3 --- LIME EXPLANATION ENDPOINT ---
 # Explain an instance from X_test
 @app.get("/explain/{pipeline_name}/{instance_index}")
-async def explain_instance(pipeline_name: str, instance_index: int):
+async def explain_instance(
+    pipeline_name: str, instance_index: int, random_state: Optional[int] = None
+):
     """
     Explain a specific instance from the test set using LIME.
 
@@ -128,43 +441,59 @@ async def explain_instance(pipeline_name: str, instance_index: int):
             The name of the pipeline to use for explanation (e.g., "rf", "knn", "gb", "dt").
         instance_index: int
             The index of the instance in the test set to explain.
+        random_state: int, optional
+            Seed for LIME's perturbation sampling, for reproducible explanations.
+            Without it the explanation is served from the precomputed index when there is one.
     Returns:
-        A dictionary containing the LIME explanation for the specified instance.
+        A dictionary containing the LIME explanation for the specified instance, as (condition, weight) pairs
+        in "lime_explanation" and as structured condition records in "lime_conditions".
         If the pipeline or instance index is invalid, an error message is returned.
     """
+    mark("parse")
     if pipeline_name not in PIPELINES:
         return {"error": f"Pipeline {pipeline_name} not found."}
 
-    pipeline = PIPELINES[pipeline_name]
-
     if instance_index < 0 or instance_index >= len(X_test_processed):
         return {
             "error": f"Instance index {instance_index} is out of bounds for X_test_processed (length {len(X_test_processed)})."
         }
 
+    if random_state is None and pipeline_name in EXPLANATION_INDEXES:
+        # Precomputed offline for this artifact and LIME settings
+        conditions = EXPLANATION_INDEXES[pipeline_name].lookup(instance_index)["lime_conditions"]
+        return {
+            "pipeline_name": pipeline_name,
+            "instance_index": instance_index,
+            "lime_explanation": condition_tuples(conditions),
+            "lime_conditions": conditions,
+        }
+
     instance_to_explain = X_test_processed.iloc[[instance_index]].values[0]
 
     try:
-        lime_explanation_raw = lime_explain_instance(
-            pipeline=pipeline,
-            instance=instance_to_explain,
-        )
-        translated_explanation = translate_lime_explanation(
-            lime_explanation_raw.as_list(), pipeline
+        conditions = await run_lime_task(
+            lime_explain_task, pipeline_name, instance_to_explain, random_state
         )
         return {
             "pipeline_name": pipeline_name,
             "instance_index": instance_index,
-            "lime_explanation": translated_explanation,
+            "lime_explanation": condition_tuples(conditions),
+            "lime_conditions": conditions,
         }
 
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         return {"error": f"Error generating LIME explanation: {str(e)}"}
 
 
 # Explain user-input instance
 @app.post("/explain_custom_instance/{pipeline_name}")
-async def explain_custom_instance(pipeline_name: str, request: LoanApplicationRequest):
+async def explain_custom_instance(
+    pipeline_name: str,
+    request: LoanApplicationRequest,
+    random_state: Optional[int] = None,
+):
     """
     Explain a custom instance using LIME. This is what is used for the actual app.
 
@@ -173,26 +502,54 @@ async def explain_custom_instance(pipeline_name: str, request: LoanApplicationRe
             The name of the pipeline to use for explanation (e.g., "rf", "knn", "gb", "dt").
         request: LoanApplicationRequest
             The custom loan application data to explain.
+        random_state: int, optional
+            Seed for LIME's perturbation sampling, for reproducible explanations.
     Returns:
-        A dictionary containing the LIME explanation for the custom instance.
+        A dictionary containing the LIME explanation for the custom instance ("lime_explanation" pairs
+        and "lime_conditions" records, as for /explain).
         If the pipeline is invalid or an error occurs, an error message is returned.
     """
+    mark("parse")
     if pipeline_name not in PIPELINES:
         return {"error": f"Pipeline {pipeline_name} not found."}
 
-    pipeline = PIPELINES[pipeline_name]
+    pipeline = await get_pipeline(pipeline_name)
 
     # Convert input to DataFrame (as pipeline expects)
     data_unpacked: Dict[str, Any] = request.model_dump(exclude_unset=True)
-    input_df = pd.DataFrame(data=[data_unpacked], columns=feature_names)
+
+    cache = CACHES.get("explain")
+    cache_key = make_key(
+        pipeline_name,
+        PIPELINES.artifact_hash(pipeline_name),
+        request.model_dump(),
+        random_state,
+        LIME_ENGINE,
+        LIME_NUM_SAMPLES,
+        LIME_NUM_FEATURES,
+        EXPLANATION_FORMAT,
+    )
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return {
+                "pipeline_name": pipeline_name,
+                "input_data": data_unpacked,
+                "lime_explanation": condition_tuples(cached),
+                "lime_conditions": cached,
+            }
+
+    with stage("dataframe"):
+        input_data = to_pipeline_input(pipeline, [data_unpacked], feature_names)
 
     try:
         # Preprocess the input instance using the pipeline's preprocessor
         if "preprocessor" not in pipeline.named_steps:
             return {"error": "Preprocessor step not found in the pipeline."}
 
-        preprocessor = pipeline.named_steps["preprocessor"]
-        processed_instance_df = preprocessor.transform(input_df)
+        processed_instance_df = await PREDICT_EXECUTOR.run(
+            transform_features, pipeline, input_data
+        )
 
         # Ensure the processed_instance is a 1D numpy array as expected by lime_explain_instance
         if isinstance(processed_instance_df, pd.DataFrame):
@@ -209,19 +566,20 @@ async def explain_custom_instance(pipeline_name: str, request: LoanApplicationRe
                 "error": "Processed instance is not in the expected format (DataFrame or ndarray)."
             }
 
-        lime_explanation_raw = lime_explain_instance(
-            pipeline=pipeline,  # Pass the full pipeline
-            instance=instance_to_explain_np,
-        )
-        translated_explanation = translate_lime_explanation(
-            lime_explanation_raw.as_list(),
-            pipeline,  # Pass the full pipeline for translation context
+        # LIME + translation run in the LIME executor (worker has its own copy of the pipeline)
+        conditions = await run_lime_task(
+            lime_explain_task, pipeline_name, instance_to_explain_np, random_state
         )
+        if cache is not None:
+            cache.set(cache_key, conditions)
         return {
             "pipeline_name": pipeline_name,
             "input_data": data_unpacked,
-            "lime_explanation": translated_explanation,
+            "lime_explanation": condition_tuples(conditions),
+            "lime_conditions": conditions,
         }
+    except ExecutorSaturated:
+        raise
     except AttributeError as e:
         # Catching cases where .values might be called on non-DataFrame, or named_steps issues
         return {
@@ -233,6 +591,135 @@ async def explain_custom_instance(pipeline_name: str, request: LoanApplicationRe
         }
 
 
+# Explain many instances (test set rows or custom applications)
+@app.post("/explain_batch/{pipeline_name}")
+async def explain_batch(
+    pipeline_name: str,
+    request: ExplainBatchRequest,
+    chunk_size: int = EXPLAIN_CHUNK_SIZE,
+):
+    """
+    Explain many instances using LIME. The perturbation samples of each chunk of instances are scored
+    in one predict_proba call, chunks run in parallel on the LIME executor, and the explanations are
+    streamed back in order as NDJSON lines:
+    {"instance_index" (or "position"): int, "lime_explanation": [...], "lime_conditions": [...]}.
+
+    Args:
+        pipeline_name: str
+            The name of the pipeline to use for explanation (e.g., "rf", "knn", "gb", "dt").
+        request: ExplainBatchRequest
+            Exactly one of `instance_indices`, a `start`/`stop` range of X_test indices, or `applications`.
+            `random_state` makes the whole batch reproducible.
+        chunk_size: int
+            Number of instances per LIME task.
+    Returns:
+        A streaming NDJSON response, or an error message if the pipeline or request is invalid.
+    """
+    mark("parse")
+    if pipeline_name not in PIPELINES:
+        return {"error": f"Pipeline {pipeline_name} not found."}
+    if chunk_size < 1:
+        return {"error": "chunk_size must be a positive integer."}
+
+    has_range = request.start is not None or request.stop is not None
+    modes = [request.instance_indices is not None, has_range, request.applications is not None]
+    if sum(modes) != 1:
+        return {"error": "Provide exactly one of instance_indices, start/stop or applications."}
+
+    pipeline = await get_pipeline(pipeline_name)
+    if request.applications is not None:
+        if not request.applications:
+            return {"error": "applications is empty."}
+        if len(request.applications) > EXPLAIN_MAX_INSTANCES:
+            return {"error": f"{len(request.applications)} applications, the maximum is {EXPLAIN_MAX_INSTANCES}."}
+        key = "position"
+        ids = list(range(len(request.applications)))
+        with stage("dataframe"):
+            input_data = to_pipeline_input(
+                pipeline,
+                [application.model_dump() for application in request.applications],
+                feature_names,
+            )
+        try:
+            processed = await PREDICT_EXECUTOR.run(transform_features, pipeline, input_data)
+        except ExecutorSaturated:
+            raise
+        except Exception as e:
+            return {"error": f"Error during preprocessing: {str(e)}"}
+        instances = np.asarray(processed, dtype=np.float64)
+    else:
+        key = "instance_index"
+        if has_range:
+            start = 0 if request.start is None else request.start
+            stop = len(X_test_processed) if request.stop is None else request.stop
+            # Checked before anything is built from the client's bounds
+            if not 0 <= start < stop <= len(X_test_processed):
+                return {
+                    "error": f"Range [{start}, {stop}) must satisfy 0 <= start < stop <= {len(X_test_processed)} (length of X_test_processed)."
+                }
+            ids = np.arange(start, stop)
+        else:
+            if not request.instance_indices:
+                return {"error": "No instances selected."}
+            if len(request.instance_indices) > EXPLAIN_MAX_INSTANCES:
+                return {"error": f"{len(request.instance_indices)} instance indices, the maximum is {EXPLAIN_MAX_INSTANCES}."}
+            ids = np.asarray(request.instance_indices)
+            out_of_bounds = ids[(ids < 0) | (ids >= len(X_test_processed))]
+            if len(out_of_bounds):
+                return {
+                    "error": f"Instance indices {out_of_bounds[:10].tolist()} are out of bounds for X_test_processed (length {len(X_test_processed)})."
+                }
+        instances = X_test_processed.values[ids]
+
+    def submit(offset: int) -> asyncio.Task:
+        # Per-chunk seeds derived from the request seed, so results do not depend on chunking order
+        seed = None if request.random_state is None else request.random_state + offset
+        return asyncio.ensure_future(
+            run_lime_task(
+                lime_explain_batch_task,
+                pipeline_name,
+                instances[offset : offset + chunk_size],
+                seed,
+            )
+        )
+
+    offsets = list(range(0, len(ids), chunk_size))
+    # Keep one chunk per LIME worker in flight; the first one is awaited before streaming
+    # so a saturated executor still maps to a 429
+    in_flight = [submit(offset) for offset in offsets[:LIME_WORKERS]]
+    try:
+        first_explanations = await in_flight[0]
+    except Exception as e:
+        for task in in_flight[1:]:
+            task.cancel()
+        if isinstance(e, ExecutorSaturated):
+            raise
+        return {"error": f"Error explaining instances from 0: {str(e)}"}
+    print(f"INFO:     Explaining batch of {len(ids)} instances with {pipeline_name}")
+
+    async def stream_explanations():
+        next_offset = LIME_WORKERS
+        try:
+            for k, offset in enumerate(offsets):
+                try:
+                    explanations = first_explanations if k == 0 else await in_flight[k]
+                except Exception as e:
+                    yield json.dumps({"error": f"Error explaining instances from {offset}: {str(e)}"}) + "\n"
+                    return
+                if next_offset < len(offsets):
+                    in_flight.append(submit(offsets[next_offset]))
+                    next_offset += 1
+                for i, conditions in zip(ids[offset : offset + chunk_size], explanations):
+                    yield json.dumps(
+                        {key: int(i), "lime_explanation": condition_tuples(conditions), "lime_conditions": conditions}
+                    ) + "\n"
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    return StreamingResponse(stream_explanations(), media_type="application/x-ndjson")
+
+
 # 4 --- AGENT ADVICE ENDPOINT ---
 @app.post("/agent/advice")
 async def get_agent_advice(request: AgentAdviceRequest):
@@ -244,6 +731,7 @@ async def get_agent_advice(request: AgentAdviceRequest):
     Returns:
         A dictionary containing the agent's interpretation and financial advice.
     """
+    mark("parse")
     if lime_graph_app is None:
         # This should ideally not happen if startup event worked
         return {"error": "Agent graph not initialized. Please try again shortly."}
@@ -268,5 +756,200 @@ async def get_agent_advice(request: AgentAdviceRequest):
         return {"error": f"Error generating agent advice: {str(e)}"}
 
 
+@app.post("/agent/advice/stream")
+async def stream_agent_advice(request: AgentAdviceRequest):
+    """
+    Streaming variant of /agent/advice: the interpretation and the advice are sent as they are generated.
+    Args:
+        request: AgentAdviceRequest
+            The request containing LIME explanations and default probability. Follows the schema defined in app/schemas.py.
+    Returns:
+        A streaming NDJSON response: {"field": "agent_interpretation" | "financial_advice", "delta": str} lines,
+        then a final {"done": true, "agent_interpretation": str, "financial_advice": str} line
+        (or an {"error": str} line if generation fails).
+    """
+    mark("parse")
+    if lime_graph_app is None:
+        return {"error": "Agent graph not initialized. Please try again shortly."}
+
+    graph_input = LimeGraphMessage(
+        default_probability=request.default_probability,
+        lime_explanations=request.lime_explanations,
+    )
+
+    async def stream_advice():
+        async for event in iter_advice(graph_input):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(stream_advice(), media_type="application/x-ndjson")
+
+
+async def iter_advice(graph_input: LimeGraphMessage):
+    """
+    Run the LIME agent graph, yielding the {"field", "delta"} chunks as they are generated, then a final
+    {"done": True, "agent_interpretation", "financial_advice"} (or {"error"} if generation fails).
+    """
+    final_state = {}
+    try:
+        async for mode, chunk in lime_graph_app.astream(
+            graph_input, stream_mode=["custom", "values"]
+        ):
+            if mode == "custom":
+                yield chunk
+            else:
+                final_state = chunk
+    except Exception as e:
+        print(f"Error during agent advice generation: {str(e)}")
+        yield {"error": f"Error generating agent advice: {str(e)}"}
+        return
+    yield {
+        "done": True,
+        "agent_interpretation": final_state.get("agent_response_lime"),
+        "financial_advice": final_state.get("agent_response_advice"),
+    }
+
+
+# 5 --- COMBINED ASSESSMENT ENDPOINT ---
+# What the frontend does in three calls (/predict, /explain_custom_instance, /agent/advice), in one
+@app.post("/assess/{pipeline_name}")
+async def assess(
+    pipeline_name: str,
+    request: LoanApplicationRequest,
+    random_state: Optional[int] = None,
+    advice: bool = False,
+):
+    """
+    Predict, explain and (optionally) advise on a loan application in one request. The application is
+    preprocessed once; the probability and the LIME explanation are computed concurrently from the same
+    preprocessed row, and the agent starts as soon as both are ready. The parts are streamed as NDJSON lines
+    as they complete:
+    {"part": "prediction", "probability_of_default": float},
+    {"part": "explanation", "lime_explanation": [...], "lime_conditions": [...]},
+    then with `advice=true` the /agent/advice/stream lines tagged with "part": "advice".
+    A part that fails is sent as {"part": ..., "error": str}, and the advice is skipped.
+
+    Args:
+        pipeline_name: str
+            The name of the pipeline to use (e.g., "rf", "knn", "gb", "dt").
+        request: LoanApplicationRequest
+            The loan application data to assess.
+        random_state: int, optional
+            Seed for LIME's perturbation sampling, for reproducible explanations.
+        advice: bool
+            Also generate the agent's interpretation and financial advice.
+    Returns:
+        A streaming NDJSON response, or an error message if the pipeline or the application is invalid.
+    """
+    mark("parse")
+    if pipeline_name not in PIPELINES:
+        return {"error": f"Pipeline {pipeline_name} not found."}
+    if advice and lime_graph_app is None:
+        return {"error": "Agent graph not initialized. Please try again shortly."}
+
+    pipeline = await get_pipeline(pipeline_name)
+    data_unpacked: Dict[str, Any] = request.model_dump(exclude_unset=True)
+
+    # Same entries as /predict and /explain_custom_instance
+    predict_cache = CACHES.get("predict")
+    explain_cache = CACHES.get("explain")
+    artifact_hash = PIPELINES.artifact_hash(pipeline_name)
+    predict_key = make_key(pipeline_name, artifact_hash, request.model_dump())
+    explain_key = make_key(
+        pipeline_name,
+        artifact_hash,
+        request.model_dump(),
+        random_state,
+        LIME_ENGINE,
+        LIME_NUM_SAMPLES,
+        LIME_NUM_FEATURES,
+        EXPLANATION_FORMAT,
+    )
+    cached_proba = predict_cache.get(predict_key) if predict_cache is not None else None
+    cached_conditions = explain_cache.get(explain_key) if explain_cache is not None else None
+
+    processed_instance = None
+    if cached_proba is None or cached_conditions is None:
+        with stage("dataframe"):
+            input_data = to_pipeline_input(pipeline, [data_unpacked], feature_names)
+        try:
+            processed_instance = await PREDICT_EXECUTOR.run(transform_features, pipeline, input_data)
+        except ExecutorSaturated:
+            raise
+        except Exception as e:
+            return {"error": f"Error during preprocessing: {str(e)}"}
+
+    async def predict_part():
+        if cached_proba is not None:
+            return cached_proba
+        proba = (await PREDICT_EXECUTOR.run(model_predict_proba, pipeline, processed_instance))[0][1]
+        if predict_cache is not None:
+            predict_cache.set(predict_key, proba)
+        return proba
+
+    async def explain_part():
+        if cached_conditions is not None:
+            return cached_conditions
+        instance = np.asarray(processed_instance, dtype=np.float64)[0]
+        conditions = await run_lime_task(lime_explain_task, pipeline_name, instance, random_state)
+        if explain_cache is not None:
+            explain_cache.set(explain_key, conditions)
+        return conditions
+
+    predict_task = asyncio.ensure_future(predict_part())
+    explain_task = asyncio.ensure_future(explain_part())
+    parts = {predict_task: "prediction", explain_task: "explanation"}
+    # Wait for the probability before streaming (the LIME job has been submitted by then),
+    # so a saturated executor still maps to a 429
+    await asyncio.wait([predict_task])
+    for task in parts:
+        if task.done() and isinstance(task.exception(), ExecutorSaturated):
+            for other in parts:
+                other.cancel()
+            raise task.exception()
+
+    async def stream_assessment():
+        results = {}
+        pending = set(parts)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Parts finished together are sent in the documented order (prediction first)
+                for task in [task for task in parts if task in done]:
+                    part = parts[task]
+                    try:
+                        results[part] = task.result()
+                    except Exception as e:
+                        yield json.dumps({"part": part, "error": f"Error computing the {part}: {str(e)}"}) + "\n"
+                        continue
+                    if part == "prediction":
+                        yield json.dumps({"part": part, "probability_of_default": float(results[part])}) + "\n"
+                    else:
+                        yield json.dumps(
+                            {
+                                "part": part,
+                                "lime_explanation": condition_tuples(results[part]),
+                                "lime_conditions": results[part],
+                            }
+                        ) + "\n"
+        finally:
+            for task in parts:
+                task.cancel()
+
+        if not advice:
+            return
+        if len(results) < len(parts):
+            yield json.dumps({"part": "advice", "error": "Skipped, as the prediction or the explanation failed."}) + "\n"
+            return
+        graph_input = LimeGraphMessage(
+            default_probability=float(results["prediction"]),
+            lime_explanations=condition_tuples(results["explanation"]),
+        )
+        async for event in iter_advice(graph_input):
+            yield json.dumps({"part": "advice", **event}) + "\n"
+
+    print(f"INFO:     Assessing an application with {pipeline_name}")
+    return StreamingResponse(stream_assessment(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,204 @@
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.registry import PIPELINE_PATHS
+
+
+# --- Configuration (env vars) ---
+METRICS_ENABLED = os.getenv("HMEQ_METRICS", "1") == "1"
+# Opt-in: attach the stage timings of each request as a Server-Timing response header
+SERVER_TIMING_ENABLED = os.getenv("HMEQ_SERVER_TIMING", "0") == "1"
+# Histogram bucket upper bounds, in seconds
+METRICS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+class RequestTimings:
+    """
+    Stage durations of one request, as (stage, seconds) in the order they finished.
+    A stage can occur several times (e.g. one "lime_sample" per /explain_batch chunk); they add up.
+    Appended to from executor threads too (list.append is atomic), read by the middleware at the end.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.stages: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float):
+        self.stages.append((stage, seconds))
+
+    def totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for stage, seconds in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+
+# Timings of the request being handled. Set by TimingMiddleware, copied into predict executor threads
+# (see BoundedExecutor.run) and set per task in worker processes by `run_timed`
+_REQUEST_TIMINGS: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the enclosed block as stage `name` of the current request (no-op outside a request)."""
+    timings = _REQUEST_TIMINGS.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def mark(name: str):
+    """Record the time since the request started (or since the previous mark) as stage `name`."""
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None:
+        now = time.perf_counter()
+        timings.add(name, now - timings.last_mark)
+        timings.last_mark = now
+
+
+def run_timed(fn: Callable, *args, **kwargs) -> Tuple[Any, List[Tuple[str, float]]]:
+    """
+    Executor wrapper for work that runs outside the request's context (LIME worker processes):
+    call `fn` with its own RequestTimings and return its stages with the result, for `add_stages`.
+    """
+    timings = RequestTimings()
+    token = _REQUEST_TIMINGS.set(timings)
+    try:
+        return fn(*args, **kwargs), timings.stages
+    finally:
+        _REQUEST_TIMINGS.reset(token)
+
+
+def add_stages(timed_result: Tuple[Any, List[Tuple[str, float]]]) -> Any:
+    """Add the stages returned by `run_timed` to the current request and return the result."""
+    result, stages = timed_result
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None:
+        timings.stages.extend(stages)
+    return result
+
+
+# --- Prometheus histograms ---
+class Histogram:
+    """
+    Cumulative histogram per label combination, rendered in the Prometheus text format.
+    Only observed from the event loop thread (TimingMiddleware), so no lock is needed.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str], buckets=METRICS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, labels: Sequence[str], value: float):
+        series = self._series.get(tuple(labels))
+        if series is None:
+            series = self._series[tuple(labels)] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            label_str = ",".join(
+                f'{name}="{_escape_label(value)}"' for name, value in zip(self.label_names, labels)
+            )
+            prefix = f"{label_str}," if label_str else ""
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_str}}} {total}")
+            lines.append(f"{self.name}_count{{{label_str}}} {cumulative}")
+        return lines
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "hmeq_request_duration_seconds",
+    "End-to-end request latency (streamed responses until the last chunk).",
+    ("endpoint", "method", "status", "pipeline"),
+)
+STAGE_SECONDS = Histogram(
+    "hmeq_stage_duration_seconds",
+    "Time spent per request in each stage (parse, dataframe, preprocess, inference, lime_*, translation, llm).",
+    ("stage", "pipeline"),
+)
+
+
+def render_metrics() -> str:
+    """All histograms in the Prometheus text exposition format (served on /metrics)."""
+    return "\n".join([*REQUEST_SECONDS.render(), *STAGE_SECONDS.render()]) + "\n"
+
+
+def server_timing_header(timings: RequestTimings) -> str:
+    """Server-Timing value of the stages recorded so far, plus the elapsed total, in milliseconds."""
+    entries = [f"{name};dur={1000 * seconds:.2f}" for name, seconds in timings.totals().items()]
+    entries.append(f"total;dur={1000 * (time.perf_counter() - timings.started):.2f}")
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware that gives each HTTP request a RequestTimings, then observes the request latency
+    and the per-stage totals, labelled by route and pipeline (the `pipeline_name` path parameter, or "unknown"
+    if it is not a configured pipeline).
+    With HMEQ_SERVER_TIMING=1 the stages recorded before the response starts are sent as a Server-Timing
+    header (for streamed responses, the stages of later chunks only reach the histograms).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _REQUEST_TIMINGS.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _REQUEST_TIMINGS.reset(token)
+            # Filled in by the router: label by route template, not raw path, to bound the cardinality
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            pipeline = str(scope.get("path_params", {}).get("pipeline_name", ""))
+            if pipeline and pipeline not in PIPELINE_PATHS:
+                pipeline = "unknown"
+            REQUEST_SECONDS.observe(
+                (endpoint, scope["method"], str(status), pipeline), time.perf_counter() - timings.started
+            )
+            for name, seconds in timings.totals().items():
+                STAGE_SECONDS.observe((name, pipeline), seconds)
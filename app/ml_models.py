@@ -12,59 +12,39 @@ from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
 from sklearn.svm import SVC
 from sklearn.tree import DecisionTreeClassifier
 
-import lime
-import lime.lime_tabular
-
+import functools
 import os
 import joblib
 import json
+from typing import Optional
 
 from app.pipeline_utils import log_tf_feature_names  # <--- IMPORT HERE
 
-# --- Get X_train ready for LIME ---
-PATH_DATA_PROCESSED = "/home/oreo/hmeq/app/assets/data/processed"
-X_train_processed = pd.read_csv(os.path.join(PATH_DATA_PROCESSED, "X_train.csv"))
-
-# --- Setting up LIME ---
-PATH_ASSETS = "/home/oreo/hmeq/app/assets"
-feature_processed_names = json.load(
-    open(os.path.join(PATH_ASSETS, "feature_preprocessed_names.json"), "r")
-)
 
+@functools.lru_cache(maxsize=None)
+def _explainer_lime():
+    from app.limestone import build_default_explainer
 
-explainer_lime = lime.lime_tabular.LimeTabularExplainer(
-    training_data=X_train_processed.values,
-    feature_names=feature_processed_names,
-    class_names=["Paid", "Default"],
-    mode="classification",
-    categorical_features=[10, 11, 12, 13, 14, 15, 16],
-)
+    return build_default_explainer()
 
 
-def lime_explain_instance(
-    pipeline: Pipeline, instance: np.ndarray
-) -> lime.lime_tabular.LimeTabularExplainer:
+def lime_explain_instance(pipeline: Pipeline, instance: np.ndarray):
     """
     Explain a single instance using LIME
 
+    Kept for scripts that import it from here: delegates to app.limestone, with an explainer
+    built (and X_train read) on the first call instead of at import.
+
     Args:
         instance: np.ndarray
             The instance to explain. It should be an array of values, with the same features as the training data.
     Returns:
-        lime_explanation: lime.lime_tabular.LimeTabularExplainer
+        lime_explanation: lime Explanation or FastLimeExplanation
             The LIME explanation for the instance.
     """
+    from app.limestone import lime_explain_instance as _lime_explain_instance
 
-    def _predict_fn_lime(data_for_prediction):
-        return pipeline.named_steps["model"].predict_proba(data_for_prediction)
-
-    # Get the explanation
-    lime_explanation = explainer_lime.explain_instance(
-        data_row=instance,
-        predict_fn=_predict_fn_lime,
-        num_features=10,
-    )
-    return lime_explanation
+    return _lime_explain_instance(pipeline=pipeline, instance=instance, explainer=_explainer_lime())
 
 
 # --- PIPELINEs
@@ -133,82 +113,41 @@ preprocessing_pipeline = Pipeline(
 )
 preprocessing_pipeline.set_output(transform="pandas")
 
+
+# --- MODELS
+MODEL_NAMES = ["dt", "rf", "gb", "knn"]
+
+
+def build_estimator(name: str, n_jobs: Optional[int] = None):
+    """
+    Unfitted estimator with the production hyperparameters.
+
+    Args:
+        name: str
+            "dt", "rf", "gb" or "knn".
+        n_jobs: int, optional
+            Cores for estimators that support it (RandomForest).
+    """
+    if name == "dt":
+        return DecisionTreeClassifier(class_weight='balanced', random_state=13,
+                                      criterion='gini', max_depth=10, max_features='sqrt',
+                                      min_samples_split=30, min_samples_leaf=10)
+    if name == "rf":
+        return RandomForestClassifier(random_state=13, class_weight='balanced',
+                                      criterion='entropy', max_features='sqrt',
+                                      max_samples=None, n_estimators=200, n_jobs=n_jobs)
+    if name == "gb":
+        return GradientBoostingClassifier(random_state=13, n_estimators=600,
+                                          max_depth=6, subsample=0.3, learning_rate=0.1)
+    if name == "knn":
+        return KNeighborsClassifier(n_neighbors=1, p=1, algorithm='ball_tree', weights='uniform')
+    raise ValueError(f"Unknown model {name!r}, expected one of {MODEL_NAMES}")
+
+
 if __name__ == "__main__":
     """
-    This script is used to fit the pipelines and dump them to the assets folder.
-    ONLY RUN THIS ONCE TO FIT THE PIPELINES.
+    Fit the pipelines and dump them to the assets folder (see app/train.py for the options).
     """
-    DATA_PATH_CLEANED = "/home/oreo/hmeq/app/assets/data/cleaned"
-    X_train = pd.read_csv(os.path.join(DATA_PATH_CLEANED, "X_train.csv"))
-    X_test = pd.read_csv(os.path.join(DATA_PATH_CLEANED, "X_test.csv"))
-
-    X_train_processed = preprocessing_pipeline.fit_transform(X_train)
-
-    DATA_PATH_RESAMPLED = "/home/oreo/hmeq/app/assets/data/processed"
-    X_train_resampled = pd.read_csv(os.path.join(DATA_PATH_RESAMPLED, "X_train.csv"))
-    y_train_resampled = pd.read_csv(os.path.join(DATA_PATH_RESAMPLED, "y_train.csv"))
-
-
-    # ----- DecisionTree
-    print("Fitting DecisionTree")
-    dt = DecisionTreeClassifier(class_weight='balanced', random_state=13,
-                                criterion='gini', max_depth=10, max_features='sqrt',
-                                min_samples_split=30, min_samples_leaf=10)
-    dt.fit(X_train_resampled, y_train_resampled.values.ravel())
-
-    # ----- RandomForest
-    print("Fitting RandomForest")
-    rf = RandomForestClassifier(random_state=13, class_weight='balanced',
-                                criterion='entropy', max_features='sqrt',
-                                max_samples=None, n_estimators=200)
-    rf.fit(X_train_resampled, y_train_resampled.values.ravel())
-
-    # ----- GradientBoosting
-    print("Fitting GradientBoosting")
-    gb = GradientBoostingClassifier(random_state=13, n_estimators=600,
-                                    max_depth=6, subsample=0.3, learning_rate=0.1)
-    gb.fit(X_train_resampled, y_train_resampled.values.ravel())
-
-    # ----- KNN
-    print("Fitting KNN")
-    knn = KNeighborsClassifier(n_neighbors=1, p=1, algorithm='ball_tree', weights='uniform')
-    knn.fit(X_train_resampled, y_train_resampled.values.ravel())
-
-
-    pipeline_rf = Pipeline(steps=[
-        ('preprocessor', preprocessing_pipeline),
-        ('model', rf)
-    ])
-
-    pipeline_knn = Pipeline(steps=[
-        ('preprocessor', preprocessing_pipeline),
-        ('model', knn)
-    ])
-
-    pipeline_gb = Pipeline(steps=[
-        ('preprocessor', preprocessing_pipeline),
-        ('model', gb)
-    ])
-
-    pipeline_dt = Pipeline(steps=[
-        ('preprocessor', preprocessing_pipeline),
-        ('model', dt)
-    ])
-
-    # Dump the pipelines
-    PATH_PIPELINES = "/home/oreo/hmeq/app/assets/pipes"
-    print(f"Dumping pipelines to {PATH_PIPELINES}")
-
-    joblib.dump(pipeline_rf, os.path.join(PATH_PIPELINES, "full_pipeline_rf.joblib"))
-    joblib.dump(pipeline_knn, os.path.join(PATH_PIPELINES, "full_pipeline_knn.joblib"))
-    joblib.dump(pipeline_gb, os.path.join(PATH_PIPELINES, "full_pipeline_gb.joblib"))
-    joblib.dump(pipeline_dt, os.path.join(PATH_PIPELINES, "full_pipeline_dt.joblib"))
-
-    print("Pipelines dumped")
-
-    PIPELINES = {
-        "rf": pipeline_rf,
-        "knn": pipeline_knn,
-        "gb": pipeline_gb,
-        "dt": pipeline_dt,
-    }
+    from app.train import main
+
+    main()
@@ -0,0 +1,342 @@
+import argparse
+import os
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Tuple
+
+import joblib
+import numpy as np
+from scipy.spatial.distance import cdist
+from sklearn.base import BaseEstimator
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import KNeighborsClassifier
+
+from app.tree_engine import with_model
+
+
+# --- Configuration (env vars) ---
+# "auto" uses brute force up to HMEQ_KNN_BRUTE_MAX_ROWS training rows and the IVF index above, "sklearn" disables both
+KNN_BACKEND = os.getenv("HMEQ_KNN_BACKEND", "auto")
+KNN_BRUTE_MAX_ROWS = int(os.getenv("HMEQ_KNN_BRUTE_MAX_ROWS", "20000"))
+# A backend is only served if it finds at least this fraction of sklearn's neighbours on the validation rows
+KNN_MIN_RECALL = float(os.getenv("HMEQ_KNN_MIN_RECALL", "0.95"))
+# Approximate index: number of k-means cells (0 = sqrt of the training rows) and cells scanned per query
+KNN_IVF_LISTS = int(os.getenv("HMEQ_KNN_IVF_LISTS", "0"))
+KNN_IVF_PROBE = int(os.getenv("HMEQ_KNN_IVF_PROBE", "16"))
+# Memory budget of one block of query x training distances
+KNN_BLOCK_BYTES = 16 << 20
+
+
+# --- 1. Exact L1 brute force ---
+class BruteForceL1Index:
+    """
+    Exact L1 (manhattan) neighbours: the distances to every training row are computed for blocks of queries
+    in one compiled call (scipy's cdist), and only the `n_neighbors` smallest are sorted.
+    """
+
+    def __init__(self, X_fit: np.ndarray):
+        self.X_fit = np.ascontiguousarray(X_fit, dtype=np.float64)
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (distances, indices), both of shape (n_queries, n_neighbors), nearest first.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n_fit = self.X_fit.shape[0]
+        block_rows = max(1, KNN_BLOCK_BYTES // (8 * n_fit))
+        distances, indices = [], []
+        all_rows = np.arange(n_fit)
+        for start in range(0, len(X), block_rows):
+            block_distances, block_indices = _nearest(X[start : start + block_rows], self.X_fit, all_rows, n_neighbors)
+            distances.append(block_distances)
+            indices.append(block_indices)
+        return np.concatenate(distances), np.concatenate(indices)
+
+
+# --- 2. Approximate L1 index (inverted file) ---
+class IVFL1Index:
+    """
+    Inverted-file index: the training rows are partitioned into `n_lists` k-means cells (rows assigned to
+    their nearest centroid in L1), and a query only scans the rows of its `n_probe` nearest cells, exactly.
+    Each cell is scanned once per query batch, for all the queries that probe it.
+    """
+
+    def __init__(
+        self,
+        X_fit: np.ndarray,
+        n_lists: int = KNN_IVF_LISTS,
+        n_probe: int = KNN_IVF_PROBE,
+        random_state: int = 13,
+    ):
+        self.X_fit = np.ascontiguousarray(X_fit, dtype=np.float64)
+        self.n_lists = min(len(self.X_fit), n_lists or max(1, int(round(np.sqrt(len(self.X_fit))))))
+        self.n_probe = min(n_probe, self.n_lists)
+        kmeans = MiniBatchKMeans(n_clusters=self.n_lists, random_state=random_state, n_init=3)
+        self.centroids = kmeans.fit(self.X_fit).cluster_centers_
+        assignment = _nearest_centroids(self.X_fit, self.centroids, 1)[:, 0]
+        # Rows of cell c: order[list_starts[c]:list_starts[c + 1]]
+        self.order = np.argsort(assignment, kind="stable")
+        self.list_starts = np.searchsorted(assignment[self.order], np.arange(self.n_lists + 1))
+        self._brute = BruteForceL1Index(self.X_fit)
+
+    def kneighbors(self, X: np.ndarray, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (distances, indices), both of shape (n_queries, n_neighbors), nearest first.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        probes = _nearest_centroids(X, self.centroids, self.n_probe).ravel()
+        probe_order = np.argsort(probes, kind="stable")
+        probe_starts = np.searchsorted(probes[probe_order], np.arange(self.n_lists + 1))
+
+        distances = np.full((len(X), n_neighbors), np.inf)
+        indices = np.full((len(X), n_neighbors), -1, dtype=np.intp)
+        if len(X) <= self.n_probe:
+            # Few queries (e.g. single rows): one scan over all the probed rows of each query
+            for query, cells in enumerate(probes.reshape(len(X), self.n_probe)):
+                rows = np.concatenate([self.order[self.list_starts[c] : self.list_starts[c + 1]] for c in cells])
+                if len(rows) >= n_neighbors:
+                    distances[query], indices[query] = _nearest(X[query : query + 1], self.X_fit, rows, n_neighbors)
+            probes = probes[:0]
+        for cell in np.unique(probes):
+            queries = probe_order[probe_starts[cell] : probe_starts[cell + 1]] // self.n_probe
+            rows = self.order[self.list_starts[cell] : self.list_starts[cell + 1]]
+            if len(rows) == 0:
+                continue
+            # Merge the cell's rows into the queries' current best, nearest first (ties by training index)
+            candidate_distances = np.hstack([distances[queries], cdist(X[queries], self.X_fit[rows], metric="cityblock")])
+            candidates = np.hstack([indices[queries], np.broadcast_to(rows, (len(queries), len(rows)))])
+            order = np.lexsort((candidates, candidate_distances), axis=1)[:, :n_neighbors]
+            distances[queries] = np.take_along_axis(candidate_distances, order, axis=1)
+            indices[queries] = np.take_along_axis(candidates, order, axis=1)
+
+        # Probed cells with fewer rows than n_neighbors in total
+        incomplete = (indices < 0).any(axis=1)
+        if incomplete.any():
+            distances[incomplete], indices[incomplete] = self._brute.kneighbors(X[incomplete], n_neighbors)
+        return distances, indices
+
+
+def _nearest(X: np.ndarray, X_fit: np.ndarray, rows: np.ndarray, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact `n_neighbors` nearest of `rows` for each query, nearest first (ties by training index)."""
+    row_distances = cdist(X, X_fit[rows], metric="cityblock")
+    if n_neighbors < len(rows):
+        candidates = np.argpartition(row_distances, n_neighbors - 1, axis=1)[:, :n_neighbors]
+    else:
+        candidates = np.broadcast_to(np.arange(len(rows)), row_distances.shape)
+    candidate_distances = np.take_along_axis(row_distances, candidates, axis=1)
+    candidates = rows[candidates]
+    order = np.lexsort((candidates, candidate_distances), axis=1)
+    return np.take_along_axis(candidate_distances, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+def _nearest_centroids(X: np.ndarray, centroids: np.ndarray, n_nearest: int) -> np.ndarray:
+    """Indices of the `n_nearest` nearest centroids (L1) of every row, in blocks of rows."""
+    block_rows = max(1, KNN_BLOCK_BYTES // (8 * len(centroids)))
+    nearest = []
+    for start in range(0, len(X), block_rows):
+        block_distances = cdist(X[start : start + block_rows], centroids, metric="cityblock")
+        if n_nearest < len(centroids):
+            nearest.append(np.argpartition(block_distances, n_nearest - 1, axis=1)[:, :n_nearest])
+        else:
+            nearest.append(np.broadcast_to(np.arange(len(centroids)), block_distances.shape))
+    return np.concatenate(nearest)
+
+
+# --- 3. Serving wrapper ---
+class FastKNeighborsClassifier(BaseEstimator):
+    """
+    Drop-in for a fitted KNeighborsClassifier(metric L1) that answers the neighbour queries with one of the
+    indexes above ("brute" or "ivf") and votes like sklearn (uniform or distance weights).
+    """
+
+    def __init__(self, estimator: KNeighborsClassifier, backend: str = "brute"):
+        self.estimator = estimator
+        self.backend = backend
+
+    @classmethod
+    def from_estimator(cls, estimator: KNeighborsClassifier, backend: str = "brute") -> "FastKNeighborsClassifier":
+        return cls(estimator, backend=backend)._build()
+
+    def fit(self, X, y) -> "FastKNeighborsClassifier":
+        self.estimator.fit(X, y)
+        return self._build()
+
+    def __sklearn_is_fitted__(self) -> bool:
+        return hasattr(self, "index_")
+
+    def _build(self) -> "FastKNeighborsClassifier":
+        model = self.estimator
+        if model.effective_metric_ != "manhattan":
+            raise NotImplementedError(f"Only the L1 metric is supported, got {model.effective_metric_}")
+        if model.weights not in ("uniform", "distance") or np.ndim(model._y) != 1:
+            raise NotImplementedError("Only single-output uniform or distance weighting is supported")
+        if self.backend == "brute":
+            self.index_ = BruteForceL1Index(model._fit_X)
+        elif self.backend == "ivf":
+            self.index_ = IVFL1Index(model._fit_X)
+        else:
+            raise ValueError(f"backend must be 'brute' or 'ivf', got {self.backend!r}")
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        return self
+
+    def kneighbors(self, X) -> Tuple[np.ndarray, np.ndarray]:
+        return self.index_.kneighbors(np.asarray(X, dtype=np.float64), self.estimator.n_neighbors)
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Class probabilities, as KNeighborsClassifier.predict_proba (identical when the neighbours are).
+
+        Args:
+            X: array-like of shape (n_samples, n_features)
+        Returns:
+            np.ndarray of shape (n_samples, n_classes)
+        """
+        distances, indices = self.kneighbors(X)
+        if self.estimator.weights == "uniform":
+            weights = np.ones_like(distances)
+        else:
+            # sklearn: 1 / distance, or only the exact matches when a query has any
+            with np.errstate(divide="ignore"):
+                weights = 1.0 / distances
+            exact = np.isinf(weights)
+            weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+        labels = self.estimator._y[indices]
+        n_classes = len(self.classes_)
+        proba = np.zeros((len(distances), n_classes))
+        np.add.at(proba, (np.arange(len(distances))[:, None], labels), weights)
+        normalizer = proba.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        return proba / normalizer
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def recall(self, X) -> float:
+        """Fraction of sklearn's neighbours (exact, on `X`) that this backend also returns."""
+        with warnings.catch_warnings():
+            # Fitted on a DataFrame, queried with the arrays the serving path passes
+            warnings.filterwarnings("ignore", message="X does not have valid feature names")
+            expected = self.estimator.kneighbors(np.asarray(X, dtype=np.float64), return_distance=False)
+        _, actual = self.kneighbors(X)
+        return float(np.mean([len(np.intersect1d(e, a)) / len(e) for e, a in zip(expected, actual)]))
+
+
+def select_backend(estimator: KNeighborsClassifier, backend: str = KNN_BACKEND) -> str:
+    """Resolve HMEQ_KNN_BACKEND ("auto": brute force for small training sets, the IVF index for large ones)."""
+    if backend != "auto":
+        return backend
+    return "brute" if estimator.n_samples_fit_ <= KNN_BRUTE_MAX_ROWS else "ivf"
+
+
+def index_neighbors_on_load(name: str, pipeline) -> Any:
+    """
+    ModelRegistry post_load hook: serve a KNeighborsClassifier through the HMEQ_KNN_BACKEND index,
+    if it finds at least HMEQ_KNN_MIN_RECALL of sklearn's neighbours on the processed X_test.
+    Other pipelines are returned unchanged.
+    """
+    model = pipeline.named_steps["model"]
+    if not isinstance(model, KNeighborsClassifier) or KNN_BACKEND == "sklearn":
+        return pipeline
+    from app.datastore import load_processed
+
+    backend = select_backend(model)
+    try:
+        X_validation = np.asarray(load_processed("X_test"), dtype=np.float64)
+        fast_model = FastKNeighborsClassifier.from_estimator(model, backend=backend)
+        recall = fast_model.recall(X_validation)
+    except (NotImplementedError, ValueError, AttributeError, FileNotFoundError) as e:
+        print(f"WARNING:  Could not index the neighbours of {name}, using sklearn: {e}")
+        return pipeline
+    if recall < KNN_MIN_RECALL:
+        print(
+            f"WARNING:  {backend} neighbours for {name} miss sklearn's "
+            f"(recall {recall:.3f} < {KNN_MIN_RECALL}), using sklearn."
+        )
+        return pipeline
+    print(f"INFO:     {backend} neighbours for {name} validated (recall {recall:.3f}).")
+    return with_model(pipeline, fast_model)
+
+
+# --- 4. Benchmark ---
+def _median_ms(fn, batches: List[np.ndarray]) -> float:
+    timings = []
+    for batch in batches:
+        started = time.perf_counter()
+        fn(batch)
+        timings.append(time.perf_counter() - started)
+    return 1000 * float(np.median(timings))
+
+
+def benchmark(
+    estimator: KNeighborsClassifier,
+    X_queries: np.ndarray,
+    backends: List[str],
+    lime_samples: int = 400,
+    n_batches: int = 10,
+    random_state: int = 13,
+) -> List[Dict[str, Any]]:
+    """
+    Recall and latency of each backend against the fitted sklearn estimator: single-row queries,
+    and LIME-sized batches (`lime_samples` perturbations of one row, as one explain call scores them).
+    """
+    rng = np.random.RandomState(random_state)
+    X_queries = np.asarray(X_queries, dtype=np.float64)
+    scale = X_queries.std(axis=0)
+    rows = [X_queries[[i]] for i in rng.choice(len(X_queries), size=min(200, len(X_queries)), replace=False)]
+    lime_batches = [
+        X_queries[[i]] + rng.normal(0.0, 1.0, (lime_samples, X_queries.shape[1])) * scale
+        for i in rng.choice(len(X_queries), size=n_batches)
+    ]
+    X_lime = np.concatenate(lime_batches)
+    expected = estimator.predict(X_lime)
+
+    results = []
+    for backend in backends:
+        started = time.perf_counter()
+        model = estimator if backend == "sklearn" else FastKNeighborsClassifier.from_estimator(estimator, backend)
+        build_seconds = time.perf_counter() - started
+        results.append({
+            "backend": backend,
+            "n_fit": int(estimator.n_samples_fit_),
+            "build_seconds": build_seconds,
+            "recall": 1.0 if backend == "sklearn" else model.recall(X_lime),
+            "prediction_agreement": float(np.mean(model.predict(X_lime) == expected)),
+            "single_row_ms": _median_ms(model.predict_proba, rows),
+            "lime_batch_ms": _median_ms(model.predict_proba, lime_batches),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    """
+    Neighbour backend benchmark for the knn pipeline, e.g. `python -m app.neighbors --replicate 1 20`.
+    `--replicate R` fits on the training set tiled R times (with jitter), to see where the IVF index pays off.
+    """
+    from app.datastore import load_processed
+    from app.registry import PIPELINE_PATHS
+
+    parser = argparse.ArgumentParser(description="Recall/latency of the KNN neighbour backends.")
+    parser.add_argument("--backends", nargs="+", default=["sklearn", "brute", "ivf"])
+    parser.add_argument("--replicate", nargs="+", type=int, default=[1])
+    parser.add_argument("--lime-samples", type=int, default=400)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    knn = joblib.load(PIPELINE_PATHS["knn"]).named_steps["model"]
+    X_test = np.asarray(load_processed("X_test"), dtype=np.float64)
+    jitter_rng = np.random.RandomState(0)
+    for replicate in args.replicate:
+        estimator = knn
+        if replicate > 1:
+            X_fit = np.tile(knn._fit_X, (replicate, 1))
+            X_fit = X_fit + jitter_rng.normal(0.0, 0.05, X_fit.shape) * knn._fit_X.std(axis=0)
+            estimator = KNeighborsClassifier(**knn.get_params()).fit(X_fit, np.tile(knn.classes_[knn._y], replicate))
+        for result in benchmark(estimator, X_test, args.backends, lime_samples=args.lime_samples):
+            print(
+                f"{result['backend']:>8} n_fit={result['n_fit']:>8} build {result['build_seconds']:7.2f}s "
+                f"recall {result['recall']:.3f} agreement {result['prediction_agreement']:.3f} "
+                f"single row {result['single_row_ms']:7.2f} ms, {args.lime_samples}-row batch {result['lime_batch_ms']:8.2f} ms"
+            )
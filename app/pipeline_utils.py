@@ -1,6 +1,10 @@
 import numpy as np
 import pandas as pd
 import re
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from sklearn.preprocessing import FunctionTransformer, StandardScaler
 from sklearn.experimental import enable_iterative_imputer
 from sklearn.impute import SimpleImputer, IterativeImputer
@@ -19,241 +23,316 @@ num_features_log_iter = ["LOAN", "VALUE", "MORTDUE", "YOJ", "CLAGE", "DEBTINC"]
 num_features_mode = ["DELINQ", "DEROG", "NINQ", "CLNO"]
 
 
-def _translate_numerical_condition(condition_str, col_transformer):
-    """Helper to translate numerical conditions, now handling simple and range conditions."""
-    try:
-        # --- 1. Parse ---
-        # Try simple condition first: feature op value (e.g., X <= 0.5)
-        match_simple = re.match(
-            r"([a-zA-Z0-9_]+)\s*([<>=!]+)\s*(-?\d+\.?\d*)", condition_str
-        )
-        # Try range condition: value < feature <= value (e.g., 0.1 < X <= 0.5)
-        match_range = re.match(
-            r"(-?\d+\.?\d*)\s*<[=]?\s*([a-zA-Z0-9_]+)\s*<[=]?\s*(-?\d+\.?\d*)",
-            condition_str,
-        )
-
-        processed_feature_name = None
-        operator = None
-        threshold_transformed_single = None
-        lower_bound_transformed = None
-        upper_bound_transformed = None
-        is_range = False
+# --- Configuration (env vars) ---
+# Translated conditions kept per translator: LIME's quartile thresholds repeat across requests
+TRANSLATION_CACHE_SIZE = int(os.getenv("HMEQ_TRANSLATION_CACHE_SIZE", "4096"))
+# Version of the translated explanation records, part of the explanation cache keys and index settings
+EXPLANATION_FORMAT = "conditions-v1"
 
-        if match_range:
-            lower_bound_transformed = float(match_range.group(1))
-            processed_feature_name = match_range.group(2)
-            upper_bound_transformed = float(match_range.group(3))
-            is_range = True
-            # Extract operators from the original string for more precise representation if needed
-            # For now, we'll reconstruct with "<" and "<="
-            # Example: find operators by searching between numbers and feature name
-            op_lower_search = re.search(
-                re.escape(str(lower_bound_transformed))
-                + r"\s*(<[=]?)\s*"
-                + re.escape(processed_feature_name),
-                condition_str,
-            )
-            op_upper_search = re.search(
-                re.escape(processed_feature_name)
-                + r"\s*(<[=]?)\s*"
-                + re.escape(str(upper_bound_transformed)),
-                condition_str,
-            )
-            op_lower = op_lower_search.group(1) if op_lower_search else "<"
-            op_upper = op_upper_search.group(1) if op_upper_search else "<="
+# Condition patterns, matched from the start of the condition string
+# feature op value (e.g., X <= 0.5, cat__JOB_Office=1)
+_SIMPLE_PATTERN = re.compile(r"([a-zA-Z0-9_]+)\s*([<>=!]+)\s*(-?\d+\.?\d*)")
+# value op feature op value (e.g., 0.1 < X <= 0.5)
+_RANGE_PATTERN = re.compile(
+    r"(-?\d+\.?\d*)\s*(<[=]?)\s*([a-zA-Z0-9_]+)\s*(<[=]?)\s*(-?\d+\.?\d*)"
+)
+# Categorical (one-hot) conditions: feature=value / feature==value, and feature >[=] / <[=] value
+_EQUALITY_PATTERN = re.compile(r"([a-zA-Z0-9_]+)\s*([=]{1,2})\s*(-?\d+\.?\d*)")
+_INEQUALITY_PATTERN = re.compile(r"([a-zA-Z0-9_]+)\s*([<>]=?)\s*(-?\d+\.?\d*)")
 
-        elif match_simple:
-            processed_feature_name = match_simple.group(1)
-            operator = match_simple.group(2)
-            threshold_transformed_single = float(match_simple.group(3))
-        else:
-            return condition_str, False  # Cannot parse
-
-        # --- 2. Identify & Get Components ---
-        original_feature_name = None
-        transformer_pipeline = None
-        transformer_key = None
-        feature_list_for_transformer = []
-        uses_log = False
-
-        if processed_feature_name.startswith("num_log_iter__"):
-            transformer_key = "num_log_iter"
-            original_feature_name = processed_feature_name.split("__")[1].replace(
-                "_log", ""
-            )
-            feature_list_for_transformer = num_features_log_iter
-            if "_log" in processed_feature_name:
-                uses_log = True
-        elif processed_feature_name.startswith("num_mode__"):
-            transformer_key = "num_mode"
-            original_feature_name = processed_feature_name.split("__")[1]
-            feature_list_for_transformer = num_features_mode
-            uses_log = False
-        else:
-            return condition_str, False
-
-        transformer_pipeline = col_transformer.named_transformers_[transformer_key]
-        scaler_instance = transformer_pipeline.named_steps["scaler"]
-        feature_idx_in_scaler = feature_list_for_transformer.index(
-            original_feature_name
-        )
-        n_scaler_features = scaler_instance.n_features_in_
-
-        # --- Function to inverse transform a single value ---
-        def inverse_transform_value(transformed_val):
-            dummy_row = np.zeros((1, n_scaler_features))
-            dummy_row[0, feature_idx_in_scaler] = transformed_val
-            scaled_inverted_row = scaler_instance.inverse_transform(dummy_row)
-            value_scaled_inverted = scaled_inverted_row[0, feature_idx_in_scaler]
-            if uses_log:
-                if value_scaled_inverted < 0 and np.isclose(value_scaled_inverted, 0):
-                    return 0
-                return np.expm1(value_scaled_inverted)
-            return value_scaled_inverted
-
-        # --- 3 & 4. Inverse Transform ---
-        if is_range:
-            original_lower_bound = inverse_transform_value(lower_bound_transformed)
-            original_upper_bound = inverse_transform_value(upper_bound_transformed)
-        else:
-            original_threshold_single = inverse_transform_value(
-                threshold_transformed_single
-            )
 
-        # --- 5. Format ---
-        def format_threshold(value, feature_name):
-            if feature_name == "DEBTINC":
-                return f"{value:.2f}%"
-            return f"{value:.2f}"
+def _format_threshold(value, feature_name):
+    if feature_name == "DEBTINC":
+        return f"{value:.2f}%"
+    return f"{value:.2f}"
 
-        if is_range:
-            formatted_lower = format_threshold(
-                original_lower_bound, original_feature_name
-            )
-            formatted_upper = format_threshold(
-                original_upper_bound, original_feature_name
-            )
-            translated_condition = f"{formatted_lower} {op_lower} {original_feature_name} {op_upper} {formatted_upper}"
-        else:
-            formatted_single = format_threshold(
-                original_threshold_single, original_feature_name
-            )
-            translated_condition = (
-                f"{original_feature_name} {operator} {formatted_single}"
-            )
 
-        return translated_condition, True
+class LimeTranslator:
+    """
+    Translates LIME conditions on the preprocessed features back to the original features
+    (inverse StandardScaler and log1p for numerical thresholds, category names for one-hot columns).
 
-    except Exception as e:
-        # print(f"Error translating numerical condition '{condition_str}': {e}")
-        return condition_str, False
+    Built once per fitted ColumnTransformer (see `get_translator`): the patterns are precompiled, the
+    scaler parameters of each numerical feature are looked up once, the thresholds of a whole explanation
+    are inverse-transformed in one vectorized call, and translated conditions are kept in an LRU cache.
+    """
 
+    def __init__(self, col_transformer: ColumnTransformer, cache_size: int = TRANSLATION_CACHE_SIZE):
+        self.col_transformer = col_transformer
+        self.cache_size = cache_size
+        # processed feature name -> (original name, scale, mean, uses_log), or None if not numerical
+        self._numerical: Dict[str, Optional[Tuple[str, Optional[float], Optional[float], bool]]] = {}
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- 1. Per-feature inverse maps ---
+    def _numerical_feature(self, processed_feature_name: str):
+        """Original name, scaler parameters and log flag of a numerical feature (looked up once)."""
+        if processed_feature_name in self._numerical:
+            return self._numerical[processed_feature_name]
+
+        feature = None
+        try:
+            if processed_feature_name.startswith("num_log_iter__"):
+                transformer_key = "num_log_iter"
+                original_feature_name = processed_feature_name.split("__")[1].replace("_log", "")
+                feature_list_for_transformer = num_features_log_iter
+                uses_log = "_log" in processed_feature_name
+            elif processed_feature_name.startswith("num_mode__"):
+                transformer_key = "num_mode"
+                original_feature_name = processed_feature_name.split("__")[1]
+                feature_list_for_transformer = num_features_mode
+                uses_log = False
+            else:
+                transformer_key = None
+
+            if transformer_key is not None:
+                transformer_pipeline = self.col_transformer.named_transformers_[transformer_key]
+                scaler = transformer_pipeline.named_steps["scaler"]
+                feature_idx_in_scaler = feature_list_for_transformer.index(original_feature_name)
+                feature = (
+                    original_feature_name,
+                    None if scaler.scale_ is None else float(scaler.scale_[feature_idx_in_scaler]),
+                    None if scaler.mean_ is None else float(scaler.mean_[feature_idx_in_scaler]),
+                    uses_log,
+                )
+        except (AttributeError, IndexError, KeyError, ValueError):
+            feature = None
+        self._numerical[processed_feature_name] = feature
+        return feature
+
+    def _inverse_transform(self, features: list, values: List[float]) -> np.ndarray:
+        """Inverse scaler (and expm1 for log features) of many thresholds at once."""
+        values = np.asarray(values, dtype=np.float64)
+        scale = np.array([1.0 if f[1] is None else f[1] for f in features])
+        mean = np.array([0.0 if f[2] is None else f[2] for f in features])
+        has_scale = np.array([f[1] is not None for f in features])
+        has_mean = np.array([f[2] is not None for f in features])
+        uses_log = np.array([f[3] for f in features])
+
+        inverted = np.where(has_scale, values * scale, values)
+        inverted = np.where(has_mean, inverted + mean, inverted)
+        # Round-off below log1p(0) maps to 0 instead of a tiny negative expm1
+        near_zero = (inverted < 0) & np.isclose(inverted, 0)
+        with np.errstate(over="ignore"):
+            exp = np.expm1(inverted)
+        return np.where(uses_log, np.where(near_zero, 0.0, exp), inverted)
+
+    # --- 2. Parse ---
+    def _parse_numerical(self, condition_str: str):
+        """
+        (feature, [thresholds], format) of a numerical condition, or None. `format` renders the
+        condition from the inverse-transformed thresholds.
+        """
+        match_range = _RANGE_PATTERN.match(condition_str)
+        if match_range:
+            feature = self._numerical_feature(match_range.group(3))
+            if feature is None:
+                return None
+            op_lower, op_upper = match_range.group(2), match_range.group(4)
+            name = feature[0]
+            return feature, [float(match_range.group(1)), float(match_range.group(5))], (
+                lambda lower, upper: f"{_format_threshold(lower, name)} {op_lower} {name} {op_upper} {_format_threshold(upper, name)}"
+            )
 
-def _translate_categorical_condition(condition_str, col_transformer):
-    try:
-        # Pattern 1: feature=value or feature==value
-        match_equality = re.match(
-            r"([a-zA-Z0-9_]+)\s*([=]{1,2})\s*(-?\d+\.?\d*)", condition_str
-        )
-
-        # Pattern 2: feature > value, feature >= value, feature < value, feature <= value
-        match_inequality = re.match(
-            r"([a-zA-Z0-9_]+)\s*([<>]=?)\s*(-?\d+\.?\d*)", condition_str
-        )
-
-        # Pattern 3: value1 <[=] feature <[=] value2 (the range for OHE features like 0 < X <= 1)
-        match_range = re.match(
-            r"(-?\d+\.?\d*)\s*<[=]?\s*([a_zA-Z0-9_]+)\s*<[=]?\s*(-?\d+\.?\d*)",
-            condition_str,
-        )
-
-        processed_feature_name = None
+        match_simple = _SIMPLE_PATTERN.match(condition_str)
+        if match_simple:
+            feature = self._numerical_feature(match_simple.group(1))
+            if feature is None:
+                return None
+            operator = match_simple.group(2)
+            name = feature[0]
+            return feature, [float(match_simple.group(3))], (
+                lambda threshold: f"{name} {operator} {_format_threshold(threshold, name)}"
+            )
+        return None
+
+    @staticmethod
+    def _translate_categorical(condition_str: str) -> Optional[str]:
+        """"FEATURE is (not) CATEGORY" for a condition on a one-hot column, or None."""
         is_condition_true = False  # Represents "feature IS category_value"
         is_condition_false = False  # Represents "feature IS NOT category_value"
 
+        match_equality = _EQUALITY_PATTERN.match(condition_str)
+        match_inequality = None if match_equality else _INEQUALITY_PATTERN.match(condition_str)
+        match_range = None if match_equality or match_inequality else _RANGE_PATTERN.match(condition_str)
+
         if match_equality:
             processed_feature_name = match_equality.group(1)
-            # op = match_equality.group(2) # '=' or '=='
             val = float(match_equality.group(3))
-            if not processed_feature_name.startswith("cat__"):
-                return condition_str, False  # Not a cat feature
             if np.isclose(val, 1.0):
                 is_condition_true = True
             elif np.isclose(val, 0.0):
                 is_condition_false = True
-            else:  # Equality to something other than 0 or 1 for OHE
-                return condition_str, False
-
-        elif match_inequality:  # Handles >, >=, <, <=
+        elif match_inequality:
             processed_feature_name = match_inequality.group(1)
             op = match_inequality.group(2)
             val = float(match_inequality.group(3))
-            if not processed_feature_name.startswith("cat__"):
-                return condition_str, False
-
-            if (op == ">" and val < 0.5) or (
-                op == ">=" and val <= 0.0
-            ):  # e.g., X > 0.0 or X >= 0.0 means X must be 1
+            if (op == ">" and val < 0.5) or (op == ">=" and val <= 0.0):
+                # e.g., X > 0.0 or X >= 0.0 means X must be 1
                 is_condition_true = True
-            elif (op == "<" and val > 0.5) or (
-                op == "<=" and val < 0.5
-            ):  # e.g., X < 1.0 or X <= 0.0 means X must be 0
+            elif (op == "<" and val > 0.5) or (op == "<=" and val < 0.5):
+                # e.g., X < 1.0 or X <= 0.0 means X must be 0
                 is_condition_false = True
-            # else: might be an ambiguous inequality like X > 0.6 for a 0/1 feature.
-
         elif match_range:
+            processed_feature_name = match_range.group(3)
             lower_bound = float(match_range.group(1))
-            processed_feature_name_range = match_range.group(2)
-            upper_bound = float(match_range.group(3))
-            if not processed_feature_name_range.startswith("cat__"):
-                return condition_str, False
-            processed_feature_name = processed_feature_name_range  # Assign it
-
-            # This specifically handles "0.00 < X <= 1.00" or similar meaning X=1
+            upper_bound = float(match_range.group(5))
+            # e.g., 0.00 < X <= 1.00 means X must be 1
             if (
                 (np.isclose(lower_bound, 0.0) or lower_bound < 0.5)
                 and (np.isclose(upper_bound, 1.0) or upper_bound > 0.5)
-                and (lower_bound < upper_bound)
-            ):  # Range effectively means the feature is 1
+                and lower_bound < upper_bound
+            ):
                 is_condition_true = True
-            # Add logic for ranges that mean X=0 if LIME ever produces them, e.g. -0.1 < X <= 0.1
-
-        if not processed_feature_name:  # No pattern matched or not a cat feature
-            return condition_str, False
+        else:
+            return None
 
-        # Final check if a definitive state was determined
+        if not processed_feature_name.startswith("cat__"):
+            return None
         if not is_condition_true and not is_condition_false:
-            # This means a pattern matched, but the logic above didn't set true/false
-            # e.g., an ambiguous inequality like "cat_X > 0.6"
-            return condition_str, False
-
+            # A pattern matched, but the condition is ambiguous for a 0/1 feature (e.g., cat_X > 0.6)
+            return None
         parts = processed_feature_name.split("__")
-        if len(parts) != 2:
-            return condition_str, False  # Should be cat__FEATURE_VALUE
+        if len(parts) != 2 or "_" not in parts[1]:
+            return None  # Should be cat__FEATURE_VALUE
         original_cat_feature, category_value = parts[1].split("_", 1)
-
-        condition_meaning = ""
         if is_condition_true:
-            condition_meaning = f"{original_cat_feature} is {category_value}"
-        elif is_condition_false:
-            condition_meaning = f"{original_cat_feature} is not {category_value}"
-        else:  # Should not be reached if logic above is sound
-            return condition_str, False
-
-        return condition_meaning, True
-
-    except Exception as e:
-        # print(f"DEBUG CAT EXCEPTION on '{condition_str}': {e}")
-        return condition_str, False
-
-
-def translate_lime_explanation(raw_exp: list, fitted_pipeline: Pipeline) -> list:
-    """
-    Translates a raw LIME explanation list (tuples) into a more interpretable format
-    using the fitted preprocessing pipeline.
-    """
-    translated_explanation = []
+            return f"{original_cat_feature} is {category_value}"
+        return f"{original_cat_feature} is not {category_value}"
+
+    # --- 3. Translate ---
+    def _cache_get(self, keys) -> Dict[Any, Any]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+        return found
+
+    def _cache_put(self, items: Dict[Any, Any]):
+        with self._lock:
+            self._cache.update(items)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def translate_conditions(self, conditions: Sequence) -> List[Dict[str, Any]]:
+        """
+        Translate structured LIME terms (limestone.LimeCondition) without any string parsing: the bin bounds
+        are inverse-transformed directly and the readable condition is rendered last.
+
+        Returns:
+            One {"feature", "operator", "lower", "upper", "category", "weight", "condition"} record per term,
+            in the original units: operator "<=", ">" or "between" (lower < x <= upper) for numerical
+            features, "is" or "is not" (category) for one-hot columns.
+        Raises:
+            ValueError: if a term is on a feature the preprocessing cannot invert.
+        """
+        keys = [(c.name, c.operator, c.lower, c.upper, c.value) for c in conditions]
+        translated = self._cache_get(keys)
+        misses = [key for key in dict.fromkeys(keys) if key not in translated]
+
+        numerical = []
+        for key in misses:
+            name, operator, lower, upper, value = key
+            feature = self._numerical_feature(name)
+            if feature is not None and operator in ("<=", ">", "between"):
+                numerical.append((key, feature))
+            else:
+                translated[key] = self._translate_one_hot(name, operator, value)
+        if numerical:
+            # Every bound of every miss in one vectorized inverse transform
+            bounds = [(key, feature, i) for key, feature in numerical for i in (3, 2) if key[i] is not None]
+            inverted = self._inverse_transform(
+                [feature for _, feature, _ in bounds], [key[i] for key, _, i in bounds]
+            )
+            original_bounds: Dict[Tuple[Any, int], float] = {
+                (key, i): float(value) for (key, _, i), value in zip(bounds, inverted)
+            }
+            for key, feature in numerical:
+                translated[key] = self._render_numerical(
+                    feature[0], key[1], original_bounds.get((key, 2)), original_bounds.get((key, 3))
+                )
+        if misses:
+            self._cache_put({key: translated[key] for key in misses})
+
+        return [{**translated[key], "weight": c.weight} for key, c in zip(keys, conditions)]
+
+    @staticmethod
+    def _render_numerical(name: str, operator: str, lower: Optional[float], upper: Optional[float]) -> dict:
+        if operator == "<=":
+            condition = f"{name} <= {_format_threshold(upper, name)}"
+        elif operator == ">":
+            condition = f"{name} > {_format_threshold(lower, name)}"
+        else:
+            condition = f"{_format_threshold(lower, name)} < {name} <= {_format_threshold(upper, name)}"
+        return {
+            "feature": name, "operator": operator, "lower": lower, "upper": upper, "category": None,
+            "condition": condition,
+        }
+
+    @staticmethod
+    def _translate_one_hot(name: str, operator: str, value: Optional[float]) -> dict:
+        parts = name.split("__")
+        if operator != "=" or len(parts) != 2 or parts[0] != "cat" or "_" not in parts[1]:
+            raise ValueError(f"Cannot translate a {operator!r} condition on feature {name!r}")
+        original_cat_feature, category_value = parts[1].split("_", 1)
+        if np.isclose(value, 1.0):
+            operator = "is"
+        elif np.isclose(value, 0.0):
+            operator = "is not"
+        else:
+            raise ValueError(f"One-hot feature {name!r} has value {value}, expected 0 or 1")
+        return {
+            "feature": original_cat_feature, "operator": operator, "lower": None, "upper": None,
+            "category": category_value, "condition": f"{original_cat_feature} {operator} {category_value}",
+        }
+
+    def translate(self, raw_exp: list) -> list:
+        """
+        Translate a raw LIME explanation list of (condition, weight) tuples.
+        Conditions that cannot be translated are kept as they are (with a warning).
+        """
+        conditions = [condition_str for condition_str, _ in raw_exp]
+        translated: Dict[str, Optional[str]] = self._cache_get(conditions)
+
+        # Cache misses: numerical thresholds of all of them in one inverse transform
+        misses = [c for c in dict.fromkeys(conditions) if c not in translated]
+        numerical = []
+        for condition_str in misses:
+            parsed = self._parse_numerical(condition_str)
+            if parsed is not None:
+                numerical.append((condition_str, parsed))
+            else:
+                translated[condition_str] = self._translate_categorical(condition_str)
+        if numerical:
+            features = [feature for _, (feature, values, _) in numerical for _ in values]
+            values = [value for _, (_, values, _) in numerical for value in values]
+            inverted = iter(self._inverse_transform(features, values))
+            for condition_str, (_, values, render) in numerical:
+                translated[condition_str] = render(*[next(inverted) for _ in values])
+
+        if misses:
+            self._cache_put({condition_str: translated[condition_str] for condition_str in misses})
+
+        translated_explanation = []
+        for condition_str, weight in raw_exp:
+            if translated[condition_str] is None:
+                print(f"Warning: Could not translate condition: {condition_str}")
+                translated_explanation.append((condition_str, weight))
+            else:
+                translated_explanation.append((translated[condition_str], weight))
+        return translated_explanation
+
+
+# One translator per fitted ColumnTransformer, dropped with the pipeline
+_TRANSLATORS: "weakref.WeakKeyDictionary[ColumnTransformer, LimeTranslator]" = weakref.WeakKeyDictionary()
+_TRANSLATORS_LOCK = threading.Lock()
+
+
+def get_translator(fitted_pipeline: Pipeline) -> LimeTranslator:
+    """The LimeTranslator of a fitted pipeline's ColumnTransformer, built on first use."""
     try:
         outer_preprocessor_pipeline = fitted_pipeline.named_steps["preprocessor"]
         col_transformer = outer_preprocessor_pipeline.named_steps["preprocessor"]
@@ -264,20 +343,29 @@ def translate_lime_explanation(raw_exp: list, fitted_pipeline: Pipeline) -> list
     except (KeyError, TypeError, AttributeError) as e:
         raise ValueError(f"Could not find the ColumnTransformer. Error: {e}")
 
-    for condition_str, weight in raw_exp:
-        translated_condition, success_num = _translate_numerical_condition(
-            condition_str, col_transformer
-        )
-        if success_num:
-            translated_explanation.append((translated_condition, weight))
-            continue
-        translated_condition, success_cat = _translate_categorical_condition(
-            condition_str, col_transformer
-        )
-        if success_cat:
-            translated_explanation.append((translated_condition, weight))
-            continue
-        print(f"Warning: Could not translate condition: {condition_str}")
-        translated_explanation.append((condition_str, weight))
-
-    return translated_explanation
+    with _TRANSLATORS_LOCK:
+        translator = _TRANSLATORS.get(col_transformer)
+        if translator is None:
+            translator = _TRANSLATORS[col_transformer] = LimeTranslator(col_transformer)
+    return translator
+
+
+def translate_lime_explanation(raw_exp: list, fitted_pipeline: Pipeline) -> list:
+    """
+    Translates a raw LIME explanation list (tuples) into a more interpretable format
+    using the fitted preprocessing pipeline (through its cached LimeTranslator).
+    """
+    return get_translator(fitted_pipeline).translate(raw_exp)
+
+
+def translate_lime_conditions(conditions: Sequence, fitted_pipeline: Pipeline) -> List[Dict[str, Any]]:
+    """
+    Translates the structured terms of an explanation (`explanation.conditions`, see limestone.LimeCondition)
+    into condition records in the original feature units (see LimeTranslator.translate_conditions).
+    """
+    return get_translator(fitted_pipeline).translate_conditions(conditions)
+
+
+def condition_tuples(records: List[Dict[str, Any]]) -> List[Tuple[str, float]]:
+    """The (condition, weight) pairs of translated condition records (the `lime_explanation` format)."""
+    return [(record["condition"], record["weight"]) for record in records]
@@ -0,0 +1,258 @@
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# --- Configuration (env vars) ---
+# Opt-in: sample the stacks of requests that take longer than this (0 = disabled)
+PROFILE_SLOW_MS = float(os.getenv("HMEQ_PROFILE_SLOW_MS", "0"))
+PROFILE_ENABLED = PROFILE_SLOW_MS > 0
+PROFILE_INTERVAL_MS = float(os.getenv("HMEQ_PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("HMEQ_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "hmeq_profiles"))
+# The oldest profiles are deleted beyond either limit
+PROFILE_MAX_FILES = int(os.getenv("HMEQ_PROFILE_MAX_FILES", "100"))
+PROFILE_MAX_BYTES = int(os.getenv("HMEQ_PROFILE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+
+# --- Stack sampling ---
+def _frame_name(code) -> str:
+    path = code.co_filename
+    short_path = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    return f"{code.co_name} ({short_path}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    """One stack in the collapsed ("folded") format: root first, frames separated by ';'."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Background thread that samples the stacks of a set of threads every `interval` seconds, after an
+    initial `delay`, and counts them per collapsed stack (prefixed with the thread's label).
+    Stopped before the delay has elapsed, it costs one idle thread and takes no samples.
+    """
+
+    def __init__(self, threads: Callable[[], Dict[int, str]], interval: float, delay: float = 0.0):
+        self.threads = threads
+        self.interval = interval
+        self.delay = delay
+        self.stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def _run(self):
+        if self._stop.wait(self.delay):
+            return
+        while not self._stop.is_set():
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, label in self.threads().items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self.stacks[f"{label};{_collapse(frame)}"] += 1
+            del frames
+            self._stop.wait(self.interval)
+
+    def stop(self) -> Counter:
+        """Stop sampling (without waiting for the thread) and return the stacks sampled so far."""
+        self._stop.set()
+        with self._lock:
+            return Counter(self.stacks)
+
+
+# --- Per-request profiles ---
+class RequestProfile:
+    """
+    Threads working on one request (the event loop, plus predict executor threads while they run
+    one of its jobs) and the stacks sampled from them once the request is slow.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.threads: Dict[int, str] = {threading.get_ident(): "event-loop"}
+        self.worker_stacks: Counter = Counter()
+        self.sampler: Optional[StackSampler] = None
+
+    def start_sampling(self):
+        # dict() copies atomically, while executor threads add and remove themselves
+        self.sampler = StackSampler(lambda: dict(self.threads), PROFILE_INTERVAL_MS / 1000).start()
+
+    def stacks(self) -> Counter:
+        stacks = self.sampler.stop() if self.sampler is not None else Counter()
+        return stacks + self.worker_stacks
+
+
+_REQUEST_PROFILE: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def track_thread(call: Callable[[], Any]) -> Any:
+    """Run a predict executor job with its thread registered for sampling in the current request's profile."""
+    profile = _REQUEST_PROFILE.get()
+    if profile is None:
+        return call()
+    thread_id = threading.get_ident()
+    profile.threads[thread_id] = threading.current_thread().name
+    try:
+        return call()
+    finally:
+        profile.threads.pop(thread_id, None)
+
+
+def sample_delay() -> Optional[float]:
+    """
+    Seconds until the current request counts as slow (0.0 if it already does), for `run_sampled`.
+    None when profiling is disabled.
+    """
+    profile = _REQUEST_PROFILE.get()
+    if profile is None:
+        return None
+    return max(0.0, PROFILE_SLOW_MS / 1000 - (time.perf_counter() - profile.started))
+
+
+def run_sampled(delay: Optional[float], fn: Callable, *args, **kwargs) -> Tuple[Any, Optional[Dict[str, int]]]:
+    """
+    Executor wrapper for the LIME worker processes, which the app cannot sample: call `fn`, sampling
+    this thread once the call runs longer than `delay` seconds, and return the stacks with the result,
+    for `add_worker_stacks`. With `delay=None` (profiling disabled) `fn` is just called.
+    """
+    if delay is None:
+        return fn(*args, **kwargs), None
+    label = f"lime-worker-{os.getpid()}"
+    thread_id = threading.get_ident()
+    sampler = StackSampler(lambda: {thread_id: label}, PROFILE_INTERVAL_MS / 1000, delay=delay).start()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        stacks = sampler.stop()
+    return result, dict(stacks) or None
+
+
+def add_worker_stacks(sampled_result: Tuple[Any, Optional[Dict[str, int]]]) -> Any:
+    """Add the stacks returned by `run_sampled` to the current request's profile and return the result."""
+    result, stacks = sampled_result
+    profile = _REQUEST_PROFILE.get()
+    if profile is not None and stacks:
+        profile.worker_stacks.update(stacks)
+    return result
+
+
+# --- Profile files ---
+def write_profile(
+    stacks: Counter, request_id: str, pipeline: str, elapsed_ms: float, profile_dir: str = PROFILE_DIR
+) -> str:
+    """
+    Write the stacks in the collapsed format read by flamegraph.pl, speedscope and inferno
+    (`{stack} {count}` per line), then rotate the directory.
+
+    Returns:
+        The path of the profile.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}_{pipeline or 'none'}_{request_id}_{elapsed_ms:.0f}ms.folded"
+    path = os.path.join(profile_dir, name)
+    with open(path, "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    rotate_profiles(profile_dir)
+    return path
+
+
+def list_profiles(profile_dir: str = PROFILE_DIR) -> List[Dict[str, Any]]:
+    """Profiles on disk, newest first."""
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for entry in os.scandir(profile_dir):
+        if entry.is_file() and entry.name.endswith(".folded"):
+            stat = entry.stat()
+            profiles.append({"file": entry.name, "bytes": stat.st_size, "modified": stat.st_mtime})
+    return sorted(profiles, key=lambda p: -p["modified"])
+
+
+def rotate_profiles(
+    profile_dir: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES, max_bytes: int = PROFILE_MAX_BYTES
+):
+    """Delete the oldest profiles beyond `max_files` files or `max_bytes` in total."""
+    total_bytes = 0
+    for k, profile in enumerate(list_profiles(profile_dir)):
+        total_bytes += profile["bytes"]
+        if k >= max_files or total_bytes > max_bytes:
+            try:
+                os.remove(os.path.join(profile_dir, profile["file"]))
+            except OSError:
+                pass
+
+
+def _request_id(scope) -> str:
+    """The client's X-Request-ID if it is safe to use in a file name, else a new one."""
+    for name, value in scope.get("headers", []):
+        if name == b"x-request-id":
+            request_id = value.decode("latin-1")
+            if _REQUEST_ID_PATTERN.match(request_id):
+                return request_id
+    return uuid.uuid4().hex[:16]
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware for HMEQ_PROFILE_SLOW_MS: every request schedules a timer on the event loop, and only
+    requests still running when it fires start a StackSampler, so fast requests pay for a timer handle.
+    When a slow request finishes, its app-side stacks and those sent back by the LIME workers are written
+    to HMEQ_PROFILE_DIR, named after the pipeline and the request id (also sent as X-Request-ID).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(_request_id(scope))
+        token = _REQUEST_PROFILE.set(profile)
+        loop = asyncio.get_running_loop()
+        timer = loop.call_later(PROFILE_SLOW_MS / 1000, profile.start_sampling)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = [*message.get("headers", []), (b"x-request-id", profile.request_id.encode("latin-1"))]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            timer.cancel()
+            _REQUEST_PROFILE.reset(token)
+            elapsed_ms = 1000 * (time.perf_counter() - profile.started)
+            stacks = profile.stacks()
+            if elapsed_ms >= PROFILE_SLOW_MS and stacks:
+                pipeline = str(scope.get("path_params", {}).get("pipeline_name", ""))
+                print(
+                    f"INFO:     Slow request {profile.request_id} to {scope['path']} ({elapsed_ms:.0f} ms), "
+                    f"writing its profile to {PROFILE_DIR}"
+                )
+                # Off the event loop; the profile is complete, so nothing waits for the file
+                loop.run_in_executor(None, write_profile, stacks, profile.request_id, pipeline, elapsed_ms)
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import joblib
+
+from app.cache import artifact_hash
+
+
+# --- Configuration (env vars) ---
+# "parallel" loads every pipeline in threads at startup, "lazy" loads each one on first use,
+# "sequential" is the previous behaviour (one after the other at startup)
+MODEL_LOADING = os.getenv("HMEQ_MODEL_LOADING", "parallel")
+# Memory-map the NumPy arrays of the (uncompressed) joblib artifacts, so workers share their pages
+MODEL_MMAP_MODE = os.getenv("HMEQ_MODEL_MMAP_MODE", "r") or None
+
+PATH_PIPELINES = "/home/oreo/hmeq/app/assets/pipes"
+PIPELINE_PATHS = {
+    "rf": os.path.join(PATH_PIPELINES, "full_pipeline_rf.joblib"),
+    "knn": os.path.join(PATH_PIPELINES, "full_pipeline_knn.joblib"),
+    "gb": os.path.join(PATH_PIPELINES, "full_pipeline_gb.joblib"),
+    "dt": os.path.join(PATH_PIPELINES, "full_pipeline_dt.joblib"),
+    # "svm": os.path.join(PATH_PIPELINES, "full_pipeline_svm.joblib"),
+}
+
+
+class ModelRegistry(Mapping):
+    """
+    Read-only mapping of pipeline name -> pipeline that loads the joblib artifacts on demand.
+    `name in registry` and iterating over the names never load anything; `registry[name]` loads the
+    pipeline on first access (once, even with concurrent callers) and applies `post_load` to it.
+    `post_load(name, pipeline, registry)` gets the registry too, for the artifact's path and hash.
+    Artifact hashes are computed on first use, unless they are given (e.g. by the parent of a LIME worker).
+    """
+
+    def __init__(
+        self,
+        paths: Dict[str, str],
+        mmap_mode: Optional[str] = MODEL_MMAP_MODE,
+        post_load: Optional[Callable[[str, Any, "ModelRegistry"], Any]] = None,
+        hashes: Optional[Dict[str, str]] = None,
+    ):
+        self.paths = dict(paths)
+        self.mmap_mode = mmap_mode
+        self.post_load = post_load
+        self._pipelines: Dict[str, Any] = {}
+        self._hashes: Dict[str, str] = dict(hashes or {})
+        self._locks = {name: threading.Lock() for name in self.paths}
+        # Metrics
+        self.load_seconds: Dict[str, float] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        pipeline = self._pipelines.get(name)
+        if pipeline is not None:
+            return pipeline
+        if name not in self.paths:
+            raise KeyError(name)
+        with self._locks[name]:
+            if name not in self._pipelines:
+                self._load(name)
+        return self._pipelines[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.paths
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def _load(self, name: str):
+        started = time.perf_counter()
+        path = self.paths[name]
+        pipeline = joblib.load(path, mmap_mode=self.mmap_mode)
+        if self.post_load is not None:
+            pipeline = self.post_load(name, pipeline, self)
+        self._pipelines[name] = pipeline
+        self.load_seconds[name] = time.perf_counter() - started
+        print(f"INFO:     Loaded pipeline {name} in {self.load_seconds[name]:.2f}s")
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._pipelines
+
+    def artifact_hash(self, name: str) -> str:
+        """SHA-256 of the pipeline's artifact, hashed on first use (without loading the pipeline) unless given."""
+        artifact_sha256 = self._hashes.get(name)
+        if artifact_sha256 is None:
+            artifact_sha256 = self._hashes[name] = artifact_hash(self.paths[name])
+        return artifact_sha256
+
+    def artifact_hashes(self) -> Dict[str, str]:
+        """The SHA-256 of every artifact, to hand to another registry of the same paths (see `hashes`)."""
+        return {name: self.artifact_hash(name) for name in self.paths}
+
+    def load_all(self, parallel: bool = True) -> "ModelRegistry":
+        """Load every pipeline now, in one thread per pipeline if `parallel` (joblib.load releases the GIL on I/O)."""
+        if parallel:
+            with ThreadPoolExecutor(max_workers=len(self.paths) or 1, thread_name_prefix="load") as pool:
+                list(pool.map(self.__getitem__, self.paths))
+        else:
+            for name in self.paths:
+                self[name]
+        return self
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-pipeline load state, load time and artifact size."""
+        return {
+            name: {
+                "loaded": self.is_loaded(name),
+                "load_seconds": self.load_seconds.get(name),
+                "artifact_bytes": os.path.getsize(path) if os.path.exists(path) else None,
+                "mmap_mode": self.mmap_mode,
+            }
+            for name, path in self.paths.items()
+        }
+
+
+def create_registry(
+    paths: Dict[str, str], post_load: Optional[Callable[[str, Any, ModelRegistry], Any]] = None
+) -> ModelRegistry:
+    """Build the registry and load the pipelines according to HMEQ_MODEL_LOADING."""
+    registry = ModelRegistry(paths, post_load=post_load)
+    if MODEL_LOADING == "parallel":
+        registry.load_all(parallel=True)
+    elif MODEL_LOADING == "sequential":
+        registry.load_all(parallel=False)
+    elif MODEL_LOADING != "lazy":
+        raise ValueError(
+            f"HMEQ_MODEL_LOADING must be 'parallel', 'lazy' or 'sequential', got {MODEL_LOADING!r}"
+        )
+    return registry
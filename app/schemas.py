@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Literal, List, Tuple
+from typing import Literal, List, Optional, Tuple
 
 class LoanApplicationRequest(BaseModel):
     LOAN: float = Field(description="The loan amount")
@@ -17,4 +17,11 @@ class LoanApplicationRequest(BaseModel):
 
 class AgentAdviceRequest(BaseModel):
     default_probability: float = Field(description="Probability of default", ge=0.0, le=1.0)
-    lime_explanations: List[Tuple[str, float]] = Field(description="LIME explanations as a list of (feature_condition, weight) tuples")
\ No newline at end of file
+    lime_explanations: List[Tuple[str, float]] = Field(description="LIME explanations as a list of (feature_condition, weight) tuples")
+
+class ExplainBatchRequest(BaseModel):
+    instance_indices: Optional[List[int]] = Field(default=None, description="Indices of X_test instances to explain")
+    start: Optional[int] = Field(default=None, description="First X_test index of a range to explain (inclusive)")
+    stop: Optional[int] = Field(default=None, description="End of the X_test range to explain (exclusive)")
+    applications: Optional[List[LoanApplicationRequest]] = Field(default=None, description="Custom loan applications to explain")
+    random_state: Optional[int] = Field(default=None, description="Seed for LIME's perturbation sampling")
@@ -0,0 +1,282 @@
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import loguniform, randint, uniform
+from sklearn.base import clone
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import ParameterSampler, StratifiedKFold
+
+from app.cache import artifact_hash, make_key
+from app.fast_preprocess import PATH_DATA_CLEANED
+
+
+PATH_SEARCH = "/home/oreo/hmeq/app/assets/search"
+# Bumped when the way folds are built changes, so older fold caches are not reused
+FOLDS_VERSION = 2
+
+# Distributions sampled around the production hyperparameters (see ml_models.build_estimator)
+SEARCH_SPACES: Dict[str, Dict[str, Any]] = {
+    "dt": {
+        "max_depth": randint(3, 21),
+        "min_samples_split": randint(2, 61),
+        "min_samples_leaf": randint(1, 31),
+        "criterion": ["gini", "entropy"],
+        "max_features": ["sqrt", None],
+    },
+    "rf": {
+        "n_estimators": [50, 100, 200, 400],
+        "max_depth": [None, 8, 12, 16],
+        "max_features": ["sqrt", "log2"],
+        "criterion": ["gini", "entropy"],
+        "min_samples_leaf": randint(1, 11),
+    },
+    "gb": {
+        "n_estimators": [100, 200, 400, 600],
+        "max_depth": randint(2, 9),
+        "learning_rate": loguniform(0.01, 0.3),
+        "subsample": uniform(0.3, 0.7),
+    },
+    "knn": {
+        "n_neighbors": randint(1, 31),
+        "p": [1, 2],
+        "weights": ["uniform", "distance"],
+        "algorithm": ["ball_tree", "kd_tree", "brute"],
+    },
+}
+
+
+# --- CV folds (materialized once, memory-mapped by the workers) ---
+def oversample(X: np.ndarray, y: np.ndarray, rng: np.random.RandomState) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Random oversampling: draw extra rows of the minority classes (with replacement) until every class
+    has as many rows as the majority one. Applied to the training rows of a fold only.
+    """
+    classes, counts = np.unique(y, return_counts=True)
+    extra = [
+        rng.choice(np.flatnonzero(y == label), size=counts.max() - count, replace=True)
+        for label, count in zip(classes, counts)
+    ]
+    index = np.concatenate([np.arange(len(y)), *extra])
+    return X[index], y[index]
+
+
+def prepare_folds(n_splits: int = 5, random_state: int = 13, cache_dir: str = PATH_SEARCH) -> List[str]:
+    """
+    Split the cleaned training set (before resampling) into stratified folds and store each fold's
+    arrays as .npy, keyed by the data hash and split settings. The preprocessing is fitted on the training
+    rows of each fold, which are then oversampled; the validation rows are only transformed, so no
+    resampled copy of a validation row ends up in the training rows. Existing folds are reused, so the
+    per-fold data is prepared once for all candidates (and all later searches on the same data).
+    Training rows are shuffled, so a prefix of them is a random subsample (successive halving).
+
+    Needs the labels of the cleaned training set, `y_train.csv` next to its `X_train.csv`.
+
+    Returns:
+        One directory per fold, with X_train.npy, y_train.npy, X_val.npy and y_val.npy.
+    """
+    from app.ml_models import preprocessing_pipeline
+
+    X_path = os.path.join(PATH_DATA_CLEANED, "X_train.csv")
+    y_path = os.path.join(PATH_DATA_CLEANED, "y_train.csv")
+    if not os.path.exists(y_path):
+        raise FileNotFoundError(
+            f"{y_path} not found: cross-validation needs the labels of the training set before resampling"
+        )
+    data_hash = make_key(FOLDS_VERSION, artifact_hash(X_path), artifact_hash(y_path))[:12]
+    fold_root = os.path.join(cache_dir, f"folds_{data_hash}_{n_splits}_{random_state}")
+    fold_dirs = [os.path.join(fold_root, f"fold_{k}") for k in range(n_splits)]
+    if all(os.path.exists(os.path.join(fold_dir, "y_val.npy")) for fold_dir in fold_dirs):
+        return fold_dirs
+
+    X = pd.read_csv(X_path)
+    y = pd.read_csv(y_path).values.ravel()
+    rng = np.random.RandomState(random_state)
+    splitter = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for fold_dir, (train_index, val_index) in zip(fold_dirs, splitter.split(X, y)):
+        os.makedirs(fold_dir, exist_ok=True)
+        preprocessing = clone(preprocessing_pipeline).set_output(transform="default")
+        X_train = np.asarray(preprocessing.fit_transform(X.iloc[train_index]), dtype=np.float64)
+        X_val = np.asarray(preprocessing.transform(X.iloc[val_index]), dtype=np.float64)
+        X_train, y_train = oversample(X_train, y[train_index], rng)
+        shuffle = rng.permutation(len(y_train))
+        np.save(os.path.join(fold_dir, "X_train.npy"), X_train[shuffle])
+        np.save(os.path.join(fold_dir, "y_train.npy"), y_train[shuffle])
+        np.save(os.path.join(fold_dir, "X_val.npy"), X_val)
+        # Written last: its presence marks the fold as complete
+        np.save(os.path.join(fold_dir, "y_val.npy"), y[val_index])
+    return fold_dirs
+
+
+def _load_fold(fold_dir: str) -> Tuple[np.ndarray, ...]:
+    return tuple(
+        np.load(os.path.join(fold_dir, f"{part}.npy"), mmap_mode="r")
+        for part in ("X_train", "y_train", "X_val", "y_val")
+    )
+
+
+def _predict_latency_ms(model, X_val: np.ndarray, n_rows: int = 50) -> float:
+    """Median single-row predict_proba latency, the serving path of /predict."""
+    timings = []
+    for row in X_val[:n_rows]:
+        started = time.perf_counter()
+        model.predict_proba(row.reshape(1, -1))
+        timings.append(time.perf_counter() - started)
+    return 1000 * float(np.median(timings))
+
+
+def evaluate_candidate(
+    model_name: str, params: Dict[str, Any], fold_dir: str, train_fraction: float = 1.0
+) -> Dict[str, Any]:
+    """
+    Worker: fit one candidate on (a prefix of) one fold's training rows and score it on the fold.
+    """
+    from app.ml_models import build_estimator
+
+    X_train, y_train, X_val, y_val = _load_fold(fold_dir)
+    n_train = max(1, int(round(train_fraction * len(y_train))))
+    model = build_estimator(model_name).set_params(**params)
+
+    started = time.perf_counter()
+    model.fit(X_train[:n_train], y_train[:n_train])
+    fit_seconds = time.perf_counter() - started
+    return {
+        "roc_auc": float(roc_auc_score(y_val, model.predict_proba(X_val)[:, 1])),
+        "fit_seconds": fit_seconds,
+        "predict_latency_ms": _predict_latency_ms(model, X_val),
+    }
+
+
+def _evaluate_round(
+    pool: ProcessPoolExecutor,
+    model_name: str,
+    candidates: List[Dict[str, Any]],
+    fold_dirs: List[str],
+    train_fraction: float,
+) -> List[Dict[str, Any]]:
+    """Cross-validate every candidate (all candidate x fold fits in parallel) and aggregate per candidate."""
+    futures = [
+        [pool.submit(evaluate_candidate, model_name, params, fold_dir, train_fraction) for fold_dir in fold_dirs]
+        for params in candidates
+    ]
+    results = []
+    for params, candidate_futures in zip(candidates, futures):
+        fold_results = [future.result() for future in candidate_futures]
+        scores = [result["roc_auc"] for result in fold_results]
+        results.append({
+            "params": params,
+            "train_fraction": train_fraction,
+            "mean_roc_auc": float(np.mean(scores)),
+            "std_roc_auc": float(np.std(scores)),
+            "mean_fit_seconds": float(np.mean([result["fit_seconds"] for result in fold_results])),
+            "predict_latency_ms": float(np.median([result["predict_latency_ms"] for result in fold_results])),
+        })
+    return results
+
+
+def pareto_frontier(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Candidates that no other candidate beats on both ROC AUC (higher) and predict latency (lower)."""
+    frontier = []
+    for result in sorted(results, key=lambda r: (r["predict_latency_ms"], -r["mean_roc_auc"])):
+        if not frontier or result["mean_roc_auc"] > frontier[-1]["mean_roc_auc"]:
+            frontier.append(result)
+    return frontier
+
+
+def search(
+    model_name: str,
+    n_candidates: int = 20,
+    strategy: str = "halving",
+    factor: int = 3,
+    min_train_fraction: float = 0.1,
+    n_splits: int = 5,
+    workers: Optional[int] = None,
+    random_state: int = 13,
+    cache_dir: str = PATH_SEARCH,
+) -> Dict[str, Any]:
+    """
+    Randomized search for one model type. With strategy="halving", every round trains the remaining
+    candidates on `factor` times more rows and keeps the best 1/`factor` of them (successive halving);
+    with strategy="random", all candidates are cross-validated on the full folds.
+
+    Returns:
+        {"model", "strategy", "results" (final round, best first), "frontier", "history" (all rounds)}
+    """
+    candidates = [
+        {key: value.item() if isinstance(value, np.generic) else value for key, value in params.items()}
+        for params in ParameterSampler(SEARCH_SPACES[model_name], n_iter=n_candidates, random_state=random_state)
+    ]
+    fold_dirs = prepare_folds(n_splits=n_splits, random_state=random_state, cache_dir=cache_dir)
+
+    if strategy == "halving":
+        # Stop while `factor` candidates are left, so the final round still has a frontier to report
+        n_rounds = max(1, int(math.floor(math.log(max(1, len(candidates) / factor), factor))) + 1)
+        fractions = [max(min_train_fraction, factor ** (r - n_rounds + 1)) for r in range(n_rounds)]
+    elif strategy == "random":
+        fractions = [1.0]
+    else:
+        raise ValueError(f"strategy must be 'halving' or 'random', got {strategy!r}")
+
+    history = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for round_index, fraction in enumerate(fractions):
+            results = _evaluate_round(pool, model_name, candidates, fold_dirs, fraction)
+            results.sort(key=lambda r: -r["mean_roc_auc"])
+            history.append(results)
+            print(
+                f"{model_name}: round {round_index}, {len(candidates)} candidates on {fraction:.0%} of the rows, "
+                f"best ROC AUC {results[0]['mean_roc_auc']:.4f}"
+            )
+            if round_index < len(fractions) - 1:
+                candidates = [r["params"] for r in results[: max(1, math.ceil(len(results) / factor))]]
+
+    return {
+        "model": model_name,
+        "strategy": strategy,
+        "results": history[-1],
+        "frontier": pareto_frontier(history[-1]),
+        "history": history,
+    }
+
+
+if __name__ == "__main__":
+    """
+    Hyperparameter search, e.g. `python -m app.search --models gb knn --n-candidates 30`.
+    """
+    parser = argparse.ArgumentParser(description="Hyperparameter search with parallel cross-validation.")
+    parser.add_argument("--models", nargs="+", default=list(SEARCH_SPACES), choices=list(SEARCH_SPACES))
+    parser.add_argument("--strategy", choices=["halving", "random"], default="halving")
+    parser.add_argument("--n-candidates", type=int, default=20)
+    parser.add_argument("--factor", type=int, default=3)
+    parser.add_argument("--n-splits", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--random-state", type=int, default=13)
+    parser.add_argument("--output-dir", default=PATH_SEARCH)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in args.models:
+        report = search(
+            name,
+            n_candidates=args.n_candidates,
+            strategy=args.strategy,
+            factor=args.factor,
+            n_splits=args.n_splits,
+            workers=args.workers,
+            random_state=args.random_state,
+            cache_dir=args.output_dir,
+        )
+        with open(os.path.join(args.output_dir, f"search_{name}.json"), "w") as f:
+            json.dump(report, f, indent=2, default=repr)
+        print(f"{name}: latency/accuracy frontier")
+        for result in report["frontier"]:
+            print(
+                f"  ROC AUC {result['mean_roc_auc']:.4f} +/- {result['std_roc_auc']:.4f}, "
+                f"{result['predict_latency_ms']:.2f} ms/row, {result['params']}"
+            )
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import joblib
+import pandas as pd
+from sklearn.base import clone
+from sklearn.pipeline import Pipeline
+
+from app.cache import artifact_hash
+from app.registry import PATH_PIPELINES
+
+
+DATA_PATH_CLEANED = "/home/oreo/hmeq/app/assets/data/cleaned"
+DATA_PATH_RESAMPLED = "/home/oreo/hmeq/app/assets/data/processed"
+PATH_CHECKPOINTS = os.path.join(PATH_PIPELINES, "checkpoints")
+
+
+def _read_json(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Any):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def fit_preprocessing(checkpoint_dir: str = PATH_CHECKPOINTS, force: bool = False) -> Pipeline:
+    """
+    Fit the shared preprocessing pipeline on the cleaned X_train once and checkpoint it.
+    Reused as long as X_train.csv is unchanged.
+    """
+    from app.ml_models import preprocessing_pipeline
+
+    data_path = os.path.join(DATA_PATH_CLEANED, "X_train.csv")
+    data_hash = artifact_hash(data_path)
+    checkpoint_path = os.path.join(checkpoint_dir, "preprocessing.joblib")
+    meta_path = os.path.join(checkpoint_dir, "preprocessing.json")
+
+    meta = _read_json(meta_path)
+    if not force and meta is not None and meta.get("data_hash") == data_hash and os.path.exists(checkpoint_path):
+        print("Reusing fitted preprocessing pipeline")
+        return joblib.load(checkpoint_path)
+
+    print("Fitting preprocessing pipeline")
+    started = time.perf_counter()
+    fitted = clone(preprocessing_pipeline).set_output(transform="pandas")
+    fitted.fit(pd.read_csv(data_path))
+    fit_seconds = time.perf_counter() - started
+    joblib.dump(fitted, checkpoint_path)
+    _write_json(meta_path, {"data_hash": data_hash, "fit_seconds": fit_seconds})
+    return fitted
+
+
+def _fit_model(name: str, n_jobs: Optional[int], checkpoint_dir: str, data_hash: str) -> Dict[str, Any]:
+    """
+    Worker: fit one model on the resampled training data and checkpoint it.
+    Runs in a fresh process (max_tasks_per_child=1), so the peak RSS is this model's.
+    """
+    from app.datastore import load_processed
+    from app.ml_models import build_estimator
+
+    X_train_resampled = load_processed("X_train")
+    y_train_resampled = pd.read_csv(os.path.join(DATA_PATH_RESAMPLED, "y_train.csv"))
+
+    model = build_estimator(name, n_jobs=n_jobs)
+    baseline_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    started = time.perf_counter()
+    model.fit(X_train_resampled, y_train_resampled.values.ravel())
+    fit_seconds = time.perf_counter() - started
+    if "n_jobs" in model.get_params():
+        # Fit on many cores, but serve single rows without the joblib dispatch overhead
+        model.set_params(n_jobs=None)
+
+    checkpoint_path = os.path.join(checkpoint_dir, f"model_{name}.joblib")
+    joblib.dump(model, checkpoint_path)
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    metrics = {
+        "model": name,
+        "fit_seconds": fit_seconds,
+        "n_jobs": n_jobs,
+        "max_rss_mb": max_rss_mb,
+        "fit_rss_increase_mb": max_rss_mb - baseline_rss_mb,
+        "checkpoint_bytes": os.path.getsize(checkpoint_path),
+        "data_hash": data_hash,
+        "params": {key: repr(value) for key, value in model.get_params().items()},
+    }
+    _write_json(os.path.join(checkpoint_dir, f"model_{name}.json"), metrics)
+    return metrics
+
+
+def _checkpoint_is_current(name: str, checkpoint_dir: str, data_hash: str) -> bool:
+    """A model checkpoint is reused if it was fitted on the same data with the current hyperparameters."""
+    from app.ml_models import build_estimator
+
+    meta = _read_json(os.path.join(checkpoint_dir, f"model_{name}.json"))
+    if meta is None or not os.path.exists(os.path.join(checkpoint_dir, f"model_{name}.joblib")):
+        return False
+    params = build_estimator(name).get_params()
+    params.pop("n_jobs", None)
+    stored_params = {key: value for key, value in meta["params"].items() if key != "n_jobs"}
+    return meta["data_hash"] == data_hash and stored_params == {key: repr(value) for key, value in params.items()}
+
+
+def train(
+    models: List[str],
+    workers: Optional[int] = None,
+    checkpoint_dir: str = PATH_CHECKPOINTS,
+    output_dir: str = PATH_PIPELINES,
+    force: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fit the models concurrently (one process each), resuming from the checkpoints of models
+    that already finished, then assemble and dump the full pipelines.
+
+    Returns:
+        The training metrics per model (fit time, peak memory, checkpoint size).
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    preprocessing_pipeline = fit_preprocessing(checkpoint_dir, force=force)
+
+    data_hash = artifact_hash(os.path.join(DATA_PATH_RESAMPLED, "X_train.csv"))
+    pending = [
+        name for name in models
+        if force or not _checkpoint_is_current(name, checkpoint_dir, data_hash)
+    ]
+    for name in models:
+        if name not in pending:
+            print(f"Reusing checkpoint for {name}")
+
+    n_cpus = os.cpu_count() or 1
+    workers = workers or min(len(pending), n_cpus) or 1
+    # The forest is the only model that fits in parallel: give it the cores the other fits leave free
+    forest_jobs = max(1, n_cpus - (workers - 1))
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        futures = {
+            pool.submit(_fit_model, name, forest_jobs if name == "rf" else None, checkpoint_dir, data_hash): name
+            for name in pending
+        }
+        for future in as_completed(futures):
+            metrics = future.result()
+            print(
+                f"Fitted {metrics['model']} in {metrics['fit_seconds']:.1f}s "
+                f"(peak RSS {metrics['max_rss_mb']:.0f} MB, +{metrics['fit_rss_increase_mb']:.0f} MB while fitting)"
+            )
+
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Dumping pipelines to {output_dir}")
+    all_metrics = {}
+    for name in models:
+        model = joblib.load(os.path.join(checkpoint_dir, f"model_{name}.joblib"))
+        pipeline = Pipeline(steps=[
+            ('preprocessor', preprocessing_pipeline),
+            ('model', model)
+        ])
+        joblib.dump(pipeline, os.path.join(output_dir, f"full_pipeline_{name}.joblib"))
+        all_metrics[name] = _read_json(os.path.join(checkpoint_dir, f"model_{name}.json"))
+    _write_json(os.path.join(checkpoint_dir, "training_metrics.json"), all_metrics)
+    print("Pipelines dumped")
+    return all_metrics
+
+
+def main():
+    from app.ml_models import MODEL_NAMES
+
+    parser = argparse.ArgumentParser(description="Fit the model pipelines and dump them to the assets folder.")
+    parser.add_argument("--models", nargs="+", default=MODEL_NAMES, choices=MODEL_NAMES)
+    parser.add_argument("--workers", type=int, default=None, help="Models fitted at the same time")
+    parser.add_argument("--checkpoint-dir", default=PATH_CHECKPOINTS)
+    parser.add_argument("--output-dir", default=PATH_PIPELINES)
+    parser.add_argument("--force", action="store_true", help="Refit even if a checkpoint is current")
+    args = parser.parse_args()
+
+    train(
+        args.models,
+        workers=args.workers,
+        checkpoint_dir=args.checkpoint_dir,
+        output_dir=args.output_dir,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+import copy
+import os
+import time
+from typing import Any, List, Optional
+
+import joblib
+import numpy as np
+from scipy.special import expit
+from sklearn.base import BaseEstimator
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from sklearn.tree import DecisionTreeClassifier
+
+from app.cache import artifact_hash
+from app.fast_preprocess import CompiledPipeline
+
+
+# --- Configuration (env vars) ---
+# Pipelines whose tree model is served by the flattened engine (comma-separated, "" disables it)
+TREE_ENGINE_PIPELINES = [
+    name for name in os.getenv("HMEQ_TREE_ENGINE", "rf,gb,dt").split(",") if name.strip()
+]
+# Maximum allowed deviation from sklearn's probabilities (summation order differs across trees)
+TREE_ENGINE_ATOL = float(os.getenv("HMEQ_TREE_ENGINE_ATOL", "1e-9"))
+# Largest batch served by the flattened engine (larger ones go to sklearn); "auto" measures the crossover on load
+TREE_ENGINE_MAX_ROWS = os.getenv("HMEQ_TREE_ENGINE_MAX_ROWS", "auto")
+# Upper bound on rows x trees evaluated per block, to cap the memory of the node index arrays
+TREE_ENGINE_BLOCK_SIZE = 1 << 20
+
+
+class FlatTreeEnsemble(BaseEstimator):
+    """
+    Serving version of a fitted DecisionTreeClassifier, random forest or (binary) GradientBoostingClassifier.
+    The trees are flattened into contiguous node arrays and walked together, one level per step, for every
+    (row, tree) pair at once, instead of sklearn's Python loop over the estimators (and its joblib dispatch).
+    Blocks of more than `max_rows` rows are left to the estimator itself, whose compiled traversal wins
+    once the per-call overhead is amortized.
+    """
+
+    def __init__(self, estimator, max_rows: Optional[int] = None):
+        self.estimator = estimator
+        self.max_rows = max_rows
+
+    @classmethod
+    def from_estimator(cls, estimator, max_rows: Optional[int] = None) -> "FlatTreeEnsemble":
+        return cls(estimator, max_rows=max_rows)._flatten()
+
+    def fit(self, X, y, **fit_params) -> "FlatTreeEnsemble":
+        self.estimator.fit(X, y, **fit_params)
+        return self._flatten()
+
+    def __sklearn_is_fitted__(self) -> bool:
+        return hasattr(self, "roots_")
+
+    def _flatten(self) -> "FlatTreeEnsemble":
+        model = self.estimator
+        if isinstance(model, DecisionTreeClassifier):
+            kind, trees, scale = "proba", [model], 1.0
+        elif isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+            kind, trees, scale = "proba", list(model.estimators_), 1.0
+        elif isinstance(model, GradientBoostingClassifier):
+            if model.estimators_.shape[1] != 1 or model.loss != "log_loss":
+                raise NotImplementedError("Only binary GradientBoostingClassifier(loss='log_loss') is supported")
+            kind, trees, scale = "boosting", list(model.estimators_[:, 0]), model.learning_rate
+        else:
+            raise NotImplementedError(f"Model {type(model).__name__} is not supported")
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise NotImplementedError("Multi-output trees are not supported")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            tree = tree.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            # Leaves point to themselves
+            lefts.append(offset + np.where(is_leaf, node_ids, tree.children_left))
+            rights.append(offset + np.where(is_leaf, node_ids, tree.children_right))
+            if kind == "proba":
+                # DecisionTreeClassifier.predict_proba: node values normalized per node
+                value = tree.value[:, 0, :]
+                normalizer = value.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                values.append(value / normalizer)
+            else:
+                values.append(scale * tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+
+        # "proba": mean of the per-tree class probabilities, "boosting": expit(init + sum of scaled leaf values)
+        self.kind_ = kind
+        self.feature_ = np.concatenate(features).astype(np.intp)
+        self.threshold_ = np.concatenate(thresholds)
+        # (2, n_nodes): left and right child of every node
+        self.children_ = np.ascontiguousarray([np.concatenate(lefts), np.concatenate(rights)], dtype=np.intp)
+        self.is_leaf_ = self.children_[0] == np.arange(offset)
+        self.leaf_value_ = np.ascontiguousarray(np.concatenate(values))
+        self.roots_ = np.asarray(roots, dtype=np.intp)
+        self.init_raw_ = 0.0
+        if kind == "boosting":
+            # Constant for the supported (prior / zero) initial estimators
+            self.init_raw_ = float(
+                model._raw_predict_init(np.zeros((1, model.n_features_in_), dtype=np.float32))[0, 0]
+            )
+        self.classes_ = model.classes_
+        self.n_features_in_ = model.n_features_in_
+        return self
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node of every (row, tree) pair, shape (n_rows, n_trees). Only pairs not at a leaf yet are stepped."""
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots_)
+        X_flat = X.ravel()
+        nodes = np.tile(self.roots_, n_rows)
+        row_offsets = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        active = np.flatnonzero(~self.is_leaf_[nodes])
+        while len(active):
+            active_nodes = nodes[active]
+            go_right = X_flat[row_offsets[active] + self.feature_[active_nodes]] > self.threshold_[active_nodes]
+            active_nodes = self.children_[go_right.view(np.int8), active_nodes]
+            nodes[active] = active_nodes
+            active = active[~self.is_leaf_[active_nodes]]
+        return nodes.reshape(n_rows, n_trees)
+
+    def _flat_predict_proba(self, X: np.ndarray) -> np.ndarray:
+        leaf_values = self.leaf_value_[self._leaves(X)]
+        if self.kind_ == "proba":
+            return leaf_values.sum(axis=1) / len(self.roots_)
+        proba = expit(self.init_raw_ + leaf_values.sum(axis=1))
+        return np.column_stack([1.0 - proba, proba])
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Class probabilities, as the estimator's predict_proba (to within float summation order).
+
+        Args:
+            X: array-like of shape (n_samples, n_features)
+                Preprocessed features. Cast to float32 like sklearn's trees do before comparing to the thresholds.
+        Returns:
+            np.ndarray of shape (n_samples, n_classes)
+        """
+        if self.max_rows is not None and len(X) > self.max_rows:
+            return self.estimator.predict_proba(X)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input of shape (n_samples, {self.n_features_in_}), got {X.shape}")
+        if np.isnan(X).any():
+            raise ValueError("Input contains NaN")
+        if len(X) == 0:
+            return np.empty((0, len(self.classes_)))
+
+        block_rows = max(1, TREE_ENGINE_BLOCK_SIZE // len(self.roots_))
+        return np.concatenate(
+            [self._flat_predict_proba(X[start : start + block_rows]) for start in range(0, len(X), block_rows)]
+        )
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def validate(self, X) -> float:
+        """
+        Compare the flattened evaluation against the estimator's predict_proba on `X`.
+
+        Returns:
+            The maximum absolute difference (0.0 when bit-for-bit identical).
+        """
+        expected = self.estimator.predict_proba(X)
+        actual = self._flat_predict_proba(np.ascontiguousarray(X, dtype=np.float32))
+        if actual.shape != expected.shape:
+            raise ValueError(f"Shape mismatch: {actual.shape} != {expected.shape}")
+        return float(np.max(np.abs(actual - expected), initial=0.0))
+
+    def calibrate(self, X: np.ndarray, max_rows: int = 4096) -> int:
+        """
+        Set `max_rows` to the largest batch size (doubling from 1) for which the flattened evaluation
+        is faster than the estimator on rows of `X`.
+
+        Returns:
+            The new `max_rows` (0 if the estimator is faster even for single rows).
+        """
+        self.max_rows = 0
+        n_rows = 1
+        while n_rows <= min(max_rows, len(X)):
+            block = np.ascontiguousarray(X[:n_rows], dtype=np.float32)
+            if _best_seconds(self._flat_predict_proba, block) >= _best_seconds(self.estimator.predict_proba, block):
+                break
+            self.max_rows = n_rows
+            n_rows *= 2
+        return self.max_rows
+
+
+def _best_seconds(fn, X: np.ndarray, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def with_model(pipeline, model) -> Any:
+    """The same (sklearn or compiled) pipeline with its final "model" step replaced by `model`."""
+    if isinstance(pipeline, CompiledPipeline):
+        return CompiledPipeline(with_model(pipeline.pipeline, model), pipeline.preprocessor)
+    return Pipeline(steps=[*pipeline.steps[:-1], ("model", model)])
+
+
+def flatten_pipeline(
+    name: str, pipeline, X_validation: np.ndarray, atol: float = TREE_ENGINE_ATOL
+) -> Optional[FlatTreeEnsemble]:
+    """
+    Flatten the pipeline's tree model if it is supported and matches sklearn on `X_validation` within `atol`,
+    then set the batch size up to which it is used (HMEQ_TREE_ENGINE_MAX_ROWS, calibrated if "auto").
+
+    Returns:
+        The validated FlatTreeEnsemble, or None (the sklearn model is kept).
+    """
+    try:
+        flat_model = FlatTreeEnsemble.from_estimator(pipeline.named_steps["model"])
+        max_diff = flat_model.validate(X_validation)
+    except (NotImplementedError, ValueError, AttributeError) as e:
+        print(f"WARNING:  Could not flatten the trees of {name}, using sklearn: {e}")
+        return None
+    if max_diff > atol:
+        print(
+            f"WARNING:  Flattened trees for {name} deviate from sklearn "
+            f"(max abs diff {max_diff:.3g} > {atol}), using sklearn."
+        )
+        return None
+    if TREE_ENGINE_MAX_ROWS == "auto":
+        flat_model.calibrate(X_validation)
+    else:
+        flat_model.max_rows = int(TREE_ENGINE_MAX_ROWS)
+    print(
+        f"INFO:     Flattened trees for {name} validated (max abs diff {max_diff:.3g}), "
+        f"used for batches of up to {flat_model.max_rows} rows."
+    )
+    return flat_model
+
+
+def export_path(name: str, pipeline_path: str) -> str:
+    """Where the flattened model of a pipeline is exported: next to the pipeline artifact."""
+    return os.path.join(os.path.dirname(pipeline_path), f"tree_engine_{name}.joblib")
+
+
+def export_flat_model(name: str, flat_model: FlatTreeEnsemble, max_diff: float, pipeline_path: str) -> str:
+    """
+    Dump a validated (and calibrated) flattened model for `load_exported`, keyed by the SHA-256 of the
+    pipeline artifact it was flattened from. The estimator is left out: the loaded pipeline provides it.
+    Uncompressed, so the node arrays are memory-mapped on load.
+
+    Returns:
+        The path of the export.
+    """
+    exported_model = copy.copy(flat_model)
+    exported_model.estimator = None
+    path = export_path(name, pipeline_path)
+    joblib.dump(
+        {"artifact_hash": artifact_hash(pipeline_path), "max_diff": max_diff, "model": exported_model}, path
+    )
+    return path
+
+
+def load_exported(name: str, pipeline, pipeline_path: str, pipeline_hash: str) -> Optional[FlatTreeEnsemble]:
+    """
+    The flattened model exported by `python -m app.tree_engine` for this pipeline, if it was flattened from
+    the artifact the pipeline was loaded from (`pipeline_path`, with SHA-256 `pipeline_hash`) and validated
+    within HMEQ_TREE_ENGINE_ATOL. Skips flattening, validation and the crossover measurement
+    (the exported `max_rows` is kept unless HMEQ_TREE_ENGINE_MAX_ROWS is set).
+
+    Returns:
+        The FlatTreeEnsemble, or None (no usable export).
+    """
+    path = export_path(name, pipeline_path)
+    if not os.path.exists(path):
+        return None
+    export = joblib.load(path, mmap_mode="r")
+    if export["artifact_hash"] != pipeline_hash:
+        print(f"WARNING:  {path} was exported from another {name} pipeline, flattening on load.")
+        return None
+    if export["max_diff"] > TREE_ENGINE_ATOL:
+        return None
+    flat_model = export["model"]
+    flat_model.estimator = pipeline.named_steps["model"]
+    if TREE_ENGINE_MAX_ROWS != "auto":
+        flat_model.max_rows = int(TREE_ENGINE_MAX_ROWS)
+    print(
+        f"INFO:     Flattened trees for {name} loaded from {path} (max abs diff {export['max_diff']:.3g}), "
+        f"used for batches of up to {flat_model.max_rows} rows."
+    )
+    return flat_model
+
+
+def flatten_on_load(name: str, pipeline, registry=None) -> Any:
+    """
+    ModelRegistry post_load hook: serve the tree model of the pipelines listed in HMEQ_TREE_ENGINE
+    with the flattened engine, loaded from its export if it matches the registry's artifact (see
+    `load_exported`), else flattened and validated on the processed X_test. Other pipelines are returned unchanged.
+    """
+    if name not in TREE_ENGINE_PIPELINES:
+        return pipeline
+    if registry is not None:
+        flat_model = load_exported(name, pipeline, registry.paths[name], registry.artifact_hash(name))
+        if flat_model is not None:
+            return with_model(pipeline, flat_model)
+    from app.datastore import load_processed
+
+    try:
+        X_validation = np.asarray(load_processed("X_test"), dtype=np.float64)
+    except FileNotFoundError as e:
+        print(f"WARNING:  No validation data for the flattened trees, using sklearn: {e}")
+        return pipeline
+    flat_model = flatten_pipeline(name, pipeline, X_validation)
+    if flat_model is None:
+        return pipeline
+    return with_model(pipeline, flat_model)
+
+
+def _median_latency_ms(predict_proba, X: np.ndarray, n_rows: int = 200) -> float:
+    timings = []
+    for row in X[:n_rows]:
+        started = time.perf_counter()
+        predict_proba(row.reshape(1, -1))
+        timings.append(time.perf_counter() - started)
+    return 1000 * float(np.median(timings))
+
+
+if __name__ == "__main__":
+    """
+    Export the flattened tree models next to the pipelines, after validating them against sklearn and
+    measuring the crossover batch size, so serving and the LIME workers load them instead (see `load_exported`).
+    """
+    from app import tree_engine  # The exports must reference app.tree_engine's classes, not __main__'s
+    from app.datastore import load_processed
+    from app.registry import PIPELINE_PATHS
+
+    X_validation = np.asarray(load_processed("X_test"), dtype=np.float64)
+    names: List[str] = [name for name in ["rf", "gb", "dt"] if name in PIPELINE_PATHS]
+    for name in names:
+        flat_model = tree_engine.FlatTreeEnsemble.from_estimator(
+            joblib.load(PIPELINE_PATHS[name]).named_steps["model"]
+        )
+        max_diff = flat_model.validate(X_validation)
+        print(
+            f"{name}: max abs diff vs sklearn = {max_diff:.3g} on {len(X_validation)} rows, "
+            f"single row {_median_latency_ms(flat_model.estimator.predict_proba, X_validation):.2f} ms (sklearn) vs "
+            f"{_median_latency_ms(flat_model.predict_proba, X_validation):.2f} ms (flattened), "
+            f"faster up to {flat_model.calibrate(X_validation)} rows"
+        )
+        if max_diff > TREE_ENGINE_ATOL:
+            print(f"{name}: not exported, deviates by more than HMEQ_TREE_ENGINE_ATOL={TREE_ENGINE_ATOL}")
+            continue
+        print(f"{name}: exported to {tree_engine.export_flat_model(name, flat_model, max_diff, PIPELINE_PATHS[name])}")
+    print("Flattened tree models exported")
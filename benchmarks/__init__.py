@@ -0,0 +1,3 @@
+"""
+In-process latency/throughput benchmarks of the API endpoints, see `python -m benchmarks.run --help`.
+"""
@@ -0,0 +1,79 @@
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+
+# Modules whose import must stay free of heavy side effects (worker boot, tooling)
+MODULES = ["app.main", "app.ml_models", "app.executors"]
+# Run in the fresh interpreter after the imports: side effects that belong in an initializer
+SIDE_EFFECT_CHECK = """
+import sys
+from app.datastore import load_processed
+print("side_effects", load_processed.cache_info().currsize, int("openai" in sys.modules), int("langgraph" in sys.modules))
+"""
+
+
+def measure_import(modules: List[str]) -> Tuple[Dict[str, int], int, Dict[str, int]]:
+    """
+    Import `modules` in a fresh interpreter with `-X importtime`.
+
+    Returns:
+        Cumulative import time per module in microseconds, the total of the top-level imports (modules
+        imported by another one are part of its time), and the side effects observed after the import
+        ({"datasets_read", "openai_imported", "langgraph_imported"}).
+    """
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "import-time-stub")}
+    code = "".join(f"import {module}\n" for module in modules) + SIDE_EFFECT_CHECK
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env, check=True
+    )
+    cumulative: Dict[str, int] = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if cumulative_us.strip().isdigit():
+            cumulative[name.strip()] = int(cumulative_us)
+            # Nested imports are indented by two spaces per level
+            if not name[1:].startswith(" "):
+                total_us += int(cumulative_us)
+    counts = completed.stdout.split("side_effects", 1)[1].split()
+    side_effects = dict(zip(["datasets_read", "openai_imported", "langgraph_imported"], map(int, counts)))
+    return cumulative, total_us, side_effects
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Check that importing the app stays within a time budget and free of heavy side effects."
+    )
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("HMEQ_IMPORT_BUDGET_MS", "4000")),
+                        help="Allowed time to import all the modules in a fresh interpreter (best of --repeat runs)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    args = parser.parse_args(argv)
+
+    runs = [measure_import(args.modules) for _ in range(args.repeat)]
+    cumulative, total_us, side_effects = min(runs, key=lambda run: run[1])
+    total_ms = total_us / 1000
+    for name, us in sorted(cumulative.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{us / 1000:10.1f} ms  {name}")
+
+    failed = False
+    print(f"Import of {', '.join(args.modules)}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        print("OVER BUDGET")
+        failed = True
+    for effect, count in side_effects.items():
+        if count:
+            print(f"SIDE EFFECT at import: {effect} ({count})")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.scenarios import (
+    ENDPOINTS,
+    PIPELINE_NAMES,
+    SINGLE_INPUT_ENDPOINTS,
+    STUB_AGENT_OUTPUT,
+    build_request,
+    load_applications,
+)
+
+
+PATH_RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+# --- Memory ---
+def _read_vm_hwm_mb(pid: int) -> float:
+    """Peak resident set size (VmHWM) of a process, from /proc (0.0 where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _reset_peak_rss(pids: List[int]):
+    """Reset VmHWM to the current RSS (Linux: write 5 to clear_refs), so each scenario reports its own peak."""
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def _process_pids() -> Tuple[int, List[int]]:
+    """This process and its child processes (the LIME workers)."""
+    return os.getpid(), [child.pid for child in multiprocessing.active_children()]
+
+
+# --- Load generation ---
+async def run_scenario(
+    client,
+    endpoint: str,
+    pipeline_name: str,
+    concurrency: int,
+    batch_size: int,
+    n_requests: int,
+    applications: List[Dict[str, Any]],
+    n_test: int,
+) -> Dict[str, Any]:
+    """
+    Send `n_requests` requests from `concurrency` concurrent clients and measure each one end to end
+    (including reading the whole streamed body).
+    """
+    main_pid, worker_pids = _process_pids()
+    _reset_peak_rss([main_pid, *worker_pids])
+    latencies: List[float] = []
+    errors: List[str] = []
+    next_request = iter(range(n_requests))
+
+    async def client_loop():
+        for i in next_request:
+            kwargs = build_request(endpoint, pipeline_name, batch_size, i, applications, n_test)
+            started = time.perf_counter()
+            response = await client.request(**kwargs)
+            body = response.content
+            latencies.append(time.perf_counter() - started)
+            # Endpoints report failures as {"error": ...} (or NDJSON error lines) with status 200
+            if response.status_code != 200 or b'"error"' in body:
+                errors.append(f"{response.status_code}: {body[:200]!r}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    wall_seconds = time.perf_counter() - started
+
+    latencies_ms = 1000 * np.asarray(latencies)
+    _, worker_pids = _process_pids()
+    return {
+        "endpoint": endpoint,
+        "pipeline": pipeline_name,
+        "concurrency": concurrency,
+        "batch_size": batch_size,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_seconds": wall_seconds,
+        "throughput_rps": len(latencies) / wall_seconds,
+        "rows_per_second": len(latencies) * batch_size / wall_seconds,
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "peak_rss_mb": _read_vm_hwm_mb(main_pid),
+        "workers_peak_rss_mb": sum(_read_vm_hwm_mb(pid) for pid in worker_pids),
+    }
+
+
+def scenario_matrix(
+    endpoints: List[str], pipelines: List[str], concurrency: List[int], batch_sizes: List[int]
+) -> List[Tuple[str, str, int, int]]:
+    """
+    (endpoint, pipeline, concurrency, batch size) of every scenario; /predict_all and the agent have
+    neither pipeline nor batches.
+    """
+    scenarios = []
+    for endpoint in endpoints:
+        single_input = endpoint in SINGLE_INPUT_ENDPOINTS
+        for pipeline_name in pipelines if not single_input else ["-"]:
+            for level in concurrency:
+                for batch_size in batch_sizes if not single_input else [1]:
+                    scenarios.append((endpoint, pipeline_name, level, batch_size))
+    return scenarios
+
+
+async def run_benchmarks(
+    scenarios: List[Tuple[str, str, int, int]], n_requests: int, warmup: int
+) -> List[Dict[str, Any]]:
+    """Start the app in-process (lifespan included), stub the LLM, and run every scenario over ASGI."""
+    import httpx
+    from pydantic_ai.models.test import TestModel
+
+    from app.agent.lime_agent import lime_agent
+    from app.main import app
+
+    applications = load_applications()
+    results = []
+    async with app.router.lifespan_context(app):
+        from app.main import X_test_processed
+
+        n_test = len(X_test_processed)
+        transport = httpx.ASGITransport(app=app)
+        with lime_agent.override(model=TestModel(custom_output_args=STUB_AGENT_OUTPUT)):
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+                for endpoint, pipeline_name, level, batch_size in scenarios:
+                    if warmup:
+                        await run_scenario(
+                            client, endpoint, pipeline_name, 1, batch_size, warmup, applications, n_test
+                        )
+                    result = await run_scenario(
+                        client, endpoint, pipeline_name, level, batch_size, n_requests, applications, n_test
+                    )
+                    results.append(result)
+                    print(_format_result(result))
+    return results
+
+
+# --- Reporting ---
+def _scenario_key(result: Dict[str, Any]) -> Tuple[str, str, int, int]:
+    return result["endpoint"], result["pipeline"], result["concurrency"], result["batch_size"]
+
+
+def _format_result(result: Dict[str, Any]) -> str:
+    return (
+        f"{result['endpoint']:>24} {result['pipeline']:>3} c={result['concurrency']:<3} b={result['batch_size']:<5} "
+        f"{result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  "
+        f"p99 {result['p99_ms']:8.2f} ms  rss {result['peak_rss_mb']:6.0f} MB"
+        + (f"  errors {result['errors']}" if result["errors"] else "")
+    )
+
+
+def _metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "env": {key: value for key, value in os.environ.items() if key.startswith("HMEQ_")},
+    }
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold: float
+) -> List[Dict[str, Any]]:
+    """
+    Scenarios that regressed against the baseline: p95 latency more than `threshold` (relative) higher,
+    throughput more than `threshold` lower, or new errors. Scenarios missing from either run are skipped.
+
+    Returns:
+        One {"scenario", "metric", "baseline", "current", "change"} dict per regression.
+    """
+    baseline_by_key = {_scenario_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(_scenario_key(result))
+        if base is None:
+            continue
+        scenario = "/".join(str(part) for part in _scenario_key(result))
+        checks = [
+            ("p95_ms", result["p95_ms"] > base["p95_ms"] * (1 + threshold)),
+            ("throughput_rps", result["throughput_rps"] < base["throughput_rps"] * (1 - threshold)),
+            ("errors", result["errors"] > base["errors"]),
+        ]
+        for metric, regressed in checks:
+            if regressed:
+                regressions.append({
+                    "scenario": scenario,
+                    "metric": metric,
+                    "baseline": base[metric],
+                    "current": result[metric],
+                    "change": (result[metric] - base[metric]) / base[metric] if base[metric] else None,
+                })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API endpoints in-process.")
+    parser.add_argument("--endpoints", nargs="+", default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument("--pipelines", nargs="+", default=PIPELINE_NAMES)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 32],
+                        help="Rows (predict) or instances (explain) per request; above 1 uses the batch endpoints")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="Sequential requests before each scenario")
+    parser.add_argument("--output", default=os.path.join(PATH_RESULTS, "latest.json"))
+    parser.add_argument("--baseline", default=None, help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression (0.2 = 20%%)")
+    parser.add_argument("--with-cache", action="store_true",
+                        help="Keep the result and advice caches enabled (off by default, so every request is computed)")
+    args = parser.parse_args(argv)
+
+    # Read by the app modules at import time
+    if not args.with_cache:
+        os.environ["HMEQ_CACHE"] = "0"
+        os.environ["HMEQ_ADVICE_CACHE"] = "0"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark-stub")
+
+    scenarios = scenario_matrix(args.endpoints, args.pipelines, args.concurrency, args.batch_sizes)
+    print(f"Running {len(scenarios)} scenarios, {args.requests} requests each")
+    results = asyncio.run(run_benchmarks(scenarios, args.requests, args.warmup))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"metadata": _metadata(), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = any(result["errors"] for result in results)
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            change = f"{regression['change']:+.0%}" if regression["change"] is not None else "new"
+            print(
+                f"REGRESSION {regression['scenario']} {regression['metric']}: "
+                f"{regression['baseline']:.2f} -> {regression['current']:.2f} ({change})"
+            )
+        print(f"{len(regressions)} regressions against {args.baseline} (threshold {args.threshold:.0%})")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.fast_preprocess import PATH_DATA_CLEANED
+
+
+ENDPOINTS = ["predict", "predict_all", "explain_instance", "explain_custom_instance", "agent_advice"]
+# Scored once per concurrency level: no pipeline in the path, one input per request
+SINGLE_INPUT_ENDPOINTS = ["predict_all", "agent_advice"]
+PIPELINE_NAMES = ["rf", "knn", "gb", "dt"]
+
+# Canned LLM output for the stubbed agent (the benchmark never calls OpenAI)
+STUB_AGENT_OUTPUT = {
+    "lime_interpretation": "The debt-to-income ratio and the delinquent credit lines drive the risk of default.",
+    "financial_advice": "Reduce outstanding debt before applying and keep every credit line current.",
+}
+
+
+def load_applications(n_rows: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Complete (no missing values) applications from the cleaned test set, as request bodies."""
+    df = pd.read_csv(os.path.join(PATH_DATA_CLEANED, "X_test.csv")).dropna()
+    return df.head(n_rows).to_dict(orient="records") if n_rows else df.to_dict(orient="records")
+
+
+def build_request(
+    endpoint: str, pipeline_name: str, batch_size: int, i: int, applications: List[Dict[str, Any]], n_test: int
+) -> Dict[str, Any]:
+    """
+    The i-th request of a scenario, as httpx.request keyword arguments. Batch sizes above 1 go to the
+    batch variant of the endpoint (/predict_batch, /explain_batch); explanations are seeded so they are
+    computed live (not served from the explanation index or the cache) and reproducible.
+    """
+    if endpoint == "predict":
+        if batch_size == 1:
+            return {"method": "POST", "url": f"/predict/{pipeline_name}", "json": applications[i % len(applications)]}
+        rows = [applications[(i * batch_size + j) % len(applications)] for j in range(batch_size)]
+        return {"method": "POST", "url": f"/predict_batch/{pipeline_name}", "json": rows}
+
+    if endpoint == "predict_all":
+        # Every pipeline, plus the ensemble score
+        return {
+            "method": "POST",
+            "url": "/predict_all",
+            "json": applications[i % len(applications)],
+            "params": {"ensemble": True},
+        }
+
+    if endpoint == "explain_instance":
+        if batch_size == 1:
+            return {"method": "GET", "url": f"/explain/{pipeline_name}/{i % n_test}", "params": {"random_state": i}}
+        indices = [(i * batch_size + j) % n_test for j in range(batch_size)]
+        return {
+            "method": "POST",
+            "url": f"/explain_batch/{pipeline_name}",
+            "json": {"instance_indices": indices, "random_state": i},
+        }
+
+    if endpoint == "explain_custom_instance":
+        if batch_size == 1:
+            return {
+                "method": "POST",
+                "url": f"/explain_custom_instance/{pipeline_name}",
+                "json": applications[i % len(applications)],
+                "params": {"random_state": i},
+            }
+        rows = [applications[(i * batch_size + j) % len(applications)] for j in range(batch_size)]
+        return {
+            "method": "POST",
+            "url": f"/explain_batch/{pipeline_name}",
+            "json": {"applications": rows, "random_state": i},
+        }
+
+    if endpoint == "agent_advice":
+        # Distinct inputs per request, so the advice cache (if enabled) does not answer them all
+        rng = np.random.RandomState(i)
+        return {
+            "method": "POST",
+            "url": "/agent/advice",
+            "json": {
+                "default_probability": round(float(rng.uniform()), 4),
+                "lime_explanations": [
+                    ["DEBTINC > 38.94%", round(float(rng.uniform(0.1, 0.5)), 4)],
+                    ["DELINQ > 1.00", round(float(rng.uniform(0.1, 0.5)), 4)],
+                    ["CLAGE <= 115.12", round(float(rng.uniform(0.0, 0.2)), 4)],
+                    ["JOB is not Office", round(float(rng.uniform(-0.2, 0.0)), 4)],
+                ],
+            },
+        }
+
+    raise ValueError(f"Unknown endpoint {endpoint!r}, expected one of {ENDPOINTS}")